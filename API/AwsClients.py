@@ -0,0 +1,81 @@
+"""
+File: AwsClients.py
+Description: This file contains a process wide registry of boto3 clients that are shared by the
+upscale providers. Clients are created once per service and region and reused by every request.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References:
+* https://boto3.amazonaws.com/v1/documentation/api/latest/guide/clients.html#multithreading-or-multiprocessing-with-clients
+* https://botocore.amazonaws.com/v1/documentation/api/latest/reference/config.html
+
+Purpose:
+    Creating a boto3 client resolves credentials, loads the service model and opens a new TLS
+    connection. Doing that on every /store or /retrieve call adds a noticeable overhead to each
+    request. This registry builds each client once, with a tuned connection pool and TCP keep-alive,
+    and hands the same client to every caller. boto3 clients are thread safe once created, so the
+    only thing that needs a lock is the creation itself.
+"""
+import os
+import threading
+import boto3
+from botocore.config import Config
+import logging
+logging.basicConfig(level=logging.INFO)
+
+# Aliases used across the project mapped to the botocore service name
+SERVICE_ALIASES = {
+    "runtime.sagemaker": "sagemaker-runtime",
+}
+
+# Connection pool and timeouts, the SageMaker runtime gets a longer read timeout as upscaling
+# large images can take several seconds.
+MAX_POOL_CONNECTIONS = int(os.getenv('BOTO_MAX_POOL_CONNECTIONS', 50))
+CONNECT_TIMEOUT = int(os.getenv('BOTO_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = int(os.getenv('BOTO_READ_TIMEOUT', 60))
+SAGEMAKER_READ_TIMEOUT = int(os.getenv('BOTO_SAGEMAKER_READ_TIMEOUT', 70))
+MAX_ATTEMPTS = int(os.getenv('BOTO_MAX_ATTEMPTS', 3))
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+
+def _client_config(service: str) -> Config:
+    read_timeout = SAGEMAKER_READ_TIMEOUT if service == "sagemaker-runtime" else READ_TIMEOUT
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        retries={'max_attempts': MAX_ATTEMPTS, 'mode': 'standard'}
+    )
+
+def get_client(service: str, region_name: str = None):
+    """Return the shared client for the service and region, creating it on first use"""
+    service = SERVICE_ALIASES.get(service, service)
+    key = (service, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    global _session
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # the default boto3 session is not thread safe, so the registry owns its own session
+            if _session is None:
+                _session = boto3.session.Session()
+            logging.info(f"Creating {service} client for region {region_name or _session.region_name}")
+            client = _session.client(service, region_name=region_name, config=_client_config(service))
+            _clients[key] = client
+    return client
+
+def reset_clients():
+    """Drop every cached client, the next get_client call will build new ones"""
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
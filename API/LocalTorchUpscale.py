@@ -0,0 +1,144 @@
+"""
+File: LocalTorchUpscale.py
+Description: This file contains the implemented child class for the UpscaleProvider.
+This child class runs the Real-ESRGAN or Swin2SR plugin models in the API process with PyTorch,
+without a network hop to a SageMaker endpoint.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    The purpose of this file is implement a local, offline upscaler for development, CI and small images,
+    and to measure the pure inference cost of the models separately from the transport.
+    The plugin code is reused as is: the model_fn of the plugin inference.py is called once per process
+    and the loaded model is kept warm, every upscale then calls the plugin predict_fn.
+    Concurrent upscales (threaded Flask, /retrieveBatch) run one at a time per model, the plugin models keep per call
+    state; with DYNAMIC_BATCHING they go through the plugin batcher instead and share forward passes.
+    PyTorch and the plugin requirements (Plugins/<plugin>/code/requirements.txt) are not part of the API
+    requirements and have to be installed to use this provider.
+
+    Configuration (environment variables):
+    * LOCAL_ESRGAN_CODE_DIR / LOCAL_ESRGAN_MODEL_DIR - plugin code and weights of Real-ESRGAN.
+    * LOCAL_SWINIR_CODE_DIR / LOCAL_SWINIR_MODEL_DIR - plugin code and weights of Swin2SR.
+      The defaults point to the Plugins directory of this repository.
+    * LOCAL_TORCH_THREADS - intra-op threads used by PyTorch, defaults to the PyTorch default.
+    * LOCAL_TORCH_INTEROP_THREADS - inter-op threads used by PyTorch.
+    * LOCAL_WARMUP - run one small forward pass when the model is loaded, defaults to true.
+"""
+import io
+import os
+import sys
+import time
+import base64
+import threading
+import importlib.util
+from PIL import Image
+from S3CommonUpscaler import S3CommonUpscaler
+import logging
+logging.basicConfig(level=logging.INFO)
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Plugins")
+
+LOCAL_MODELS = {
+    "esrgan": {
+        "code_dir": os.getenv('LOCAL_ESRGAN_CODE_DIR', os.path.join(PLUGINS_DIR, "esrgan-sagemaker", "code")),
+        "model_dir": os.getenv('LOCAL_ESRGAN_MODEL_DIR', os.path.join(PLUGINS_DIR, "esrgan-sagemaker")),
+    },
+    "swinir": {
+        "code_dir": os.getenv('LOCAL_SWINIR_CODE_DIR', os.path.join(PLUGINS_DIR, "swinir2-sagemaker", "code")),
+        "model_dir": os.getenv('LOCAL_SWINIR_MODEL_DIR', os.path.join(PLUGINS_DIR, "swinir2-sagemaker")),
+    },
+}
+
+TORCH_THREADS = os.getenv('LOCAL_TORCH_THREADS')
+TORCH_INTEROP_THREADS = os.getenv('LOCAL_TORCH_INTEROP_THREADS')
+WARMUP = os.getenv('LOCAL_WARMUP', 'true').lower() == 'true'
+
+def warmup_image() -> str:
+    # small base64 PNG used to warm the model up once it is loaded
+    buffered = io.BytesIO()
+    Image.new("RGB", (64, 64), (128, 128, 128)).save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode('ascii')
+
+_lock = threading.Lock()
+_loaded = {}
+# one lock per model: the plugin upsamplers keep per call state (input, output, padding, buffers) on the instance
+_predict_locks = {}
+_threads_configured = False
+
+def configure_torch_threads():
+    """Apply the thread settings once, before the first model runs"""
+    global _threads_configured
+    if _threads_configured:
+        return
+    import torch
+    if TORCH_THREADS:
+        torch.set_num_threads(int(TORCH_THREADS))
+    if TORCH_INTEROP_THREADS:
+        torch.set_num_interop_threads(int(TORCH_INTEROP_THREADS))
+    _threads_configured = True
+    logging.info(f"Local torch using {torch.get_num_threads()} threads")
+
+def load_local_model(name: str):
+    """Import the plugin inference.py and call its model_fn once per process, returns (module, model)"""
+    loaded = _loaded.get(name)
+    if loaded is not None:
+        return loaded
+    with _lock:
+        loaded = _loaded.get(name)
+        if loaded is None:
+            configure_torch_threads()
+            code_dir = os.path.abspath(LOCAL_MODELS[name]["code_dir"])
+            model_dir = os.path.abspath(LOCAL_MODELS[name]["model_dir"])
+            # the plugin imports its own packages relative to its code directory
+            if code_dir not in sys.path:
+                sys.path.insert(0, code_dir)
+            spec = importlib.util.spec_from_file_location(f"local_{name}_inference", os.path.join(code_dir, "inference.py"))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            start = time.perf_counter()
+            model = module.model_fn(model_dir)
+            logging.info(f"Loaded local {name} model from {model_dir} in {time.perf_counter() - start:.2f}s")
+            if WARMUP:
+                start = time.perf_counter()
+                module.predict_fn(warmup_image(), model)
+                logging.info(f"Warmed up local {name} model in {time.perf_counter() - start:.2f}s")
+            loaded = (module, model)
+            _predict_locks[name] = threading.Lock()
+            _loaded[name] = loaded
+    return loaded
+
+def predict_local(name: str, payload: str) -> str:
+    """Call the plugin predict_fn of a loaded model, one call at a time per model.
+    With DYNAMIC_BATCHING the batcher thread is already the only user of the model, so concurrent calls are
+    not serialized and can share a forward pass."""
+    module, model = load_local_model(name)
+    # esrgan keeps its batcher in the model dict, swinir in a module global
+    if (isinstance(model, dict) and 'batcher' in model) or getattr(module, 'batcher', None) is not None:
+        return module.predict_fn(payload, model)
+    with _predict_locks[name]:
+        return module.predict_fn(payload, model)
+
+# Child class of S3CommonUpscaler
+class LocalTorchUpscaleProvider(S3CommonUpscaler):
+    def __init__(self, s3_bucket: str, model_name: str = "esrgan") -> None:
+        super().__init__(s3_bucket)
+        self.model_name = model_name
+
+    # Class Implementation
+    def cache_params(self) -> dict:
+        return {"provider": "local", "model": self.model_name}
+
+    def upscale_bytes(self, image_data: bytes) -> bytes:
+        start = time.perf_counter()
+        upscaled_image = predict_local(self.model_name, base64.b64encode(image_data).decode('ascii'))
+        logging.info(f"Local {self.model_name} inference took {time.perf_counter() - start:.3f}s")
+        # the plugins return an empty string when the inference failed
+        if not upscaled_image:
+            raise RuntimeError(f"Local {self.model_name} inference failed")
+        return base64.b64decode(upscaled_image)
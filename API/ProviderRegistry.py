@@ -0,0 +1,46 @@
+"""
+File: ProviderRegistry.py
+Description: This file contains the registry of UpscaleProvider implementations.
+The upscaleMethod of a request selects the provider that serves it.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    Any new UpscaleProvider is made available to the API by registering a factory for it here.
+    A factory takes the S3 bucket name and returns a configured provider, so different engines can
+    be selected per request and benchmarked side by side.
+"""
+from SagemakerRTUpscale import SagemakerRTUpscaleProvider
+from ResampleUpscale import ResampleUpscaleProvider
+from LocalTorchUpscale import LocalTorchUpscaleProvider
+
+DEFAULT_PROVIDER = "sageMakerRT"
+
+_providers = {}
+
+def register_provider(name: str, factory):
+    _providers[name] = factory
+
+def provider_names():
+    return sorted(_providers.keys())
+
+def get_provider(name: str, s3_bucket: str, endpoint: str = None):
+    """Create the provider registered under name, raises KeyError for unknown names"""
+    if name not in _providers:
+        raise KeyError(f"Upscale Method {name} not yet implemented")
+    provider = _providers[name](s3_bucket)
+    provider.setEndpoint(endpoint)
+    return provider
+
+register_provider("sageMakerRT", SagemakerRTUpscaleProvider)
+register_provider("bicubic", lambda s3_bucket: ResampleUpscaleProvider(s3_bucket, "bicubic"))
+register_provider("lanczos", lambda s3_bucket: ResampleUpscaleProvider(s3_bucket, "lanczos"))
+# in process PyTorch models, torch is only imported when the first request uses them
+register_provider("localEsrgan", lambda s3_bucket: LocalTorchUpscaleProvider(s3_bucket, "esrgan"))
+register_provider("localSwinir", lambda s3_bucket: LocalTorchUpscaleProvider(s3_bucket, "swinir"))
@@ -0,0 +1,49 @@
+"""
+File: ResampleUpscale.py
+Description: This file contains the implemented child class for the UpscaleProvider.
+This child class upscales images on the API CPU with a classic resampling filter (bicubic or lanczos)
+and needs no model or endpoint.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    The purpose of this file is implement a cheap baseline upscaler. It is useful to route requests
+    that do not need a generative model and to benchmark the models against a plain interpolation.
+"""
+import io
+import os
+from PIL import Image
+from S3CommonUpscaler import S3CommonUpscaler
+
+RESAMPLE_SCALE = int(os.getenv('RESAMPLE_SCALE', 4))
+
+# Child class of S3CommonUpscaler
+class ResampleUpscaleProvider(S3CommonUpscaler):
+    def __init__(self, s3_bucket: str, resample: str = "bicubic", scale: int = RESAMPLE_SCALE) -> None:
+        super().__init__(s3_bucket)
+        self.resample = resample
+        self.scale = scale
+
+    # Class Implementation
+    def cache_params(self) -> dict:
+        return {"provider": "resample", "resample": self.resample, "scale": self.scale}
+
+    def upscale_bytes(self, image_data: bytes) -> bytes:
+        filters = {
+            "bicubic": Image.BICUBIC,
+            "lanczos": Image.LANCZOS,
+        }
+        image = Image.open(io.BytesIO(image_data))
+        file_format = "PNG" if image.format == "PNG" else "JPEG"
+        if file_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        upscaled = image.resize((image.width * self.scale, image.height * self.scale), filters[self.resample])
+        buffered = io.BytesIO()
+        upscaled.save(buffered, format=file_format, quality=95)
+        return buffered.getvalue()
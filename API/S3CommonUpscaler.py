@@ -14,29 +14,129 @@ References: N/A
 Purpose:
     The purpose of this file is implement a way to upscale images. This particular class implements
     the S3 downscale method. 
+    It also implements the S3 retrieve, cache and batch flow of the upscale, child classes only need to
+    implement upscale_bytes (and cache_params when their output depends on extra parameters).
 """
 import io
 import os
 import uuid
 import json
-import boto3
+import abc
+import base64
+import concurrent.futures
 from PIL import Image
 from UpscaleInterface import UpscaleProvider
+from AwsClients import get_client
+from UpscaleCache import get_cache, make_cache_key
 import logging
 logging.basicConfig(level=logging.INFO)
 
+# Upper bound of the thread pool used by the batch methods, a request can ask for less but never more
+MAX_BATCH_WORKERS = int(os.getenv('MAX_BATCH_WORKERS', 8))
+
+def bounded_workers(max_workers, count):
+    requested = int(max_workers) if max_workers else MAX_BATCH_WORKERS
+    return max(1, min(requested, MAX_BATCH_WORKERS, count))
+
 # Child class of UpscaleProvider
 class S3CommonUpscaler(UpscaleProvider):
     def __init__(self, s3_bucket: str) -> None:
         self.s3_bucket_name = s3_bucket
         self.sqs_queue_url = os.getenv('SQS_QUEUE_URL')
         self.ddb_table = os.getenv('DDB_TABLE')
+        self.endpoint = None
 
     # Class dependant methods, mostly works with class attributes
     def setS3_key(self, s3_key:str):
         self.s3_key = s3_key
 
-    def send_and_downscale(self, base64_image: str) -> str:
+    def setEndpoint(self, endpoint:str):
+        self.endpoint = endpoint
+
+    # Upscale implementation, provided by the child classes
+    @abc.abstractmethod
+    def upscale_bytes(self, image_data: bytes) -> bytes:
+        """Upscale raw image bytes and return the raw upscaled image bytes, raises on failure"""
+        pass
+
+    def cache_params(self) -> dict:
+        """Everything besides the image bytes that changes the upscaled output"""
+        return {"provider": type(self).__name__}
+
+    def upscale_image(self, base64_string):
+        try:
+            upscaled_bytes = self.upscale_image_bytes(self.decode_base64_to_image(base64_string))
+            return self.to_jpeg_string(upscaled_bytes)
+        except Exception as e:
+            logging.info("Failed to upscale with: ")
+            logging.info(str(e))
+            return None
+
+    @staticmethod
+    def to_jpeg_string(image_data: bytes) -> str:
+        # the JSON responses always carry a base64 JPEG
+        if UpscaleProvider.image_content_type(image_data) == "image/jpeg":
+            return base64.b64encode(image_data).decode('ascii')
+        return UpscaleProvider.encode_image_to_base64(Image.open(io.BytesIO(image_data)).convert("RGB"))
+
+    def upscale_image_bytes(self, image_data: bytes) -> bytes:
+        """upscale_bytes behind the upscale result cache"""
+        cache = get_cache()
+        if cache is None:
+            return self.upscale_bytes(image_data)
+        cache_key = make_cache_key(image_data, self.endpoint, self.cache_params())
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Upscale cache hit for {cache_key}")
+            return cached
+        upscaled_image = self.upscale_bytes(image_data)
+        cache.put(cache_key, upscaled_image)
+        return upscaled_image
+
+    def retrieve_and_upscale_bytes(self, key: str) -> bytes:
+        """Same as retrieve_and_upscale but returns the raw image bytes, None on failure"""
+        s3_client = get_client('s3')
+        try:
+            s3_object = s3_client.get_object(Bucket=self.s3_bucket_name, Key=key)
+            image_data = s3_object['Body'].read()
+            return self.upscale_image_bytes(image_data)
+        except Exception as e:
+            logging.info("Unable to upscale image" + str(e))
+            return None
+
+    def retrieve_and_upscale_batch(self, keys, max_workers: int = None):
+        """Upscale many S3 keys concurrently with a bounded pool.
+        Yields (key, image bytes) as each one completes, image bytes is None when it failed."""
+        max_workers = bounded_workers(max_workers, len(keys))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.retrieve_and_upscale_bytes, key): key for key in keys}
+            for future in concurrent.futures.as_completed(futures):
+                yield futures[future], future.result()
+
+    def retrieve_and_upscale(self, key: str) -> str:
+        self.s3_key = key
+        s3_client = get_client('s3')
+        try:
+            logging.info(f"Key is: {key}, Bucket is: {self.s3_bucket_name}, Endpoint is: {self.endpoint}")
+            s3_object = s3_client.get_object(Bucket=self.s3_bucket_name, Key=key)
+            image_data = s3_object['Body'].read()
+            try:
+                # goes through the cache, the JSON response keeps returning a base64 JPEG
+                upscaled_image = self.to_jpeg_string(self.upscale_image_bytes(image_data))
+            except Exception as e:
+                logging.info("Failed to upscale with: ")
+                logging.info(str(e))
+                upscaled_image = None
+            if(upscaled_image == None):
+                return "Upscale failed"
+            return upscaled_image
+        except Exception as e:
+            logging.info("Unable to upscale image" + str(e))
+            return "Unable to upscale image"
+
+    def send_and_downscale(self, base64_image: str, s3_key: str = None) -> str:
+        # s3_key overrides the key set with setS3_key, used when one provider stores many images
+        s3_key = s3_key or self.s3_key
         try:
             image = Image.open(io.BytesIO(base64_image))
         except Exception as e:
@@ -88,10 +188,10 @@ class S3CommonUpscaler(UpscaleProvider):
         resized_image.save(resized_image_bytes, format=file_format)
 
         
-        s3_client = boto3.client('s3') 
+        s3_client = get_client('s3')
         status = ("image attempt")
         try:
-            s3_client.put_object(Body=resized_image_bytes.getvalue(), Bucket=self.s3_bucket_name, Key=self.s3_key, ContentType=content_type)
+            s3_client.put_object(Body=resized_image_bytes.getvalue(), Bucket=self.s3_bucket_name, Key=s3_key, ContentType=content_type)
             logging.info("Image uploaded to S3")
             status = ("image uploaded to S3")
         except Exception as e:
@@ -100,10 +200,22 @@ class S3CommonUpscaler(UpscaleProvider):
             return status
         return status
     
-    def send_and_downscale_video(self, key: str, min_size: int, max_size: int) -> str:
+    def send_and_downscale_batch(self, images, max_workers: int = None):
+        """Downscale and store many images concurrently.
+        images is a list of (s3_key, image bytes), yields (s3_key, status) as each one completes."""
+        max_workers = bounded_workers(max_workers, len(images))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.send_and_downscale, image_data, key): key for key, image_data in images}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    yield futures[future], f"Error uploading image to S3: {e}"
+
+    def send_and_downscale_video(self, key: str, min_size: int, max_size: int, pipeline: str = None) -> str:
         idToCreate = uuid.uuid4()
-        sqs_client = boto3.client('sqs')
-        ddb_client = boto3.client('dynamodb')
+        sqs_client = get_client('sqs')
+        ddb_client = get_client('dynamodb')
         body = {
             "id":str(idToCreate),
             "video":f"s3://{self.s3_bucket_name}/{key}",
@@ -113,6 +225,9 @@ class S3CommonUpscaler(UpscaleProvider):
             "max_workers": 1,
             "method": "downscale"
         }
+        if pipeline:
+            # "stream" or "frames", the listener falls back to its VIDEO_PIPELINE default when not set
+            body["pipeline"] = pipeline
         sqs_client.send_message(
             QueueUrl=self.sqs_queue_url,
             MessageBody=json.dumps(body)
@@ -143,10 +258,10 @@ class S3CommonUpscaler(UpscaleProvider):
 
         return str(idToCreate)
 
-    def retrieve_and_upscale_video(self, key: str, endpoint: str, max_workers: int) -> str:
+    def retrieve_and_upscale_video(self, key: str, endpoint: str, max_workers: int, pipeline: str = None, chunk_seconds: float = None, dedup_threshold: float = None, frames_per_request: int = None, model: str = None) -> str:
         idToCreate = uuid.uuid4()
-        sqs_client = boto3.client('sqs')
-        ddb_client = boto3.client('dynamodb')
+        sqs_client = get_client('sqs')
+        ddb_client = get_client('dynamodb')
         body = {
             "id":str(idToCreate),
             "video":f"s3://{self.s3_bucket_name}/{key}",
@@ -156,6 +271,20 @@ class S3CommonUpscaler(UpscaleProvider):
             "max_workers": max_workers,
             "method": "upscale"
         }
+        if pipeline:
+            body["pipeline"] = pipeline
+        if chunk_seconds:
+            # the listener splits the video in chunks of about chunk_seconds, processed by every listener pod
+            body["chunk_seconds"] = float(chunk_seconds)
+        if dedup_threshold:
+            # frames closer than this to the last upscaled frame reuse its output
+            body["dedup_threshold"] = float(dedup_threshold)
+        if frames_per_request:
+            # frames sent to the endpoint in one call, the endpoint has to accept {"images": [...]}
+            body["frames_per_request"] = int(frames_per_request)
+        if model:
+            # model variant of the endpoint, e.g. compact for the fast model of the esrgan plugin
+            body["model"] = model
         sqs_client.send_message(
             QueueUrl=self.sqs_queue_url,
             MessageBody=json.dumps(body)
@@ -185,8 +314,52 @@ class S3CommonUpscaler(UpscaleProvider):
         )
         return str(idToCreate)
     
+    def retrieve_and_upscale_image_async(self, key: str, endpoint: str) -> str:
+        # same job model as the videos, the listener upscales the image and writes the result to S3
+        idToCreate = uuid.uuid4()
+        sqs_client = get_client('sqs')
+        ddb_client = get_client('dynamodb')
+        body = {
+            "id":str(idToCreate),
+            "image":f"s3://{self.s3_bucket_name}/{key}",
+            "endpoint": endpoint,
+            "method": "upscaleImage"
+        }
+        sqs_client.send_message(
+            QueueUrl=self.sqs_queue_url,
+            MessageBody=json.dumps(body)
+        )
+        ddb_client.put_item(
+            TableName=self.ddb_table,
+            Item={
+                'id': {
+                    'S': str(idToCreate)
+                },
+                'image': {
+                    'S': f"s3://{self.s3_bucket_name}/{key}"
+                },
+                'endpoint': {
+                    'S': endpoint
+                },
+                'method': {
+                    'S': "upscaleImage"
+                },
+                'status': {
+                    'S': "Submitted"
+                }
+            }
+        )
+        return str(idToCreate)
+
+    def get_image_result(self, output: str) -> bytes:
+        # output is the s3:// uri written by the listener when the job completed
+        bucket, key = output.split('/',2)[-1].split('/',1)
+        s3_client = get_client('s3')
+        s3_object = s3_client.get_object(Bucket=bucket, Key=key)
+        return s3_object['Body'].read()
+
     def get_video_status(self, id: str) -> str:
-        ddb_client = boto3.client('dynamodb')
+        ddb_client = get_client('dynamodb')
         item = ddb_client.get_item(
             TableName=self.ddb_table,
             Key={
@@ -195,4 +368,7 @@ class S3CommonUpscaler(UpscaleProvider):
                 }
             },
         )
-        return json.dumps(item['Item'])
\ No newline at end of file
+        return json.dumps(item['Item'])
+    def get_image_status(self, id: str) -> str:
+        # image and video jobs share the same DynamoDB table
+        return self.get_video_status(id)
@@ -20,12 +20,11 @@ Purpose:
     this class as long as the model that backs the endpoint still uses base64 in the same manner. 
 """
 import io
-import os
-import boto3
 import base64
 from PIL import Image
 import json
 from S3CommonUpscaler import S3CommonUpscaler
+from AwsClients import get_client
 import logging
 logging.basicConfig(level=logging.INFO)
 # For local test with .env file with AWS user credentials 
@@ -58,10 +57,19 @@ class SagemakerRTUpscaleProvider(S3CommonUpscaler):
         img_str = base64.b64encode(buffered.getvalue()).decode('ascii')
         return img_str
     
+    @staticmethod
+    def to_image_bytes(image_data):
+        """Return the endpoint output as JPEG or PNG bytes, other formats are re-encoded as JPEG"""
+        if SagemakerRTUpscaleProvider.image_content_type(image_data) is not None:
+            return image_data
+        buffered = io.BytesIO()
+        Image.open(io.BytesIO(image_data)).convert("RGB").save(buffered, format="JPEG")
+        return buffered.getvalue()
+
     def query_endpoint_with_json_payload(self, payload, contentType, accept):
         logging.info("Starting the Sagemaker Query")
         encoded_payload = json.dumps(payload).encode('utf-8')
-        sageMakerClient = boto3.client('runtime.sagemaker')
+        sageMakerClient = get_client('runtime.sagemaker')
         response = sageMakerClient.invoke_endpoint(
             EndpointName= self.endpoint,
             ContentType= contentType,
@@ -71,63 +79,17 @@ class SagemakerRTUpscaleProvider(S3CommonUpscaler):
         return response
     
     # Class Implementation
-    def upscale_image(self, base64_string):
-        requestType = 'application/json;jpeg'
-        encoded_image = base64_string
-        payload = {
-            "image": encoded_image,
+    def cache_params(self) -> dict:
+        return {
             "prompt": "",
             "num_inference_steps":50,
             "guidance_scale":7.5
         }
-        try:
-            response = self.query_endpoint_with_json_payload( payload, requestType, requestType)
-            logging.info("Response is: ")
-            logging.info(str(response))
-            encoded_images, prompt = self.parse_response(response)
-            decoded_images = self.decode_images(encoded_images)
-            imageString = self.imageToString(decoded_images[0]) 
-            logging.info("ImageString is: ")
-            return imageString
-        except Exception as e:
-            logging.info("Failed to upscale with: ")
-            logging.info(str(e))
-            return None
-    
-    def retrieve_and_upscale(self, key: str) -> str:
-        self.s3_key = key
-        s3_client = boto3.client('s3')
-        try:
-            logging.info("Key is: ")
-            logging.info(str(key))
-            logging.info("Bucket is: ")
-            logging.info(str(self.s3_bucket_name))
-            logging.info("Endpoint is: ")
-            logging.info(str(self.endpoint))
-            s3_object = s3_client.get_object(Bucket=self.s3_bucket_name, Key=key)
-            logging.info("S3_object is: ")
-            logging.info(str(s3_object))
-            image_data = s3_object['Body'].read()
-            logging.info("Image_data is: ")
-            logging.info(str(image_data))
-            # convert the image to a base64 string for Jpegs
-            # file_extension = key.split(".")[-1]
-            # if file_extension.lower() == "png":
-            #     image = Image.open(io.BytesIO(image_data))
-                
-            #     buffered = io.BytesIO()
-            #     image.convert('RGB').save(buffered, format="JPEG")
-            #     image_data = buffered.getvalue()
-            #     logging.info("image_data converted")
-            
 
-            base64_string = base64.b64encode(image_data).decode('utf-8')
-            print("Length of string is: ")
-            print(len(base64_string))
-            upscaled_image = self.upscale_image(base64_string)
-            if(upscaled_image == None):
-                return "Upscale failed"
-            return upscaled_image
-        except Exception as e:
-            logging.info("Unable to upscale image" + str(e))
-            return "Unable to upscale image"
\ No newline at end of file
+    def upscale_bytes(self, image_data: bytes) -> bytes:
+        requestType = 'application/json;jpeg'
+        payload = dict(self.cache_params(), image=base64.b64encode(image_data).decode('utf-8'))
+        response = self.query_endpoint_with_json_payload(payload, requestType, requestType)
+        encoded_images, prompt = self.parse_response(response)
+        # the endpoint already returns an encoded image, only re-encode when it is not a JPEG or PNG
+        return self.to_image_bytes(base64.b64decode(encoded_images[0]))
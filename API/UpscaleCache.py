@@ -0,0 +1,236 @@
+"""
+File: UpscaleCache.py
+Description: This file contains a content addressed cache for upscaled images.
+The cache sits in front of the SageMaker endpoint so repeated upscales of the same image with the
+same endpoint and model parameters skip the endpoint call.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    Invoking the endpoint is the most expensive step of a /retrieve call. Entries are keyed by a
+    SHA-256 hash of the input image bytes plus the endpoint and the model parameters, so the key
+    does not depend on the S3 key the image was stored under.
+    There are two tiers:
+    * a bounded in memory LRU, per API process.
+    * an optional second tier shared across processes, either a local directory (UPSCALE_CACHE_DIR)
+      or an S3 prefix (UPSCALE_CACHE_S3_BUCKET and UPSCALE_CACHE_S3_PREFIX). Entries older than the
+      TTL are treated as misses and removed. The local directory is also bounded in size; for the S3 tier
+      an S3 lifecycle rule on the prefix is recommended to clean up entries that are never read again.
+"""
+import os
+import time
+import json
+import hashlib
+import threading
+import collections
+from AwsClients import get_client
+import logging
+logging.basicConfig(level=logging.INFO)
+
+CACHE_ENABLED = os.getenv('UPSCALE_CACHE_ENABLED', 'true').lower() == 'true'
+CACHE_MAX_ITEMS = int(os.getenv('UPSCALE_CACHE_MAX_ITEMS', 128))
+CACHE_MAX_BYTES = int(os.getenv('UPSCALE_CACHE_MAX_BYTES', 128 * 1024 * 1024))
+CACHE_TTL = int(os.getenv('UPSCALE_CACHE_TTL', 24 * 60 * 60))
+CACHE_DIR = os.getenv('UPSCALE_CACHE_DIR')
+CACHE_DIR_MAX_BYTES = int(os.getenv('UPSCALE_CACHE_DIR_MAX_BYTES', 1024 * 1024 * 1024))
+CACHE_S3_BUCKET = os.getenv('UPSCALE_CACHE_S3_BUCKET')
+CACHE_S3_PREFIX = os.getenv('UPSCALE_CACHE_S3_PREFIX', 'upscale-cache/')
+
+def make_cache_key(image_data: bytes, endpoint: str, params: dict) -> str:
+    digest = hashlib.sha256(image_data)
+    digest.update(b"\0" + str(endpoint).encode('utf-8'))
+    digest.update(b"\0" + json.dumps(params, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+class MemoryTier:
+    """LRU bounded by both the number of entries and their total size"""
+    def __init__(self, max_items: int, max_bytes: int) -> None:
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> bytes:
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = value
+        self.size += len(value)
+        while len(self.entries) > self.max_items or self.size > self.max_bytes:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+class DiskTier:
+    """Local directory with one file per entry, expired by mtime and bounded in size"""
+    def __init__(self, directory: str, ttl: int, max_bytes: int) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> bytes:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                self.evictions += 1
+                return None
+            with open(path, "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, value: bytes):
+        # write to a temporary file first so readers never see a partial entry
+        tmp_path = self._path(key) + f".{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(value)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(self._path(name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+        entries.sort()
+        now = time.time()
+        for mtime, size, name in entries:
+            if total <= self.max_bytes and now - mtime <= self.ttl:
+                break
+            try:
+                os.remove(self._path(name))
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+class S3Tier:
+    """S3 prefix shared by every API pod, expired by LastModified"""
+    def __init__(self, bucket: str, prefix: str, ttl: int) -> None:
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ttl = ttl
+        self.evictions = 0
+
+    def get(self, key: str) -> bytes:
+        s3_client = get_client('s3')
+        try:
+            s3_object = s3_client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except s3_client.exceptions.NoSuchKey:
+            return None
+        if time.time() - s3_object['LastModified'].timestamp() > self.ttl:
+            s3_object['Body'].close()
+            s3_client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+            self.evictions += 1
+            return None
+        return s3_object['Body'].read()
+
+    def put(self, key: str, value: bytes):
+        get_client('s3').put_object(Body=value, Bucket=self.bucket, Key=self.prefix + key)
+
+class UpscaleCache:
+    def __init__(self, memory_tier: MemoryTier, second_tier=None) -> None:
+        self.memory_tier = memory_tier
+        self.second_tier = second_tier
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.second_tier_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key: str) -> bytes:
+        with self.lock:
+            value = self.memory_tier.get(key)
+            if value is not None:
+                self.memory_hits += 1
+                return value
+        if self.second_tier is not None:
+            try:
+                value = self.second_tier.get(key)
+            except Exception as e:
+                logging.info(f"Upscale cache second tier read failed: {e}")
+                value = None
+                with self.lock:
+                    self.errors += 1
+            if value is not None:
+                with self.lock:
+                    self.second_tier_hits += 1
+                    self.memory_tier.put(key, value)
+                return value
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: bytes):
+        with self.lock:
+            self.memory_tier.put(key, value)
+        if self.second_tier is not None:
+            try:
+                self.second_tier.put(key, value)
+            except Exception as e:
+                # the cache is best effort, a failed write never fails the upscale
+                logging.info(f"Upscale cache second tier write failed: {e}")
+                with self.lock:
+                    self.errors += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.memory_hits + self.second_tier_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "second_tier_hits": self.second_tier_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.second_tier_hits) / lookups if lookups else 0.0,
+                "errors": self.errors,
+                "memory_items": len(self.memory_tier.entries),
+                "memory_bytes": self.memory_tier.size,
+                "memory_evictions": self.memory_tier.evictions,
+                "second_tier": type(self.second_tier).__name__ if self.second_tier is not None else None,
+                "second_tier_evictions": self.second_tier.evictions if self.second_tier is not None else 0,
+            }
+
+_lock = threading.Lock()
+_cache = None
+
+def get_cache() -> UpscaleCache:
+    """Return the process wide cache, None when caching is disabled"""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                second_tier = None
+                if CACHE_S3_BUCKET:
+                    second_tier = S3Tier(CACHE_S3_BUCKET, CACHE_S3_PREFIX, CACHE_TTL)
+                elif CACHE_DIR:
+                    second_tier = DiskTier(CACHE_DIR, CACHE_TTL, CACHE_DIR_MAX_BYTES)
+                _cache = UpscaleCache(MemoryTier(CACHE_MAX_ITEMS, CACHE_MAX_BYTES), second_tier)
+    return _cache
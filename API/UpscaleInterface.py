@@ -46,4 +46,13 @@ class UpscaleProvider(metaclass=UpscaleInterfaceMeta):
     def encode_image_to_base64(image:Image) -> str:
         buffered = io.BytesIO()
         image.save(buffered, format="JPEG")
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
\ No newline at end of file
+        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+    @staticmethod
+    def image_content_type(image_data:bytes) -> str:
+        # sniff the content type of encoded image bytes, None when it is not a JPEG or PNG
+        if image_data[:3] == b"\xff\xd8\xff":
+            return "image/jpeg"
+        if image_data[:8] == b"\x89PNG\r\n\x1a\n":
+            return "image/png"
+        return None
\ No newline at end of file
@@ -17,17 +17,52 @@ Purpose:
     The purpose of this file is to have all of the relevant methods that back the API. 
 """
 import json
+import base64
 from SagemakerRTUpscale import SagemakerRTUpscaleProvider
+from UpscaleCache import get_cache
+from ProviderRegistry import get_provider, provider_names, DEFAULT_PROVIDER
 from flask import jsonify
+
+IMAGE_MIMETYPES = ['image/jpeg', 'image/png']
+
+# Content negotiation helpers
+def wants_binary(request):
+    # binary responses are opt in, either with ?format=binary or an Accept header preferring an image
+    if request.args.get('format') == 'binary':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json'] + IMAGE_MIMETYPES)
+    return best in IMAGE_MIMETYPES
+
+def read_store_request(request):
+    """Return the raw image bytes and the request fields for the /store body formats.
+    Supported bodies are raw image/* (fields in the query string), multipart/form-data with an
+    image file part (fields in the form) and the original JSON body with a base64 image."""
+    mimetype = request.mimetype or ''
+    if mimetype.startswith('image/'):
+        return request.get_data(), request.args
+    if mimetype == 'multipart/form-data':
+        return request.files['image'].read(), request.form
+    data = request.get_json()
+    image_data = SagemakerRTUpscaleProvider.decode_base64_to_image(data['image'])
+    return image_data, data
+
 # API Receiver
 def disect_request_retrieve(request):
     try:
         s3_key = request.args.get('s3_key')
         s3_bucket = request.args.get('s3_bucket')
         endpoint = request.args.get('endpoint')
+        upscaleMethod = request.args.get('upscaleMethod', DEFAULT_PROVIDER)
+        binary = wants_binary(request)
         try: 
             print("trying")
-            image_data = sageMakerRetrieveUpscale(s3_bucket=s3_bucket, endpoint=endpoint, s3_key=s3_key)
+            if binary:
+                image_data = providerRetrieveUpscaleBytes(upscale_method=upscaleMethod, s3_bucket=s3_bucket, endpoint=endpoint, s3_key=s3_key)
+                if image_data is None:
+                    return {'data': 'Upscale failed', 'code': 400}
+                content_type = SagemakerRTUpscaleProvider.image_content_type(image_data)
+                return {'data': image_data, 'code': 200, 'content_type': content_type}
+            image_data = providerRetrieveUpscale(upscale_method=upscaleMethod, s3_bucket=s3_bucket, endpoint=endpoint, s3_key=s3_key)
             return {'data': image_data, 'code': 200}
         except Exception as e:
             data = ("Unable to retrieve image" + str(e))
@@ -38,31 +73,111 @@ def disect_request_retrieve(request):
         return {'data': data, 'code': 300}
 
 # Provider execution 
-def sageMakerRetrieveUpscale(s3_bucket:str, endpoint: str, s3_key:str):
-    # try to create and configure the SagemakerRTUpscaleProvider
+def providerRetrieveUpscale(upscale_method:str, s3_bucket:str, endpoint: str, s3_key:str):
+    # try to create and configure the provider registered for the upscale method
     try: 
         # create and configure the provider
-        sageMakerRT = SagemakerRTUpscaleProvider(s3_bucket)
-        sageMakerRT.setS3_key(s3_key)
+        provider = get_provider(upscale_method, s3_bucket, endpoint)
+        provider.setS3_key(s3_key)
     except Exception as e:
-        return 'error: create JT class object' + str(e)
+        return 'error: create provider object' + str(e)
     
     try:
-        image_data = sageMakerRT.retrieve_and_upscale(s3_key)
+        image_data = provider.retrieve_and_upscale(s3_key)
         return image_data
     except Exception as e:
         return 'error: retrieve image and upscale' + str(e)
+
+def providerRetrieveUpscaleBytes(upscale_method:str, s3_bucket:str, endpoint: str, s3_key:str):
+    # same as providerRetrieveUpscale but keeps the image as raw bytes end to end
+    provider = get_provider(upscale_method, s3_bucket, endpoint)
+    provider.setS3_key(s3_key)
+    return provider.retrieve_and_upscale_bytes(s3_key)
     
+def disect_request_retrieve_async(request):
+    try:
+        s3_key = request.args.get('s3_key')
+        s3_bucket = request.args.get('s3_bucket')
+        endpoint = request.args.get('endpoint')
+        try: 
+            jobid = sageMakerRetrieveUpscaleAsync(s3_bucket=s3_bucket, endpoint=endpoint, s3_key=s3_key)
+            return {'data': jobid, 'code': 200}
+        except Exception as e:
+            data = ("Unable to submit image" + str(e))
+            return {'data': data, 'code': 400}
+            
+    except Exception as e:
+        data = ("Unable to dissect request" + str(e))
+        return {'data': data, 'code': 300}
+
+def sageMakerRetrieveUpscaleAsync(s3_bucket:str, endpoint: str, s3_key:str):
+    # create and configure the provider, the job itself runs on the VideoUpscaler listener
+    sageMakerRT = SagemakerRTUpscaleProvider(s3_bucket)
+    sageMakerRT.setS3_key(s3_key)
+    return sageMakerRT.retrieve_and_upscale_image_async(s3_key, endpoint)
+
+def get_image_job(id:str):
+    sageMakerRT = SagemakerRTUpscaleProvider("")
+    item = json.loads(sageMakerRT.get_image_status(id))
+    returnDict = {}
+    returnDict["output"] = item.get("output",{}).get("S")
+    returnDict["status"] = item.get("status",{}).get("S")
+    returnDict["error"] = item.get("error",{}).get("S")
+    return sageMakerRT, returnDict
+
+def disect_request_get_image_status(request):
+    try:
+        id = request.args.get('id')
+    except Exception as e:
+        data = ("Unable to dissect request" + str(e))
+        return {'data': data, 'code': 300}
+    try:
+        sageMakerRT, returnDict = get_image_job(id)
+        return {'data': json.dumps(returnDict), 'code': 200}
+    except Exception as e:
+        return {'data': 'Unable to get image status: ' + str(e), 'code': 500}
+
+def disect_request_get_image_result(request):
+    try:
+        id = request.args.get('id')
+        binary = wants_binary(request)
+    except Exception as e:
+        data = ("Unable to dissect request" + str(e))
+        return {'data': data, 'code': 300}
+    try:
+        sageMakerRT, returnDict = get_image_job(id)
+    except Exception as e:
+        return {'data': 'Unable to get image status: ' + str(e), 'code': 500}
+    if returnDict["status"] == "Failed":
+        # the job will not complete, the caller stops polling
+        return {'data': 'Image job failed: ' + str(returnDict["error"]), 'code': 500}
+    if returnDict["status"] != "Completed":
+        # not ready yet, the caller gets the status back and keeps polling
+        return {'data': json.dumps(returnDict), 'code': 202}
+    try:
+        image_data = sageMakerRT.get_image_result(returnDict["output"])
+    except Exception as e:
+        return {'data': 'Unable to get image result: ' + str(e), 'code': 500}
+    if binary:
+        content_type = SagemakerRTUpscaleProvider.image_content_type(image_data)
+        return {'data': image_data, 'code': 200, 'content_type': content_type}
+    return {'data': base64.b64encode(image_data).decode('utf-8'), 'code': 200}
+
 def disect_request_retrieve_video(request):
     try:
         s3_key = request.args.get('s3_key')
         s3_bucket = request.args.get('s3_bucket')
         endpoint = request.args.get('endpoint')
         max_workers = request.args.get('max_workers')
+        pipeline = request.args.get('pipeline')
+        chunk_seconds = request.args.get('chunk_seconds')
+        dedup_threshold = request.args.get('dedup_threshold')
+        frames_per_request = request.args.get('frames_per_request')
+        model = request.args.get('model')
 
         try: 
             print(f"Received request: {request.args}")
-            jobid = sageMakerRetrieveUpscaleVideo(s3_bucket=s3_bucket, endpoint=endpoint, max_workers=max_workers, s3_key=s3_key)
+            jobid = sageMakerRetrieveUpscaleVideo(s3_bucket=s3_bucket, endpoint=endpoint, max_workers=max_workers, s3_key=s3_key, pipeline=pipeline, chunk_seconds=chunk_seconds, dedup_threshold=dedup_threshold, frames_per_request=frames_per_request, model=model)
             return {'data': jobid, 'code': 200}
         except Exception as e:
             data = ("Unable to retrieve video" + str(e))
@@ -72,7 +187,7 @@ def disect_request_retrieve_video(request):
         data = ("Unable to dissect request" + str(e))
         return {'data': data, 'code': 300}
 
-def sageMakerRetrieveUpscaleVideo(s3_bucket:str, endpoint: str, max_workers: int, s3_key:str):
+def sageMakerRetrieveUpscaleVideo(s3_bucket:str, endpoint: str, max_workers: int, s3_key:str, pipeline: str = None, chunk_seconds: float = None, dedup_threshold: float = None, frames_per_request: int = None, model: str = None):
     # try to create and configure the SagemakerRTUpscaleProvider
     try: 
         # create and configure the provider
@@ -82,27 +197,24 @@ def sageMakerRetrieveUpscaleVideo(s3_bucket:str, endpoint: str, max_workers: int
         return 'error: create JT class object' + str(e)
     
     try:
-        jobid = sageMakerRT.retrieve_and_upscale_video(s3_key, endpoint, max_workers)
+        jobid = sageMakerRT.retrieve_and_upscale_video(s3_key, endpoint, max_workers, pipeline, chunk_seconds, dedup_threshold, frames_per_request, model)
         return jobid
     except Exception as e:
         return 'error: retrieve video and upscale' + str(e)
 
 def disect_request_store(request):
-    data = request.get_json()
-    print(data)
-    base64_string = data['image']
-    image_data = SagemakerRTUpscaleProvider.decode_base64_to_image(base64_string)    
+    image_data, data = read_store_request(request)
     s3_key_name = data['s3_key_name']
     s3_bucket = data['s3_bucket']
 
     upscaleMethod = data['upscaleMethod']
     
-    # if upscaleMethod is the SagemakerClass
-    if upscaleMethod == "sageMakerRT":
-        endpoint = data['endpoint']
+    # if upscaleMethod is a registered provider
+    if upscaleMethod in provider_names():
+        endpoint = data.get('endpoint')
         # try to downscale and store the image
         try: 
-            id = sageMakerDownscaleStore(s3_bucket=s3_bucket, endpoint=endpoint, s3_key=s3_key_name, image_data=image_data)                
+            id = providerDownscaleStore(upscale_method=upscaleMethod, s3_bucket=s3_bucket, endpoint=endpoint, s3_key=s3_key_name, image_data=image_data)                
             return {'data': id,'code': 200}
         except Exception as e:
             print("Unable to store image" + str(e))
@@ -110,21 +222,79 @@ def disect_request_store(request):
     else:
         return {'data': 'Upscale Method not yet implemented', 'code': 400}
 
-def sageMakerDownscaleStore(s3_bucket:str, endpoint:str, s3_key:str, image_data:str):
+def providerDownscaleStore(upscale_method:str, s3_bucket:str, endpoint:str, s3_key:str, image_data:str):
     try:
         # create class implementation
-        sageMakerRT = SagemakerRTUpscaleProvider(s3_bucket)
+        provider = get_provider(upscale_method, s3_bucket, endpoint)
         # set the params from API call for image storage. 
-        sageMakerRT.setS3_key(s3_key)
+        provider.setS3_key(s3_key)
     except Exception as e:
-        print("Unable to create JT class object:" + str(e))
-        return 'error: create JT class object'+ str(e)
+        print("Unable to create provider object:" + str(e))
+        return 'error: create provider object'+ str(e)
     try:
-        returnMsg = sageMakerRT.send_and_downscale(image_data)
+        returnMsg = provider.send_and_downscale(image_data)
         return returnMsg
     except Exception as e:
         return 'error: send and downscale: ' + str(e)
     
+def ndjson_line(record):
+    return json.dumps(record) + "\n"
+
+def read_store_batch_request(request):
+    """Return the list of (s3_key, image bytes) and the request fields for /storeBatch.
+    Supported bodies are JSON with an images list of {image, s3_key_name} and multipart/form-data
+    with repeated image file parts (and optional repeated s3_key_name fields, defaulting to the filenames)."""
+    if request.mimetype == 'multipart/form-data':
+        files = request.files.getlist('image')
+        keys = request.form.getlist('s3_key_name') or [f.filename for f in files]
+        return [(key, f.read()) for key, f in zip(keys, files)], request.form
+    data = request.get_json()
+    images = [(item['s3_key_name'], SagemakerRTUpscaleProvider.decode_base64_to_image(item['image'])) for item in data['images']]
+    return images, data
+
+def disect_request_store_batch(request):
+    try:
+        images, data = read_store_batch_request(request)
+        s3_bucket = data['s3_bucket']
+        upscaleMethod = data['upscaleMethod']
+        max_workers = data.get('max_workers')
+    except Exception as e:
+        data = ("Unable to dissect request" + str(e))
+        return {'data': data, 'code': 300}
+    if upscaleMethod not in provider_names():
+        return {'data': 'Upscale Method not yet implemented', 'code': 400}
+
+    provider = get_provider(upscaleMethod, s3_bucket, data.get('endpoint'))
+    def stream():
+        # one NDJSON line per image, in completion order
+        for key, status in provider.send_and_downscale_batch(images, max_workers):
+            code = 200 if status == "image uploaded to S3" else 500
+            yield ndjson_line({'s3_key': key, 'data': status, 'code': code})
+    return {'data': stream(), 'code': 200}
+
+def disect_request_retrieve_batch(request):
+    try:
+        data = request.get_json()
+        s3_keys = data['s3_keys']
+        s3_bucket = data['s3_bucket']
+        endpoint = data.get('endpoint')
+        upscaleMethod = data.get('upscaleMethod', DEFAULT_PROVIDER)
+        max_workers = data.get('max_workers')
+        provider = get_provider(upscaleMethod, s3_bucket, endpoint)
+    except Exception as e:
+        data = ("Unable to dissect request" + str(e))
+        return {'data': data, 'code': 300}
+
+    def stream():
+        # one NDJSON line per key as soon as its upscale finishes, images are base64 encoded
+        for key, image_data in provider.retrieve_and_upscale_batch(s3_keys, max_workers):
+            if image_data is None:
+                yield ndjson_line({'s3_key': key, 'data': 'Upscale failed', 'code': 500})
+            else:
+                content_type = SagemakerRTUpscaleProvider.image_content_type(image_data)
+                yield ndjson_line({'s3_key': key, 'data': base64.b64encode(image_data).decode('utf-8'), 'content_type': content_type, 'code': 200})
+    return {'data': stream(), 'code': 200}
+
 def disect_request_store_video(request):
     data = request.get_json()
     print(data)
@@ -132,15 +302,16 @@ def disect_request_store_video(request):
     s3_bucket = data['s3_bucket']
     min_size = data['min_size']
     max_size = data['max_size']
+    pipeline = data.get('pipeline')
     # try to downscale and store the video
     try: 
-        id = sageMakerDownscaleStoreVideo(s3_bucket=s3_bucket, min_size=min_size, max_size=max_size, s3_key=s3_key_name)                
+        id = sageMakerDownscaleStoreVideo(s3_bucket=s3_bucket, min_size=min_size, max_size=max_size, s3_key=s3_key_name, pipeline=pipeline)                
         return {'data': id,'code': 200}
     except Exception as e:
         print("Unable to store video" + str(e))
         return {'data': 'Unable to store video', 'code': 500}
     
-def sageMakerDownscaleStoreVideo(s3_bucket:str, min_size:int, max_size:int, s3_key:str):
+def sageMakerDownscaleStoreVideo(s3_bucket:str, min_size:int, max_size:int, s3_key:str, pipeline: str = None):
     try:
         # create class implementation
         sageMakerRT = SagemakerRTUpscaleProvider(s3_bucket)
@@ -150,7 +321,7 @@ def sageMakerDownscaleStoreVideo(s3_bucket:str, min_size:int, max_size:int, s3_k
         print("Unable to create Sagemaker class object:" + str(e))
         return 'error: create Sagemaker class object'+ str(e)
     try:
-        returnMsg = sageMakerRT.send_and_downscale_video(s3_key, min_size, max_size)
+        returnMsg = sageMakerRT.send_and_downscale_video(s3_key, min_size, max_size, pipeline)
         return returnMsg
     except Exception as e:
         return 'error: send and downscale: ' + str(e)
@@ -172,8 +343,27 @@ def disect_request_get_video_status(request):
         returnDict = {}
         returnDict["output"] = item.get("output",{}).get("S")
         returnDict["status"] = item.get("status",{}).get("S")
+        # progress written by the VideoUpscaler while the job runs
+        for field in ("frames_total", "frames_decoded", "frames_upscaled", "frames_encoded", "frames_failed", "endpoint_calls_saved",
+                      "fps", "eta_seconds", "progress", "concurrency", "started_at", "updated_at", "chunks_total", "chunks_done"):
+            if field in item:
+                returnDict[field] = float(item[field]["N"]) if "." in item[field]["N"] else int(item[field]["N"])
+        if "error" in item:
+            returnDict["error"] = item["error"]["S"]
+        if "concurrency_history" in item:
+            returnDict["concurrency_history"] = [{name: float(value["N"]) for name, value in entry["M"].items()}
+                                                 for entry in item["concurrency_history"]["L"]]
         return {'data': json.dumps(returnDict), 'code': 200}
     except Exception as e:
         return {'data': 'Unable to get video status: ' + str(e), 'code': 500}
-    
-    
\ No newline at end of file
+
+def disect_request_cache_stats(request):
+    cache = get_cache()
+    if cache is None:
+        return {'data': json.dumps({'enabled': False}), 'code': 200}
+    stats = cache.stats()
+    stats['enabled'] = True
+    return {'data': json.dumps(stats), 'code': 200}
+
+def disect_request_providers(request):
+    return {'data': json.dumps(provider_names()), 'code': 200}
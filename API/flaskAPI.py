@@ -13,8 +13,10 @@ References: N/A
 Purpose:
     This API will be deployed as a Docker Container to ECR and then implemented into the EKS Cluster 
 """
-from flask import Flask, request, jsonify
-from downscale_s3 import disect_request_store, disect_request_retrieve, disect_request_store_video, disect_request_retrieve_video, disect_request_get_video_status
+from flask import Flask, Response, request, jsonify, stream_with_context
+from downscale_s3 import wants_binary, disect_request_store, disect_request_retrieve, disect_request_store_video, disect_request_retrieve_video, disect_request_get_video_status
+from downscale_s3 import disect_request_retrieve_async, disect_request_get_image_status, disect_request_get_image_result
+from downscale_s3 import disect_request_store_batch, disect_request_retrieve_batch, disect_request_cache_stats, disect_request_providers
 import os
 app = Flask(__name__)  
 
@@ -36,6 +38,20 @@ def store_image():
         status = ("Unable to store" + str(e))
         return jsonify({'error': 'Unable dissect request: ' + str(status)}, 500)
 
+@app.route('/storeBatch', methods=['POST'])
+def store_image_batch():
+    try:
+        status = disect_request_store_batch(request)
+        statusCode = status['code']
+        data = status['data']
+        if statusCode == 200:
+            return Response(stream_with_context(data), status=200, mimetype='application/x-ndjson')
+        else:
+            return jsonify({'error': 'Unable to store images: ' + str(data)}), 500
+    except Exception as e:
+        print("Unable to store batch" + str(e))
+        return jsonify({'error': 'Unable dissect request'}), 500
+
 @app.route('/storeVideo', methods=['POST'])
 def store_video():
     try: 
@@ -57,6 +73,11 @@ def retrieve_image():
         status = disect_request_retrieve(request)
         statusCode = status['code']
         data = status['data']
+        if wants_binary(request):
+            # binary response, the upscaled image is returned as is with a real HTTP status code
+            if statusCode == 200:
+                return Response(data, status=200, mimetype=status['content_type'] or 'application/octet-stream')
+            return jsonify({'error': 'Unable to retrieve image: ' + str(data)}), 500
         if statusCode == 200:
             return jsonify({'data': data}, 200)
         else:
@@ -65,6 +86,68 @@ def retrieve_image():
         print("Unable to retrieve" + str(e))
         return jsonify({'error': 'Unable dissect request'}, 500)
     
+@app.route('/retrieveBatch', methods=['POST'])
+def retrieve_image_batch():
+    try:
+        status = disect_request_retrieve_batch(request)
+        statusCode = status['code']
+        data = status['data']
+        if statusCode == 200:
+            return Response(stream_with_context(data), status=200, mimetype='application/x-ndjson')
+        else:
+            return jsonify({'error': 'Unable to retrieve images: ' + str(data)}), 500
+    except Exception as e:
+        print("Unable to retrieve batch" + str(e))
+        return jsonify({'error': 'Unable dissect request'}), 500
+
+@app.route('/retrieveAsync', methods=['GET'])
+def retrieve_image_async():
+    try:
+        status = disect_request_retrieve_async(request)
+        statusCode = status['code']
+        data = status['data']
+        if statusCode == 200:
+            return jsonify({'data': data}), 200
+        else:
+            return jsonify({'error': 'Unable to submit image: ' + str(data)}), 500
+    except Exception as e:
+        print("Unable to submit" + str(e))
+        return jsonify({'error': 'Unable dissect request'}), 500
+
+@app.route('/getImageStatus', methods=['GET'])
+def get_image_status():
+    try:
+        status = disect_request_get_image_status(request)
+        statusCode = status['code']
+        data = status['data']
+        if statusCode == 200:
+            return jsonify({'data': data}), 200
+        else:
+            return jsonify({'error': 'Unable to retrieve image status: ' + str(data)}), 500
+    except Exception as e:
+        print("Unable to get image status" + str(e))
+        return jsonify({'error': 'Unable dissect request'}), 500
+
+@app.route('/getImageResult', methods=['GET'])
+def get_image_result():
+    try:
+        status = disect_request_get_image_result(request)
+        statusCode = status['code']
+        data = status['data']
+        if wants_binary(request):
+            if statusCode == 200:
+                return Response(data, status=200, mimetype=status['content_type'] or 'application/octet-stream')
+            if statusCode == 202:
+                return jsonify({'data': data}), 202
+            return jsonify({'error': 'Unable to retrieve image result: ' + str(data)}), 500
+        if statusCode == 200 or statusCode == 202:
+            return jsonify({'data': data}), statusCode
+        else:
+            return jsonify({'error': 'Unable to retrieve image result: ' + str(data)}), 500
+    except Exception as e:
+        print("Unable to get image result" + str(e))
+        return jsonify({'error': 'Unable dissect request'}), 500
+
 @app.route('/retrieveVideo', methods=['GET'])
 def retrieve_video():
     try:
@@ -93,6 +176,20 @@ def get_video_status():
         print("Unable to get video status" + str(e))
         return jsonify({'error': 'Unable dissect request'}, 500)
 
+@app.route('/providers', methods=['GET'])
+def providers():
+    status = disect_request_providers(request)
+    return jsonify({'data': status['data']}, status['code'])
+
+@app.route('/cacheStats', methods=['GET'])
+def cache_stats():
+    try:
+        status = disect_request_cache_stats(request)
+        return jsonify({'data': status['data']}, status['code'])
+    except Exception as e:
+        print("Unable to get cache stats" + str(e))
+        return jsonify({'error': 'Unable to get cache stats'}, 500)
+
 if __name__ == '__main__':
     cert_path = os.getenv('SSL_CERT')
     key_path = os.getenv('SSL_KEY')
@@ -122,6 +122,7 @@ export class CdkStack extends cdk.Stack {
         //S3 permissions
         "s3:GetObject",
 				"s3:PutObject",
+				"s3:DeleteObject",
         //SQS permissions
         "sqs:GetQueueUrl",
         "sqs:ReceiveMessage",
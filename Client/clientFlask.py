@@ -39,6 +39,27 @@ def retrieve_image_from_api(api_url, s3_bucket, endpoint, s3_key):
     url = f"{api_url}/retrieve?s3_key={s3_key}&s3_bucket={s3_bucket}&endpoint={endpoint}"
     response = requests.get(url, verify=True)
     return response.json()
+
+# sends the raw image bytes instead of base64 in JSON, the other fields go in the query string
+def send_image_binary_to_api(image_path, api_url, s3_bucket, s3Key, endpoint, content_type='image/jpeg'):
+    try: 
+        with open(image_path, "rb") as image_file:
+            image_data = image_file.read()
+    except FileNotFoundError:
+        print(f"File {image_path} not found.")
+        return
+    params = {"s3_bucket": s3_bucket, "s3_key_name": s3Key, "endpoint": endpoint, 'upscaleMethod': "sageMakerRT"}
+    headers = {'Content-Type': content_type}
+    response = requests.post(api_url+'/store', headers=headers, params=params, data=image_data, verify=True)
+    return response.json()
+
+# asks for the raw upscaled image bytes, returns the bytes and their content type
+def retrieve_image_binary_from_api(api_url, s3_bucket, endpoint, s3_key):
+    params = {"s3_key": s3_key, "s3_bucket": s3_bucket, "endpoint": endpoint}
+    headers = {'Accept': 'image/jpeg, image/png'}
+    response = requests.get(api_url+'/retrieve', headers=headers, params=params, verify=True)
+    response.raise_for_status()
+    return response.content, response.headers.get('Content-Type')
     
 
 if __name__ == '__main__':
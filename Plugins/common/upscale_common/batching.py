@@ -0,0 +1,121 @@
+import os
+import time
+import queue
+import threading
+import collections
+import concurrent.futures
+import numpy as np
+
+# collect concurrent single image predict_fn calls into batches, off by default
+DYNAMIC_BATCHING = os.getenv('DYNAMIC_BATCHING', 'false').lower() == 'true'
+# longest time the first image of a batch waits for more images
+BATCH_MAX_LATENCY_MS = float(os.getenv('BATCH_MAX_LATENCY_MS', 5))
+# images are bucketed by their size rounded up to this multiple and padded to the largest image of the batch
+BATCH_BUCKET_MULTIPLE = int(os.getenv('BATCH_BUCKET_MULTIPLE', 16))
+
+_STOP = object()
+
+def bucket_key(height, width, multiple=BATCH_BUCKET_MULTIPLE):
+    return -(-height // multiple) * multiple, -(-width // multiple) * multiple
+
+def pad_to_common(imgs, axes=(0, 1)):
+    """Pad the images (mirrored, like the window padding of the models) to the largest height and width of the list.
+    axes are the height and width axes, (0, 1) for HWC arrays and (1, 2) for CHW arrays.
+    Returns the padded images and their original (height, width)."""
+    sizes = [(img.shape[axes[0]], img.shape[axes[1]]) for img in imgs]
+    height = max(size[0] for size in sizes)
+    width = max(size[1] for size in sizes)
+    padded = []
+    for img, (h, w) in zip(imgs, sizes):
+        if (h, w) != (height, width):
+            pad = [(0, 0)] * img.ndim
+            pad[axes[0]] = (0, height - h)
+            pad[axes[1]] = (0, width - w)
+            img = np.pad(img, pad, mode='symmetric')
+        padded.append(img)
+    return padded, sizes
+
+class MicroBatcher:
+    """Runs the items submitted by concurrent callers in batches on one worker thread.
+    A batch runs once it holds max_batch_size items, or max_latency_ms after its first item arrived.
+    Items with different keys (e.g. resolution buckets) never share a batch. While a batch runs the next
+    requests queue up, so under load the batches fill without waiting the full latency.
+    run_batch gets a list of items and returns the list of results in the same order."""
+    def __init__(self, run_batch, max_batch_size, max_latency_ms=BATCH_MAX_LATENCY_MS, key=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max_latency_ms / 1000
+        self.key = key or (lambda item: None)
+        self.requests = queue.Queue()
+        # number of batches run per batch size
+        self.batch_sizes = collections.Counter()
+        self.worker = threading.Thread(target=self.loop, name="micro-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, item):
+        """Blocks until the batch of the item ran, returns its result or raises the error of the batch"""
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items):
+        """Queues all the items at once so they can share batches with each other and with other callers"""
+        futures = []
+        for item in items:
+            future = concurrent.futures.Future()
+            self.requests.put((item, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.requests.put((_STOP, None))
+        self.worker.join()
+
+    def loop(self):
+        buckets = {}  # key -> (deadline, [(item, future)])
+        stopping = False
+        while not stopping or buckets:
+            timeout = None
+            if buckets:
+                timeout = max(0.0, min(deadline for deadline, _ in buckets.values()) - time.monotonic())
+            requests = []
+            if not stopping:
+                try:
+                    requests.append(self.requests.get(timeout=timeout))
+                    # take whatever else is already queued without waiting
+                    while True:
+                        requests.append(self.requests.get_nowait())
+                except queue.Empty:
+                    pass
+            ready = []
+            for item, future in requests:
+                if item is _STOP:
+                    stopping = True
+                    continue
+                try:
+                    key = self.key(item)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+                deadline, pending = buckets.setdefault(key, (time.monotonic() + self.max_latency, []))
+                pending.append((item, future))
+                if len(pending) >= self.max_batch_size:
+                    ready.append(buckets.pop(key)[1])
+            now = time.monotonic()
+            for key in sorted((key for key, (deadline, _) in buckets.items() if stopping or deadline <= now),
+                              key=lambda key: buckets[key][0]):
+                ready.append(buckets.pop(key)[1])
+            for pending in ready:
+                self.run(pending)
+
+    def run(self, pending):
+        items = [item for item, _ in pending]
+        self.batch_sizes[len(items)] += 1
+        try:
+            results = self.run_batch(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch of {len(items)} items returned {len(results)} results")
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            future.set_result(result)
@@ -0,0 +1,83 @@
+import os
+import glob
+import time
+import torch
+
+# load the TorchScript models packed next to the weights (see export.py of the plugins), false uses the eager models
+USE_TORCHSCRIPT = os.getenv('USE_TORCHSCRIPT', 'true').lower() == 'true'
+# load the int8 models of quantize.py instead (CPU only, esrgan plugin)
+QUANTIZED = os.getenv('QUANTIZED', 'false').lower() == 'true'
+# image sizes run through the model at container start, comma separated WIDTHxHEIGHT, empty for no warm-up
+WARMUP_SIZES = os.getenv('WARMUP_SIZES', '64x64')
+# forward passes per warm-up size, TorchScript optimizes its graph for a shape in the first runs
+WARMUP_RUNS = int(os.getenv('WARMUP_RUNS', 2))
+TORCHSCRIPT_SUFFIX = '.ts'
+
+def parse_sizes(sizes):
+    """[(height, width)] of a comma separated list of WIDTHxHEIGHT"""
+    parsed = []
+    for size in sizes.split(','):
+        if size.strip():
+            width, height = size.strip().lower().split('x')
+            parsed.append((int(height), int(width)))
+    return parsed
+
+def traced_path(model_path, height=None, width=None):
+    """Path of the TorchScript model of the weights in model_path, for one image size when the trace depends on it"""
+    stem = os.path.splitext(model_path)[0]
+    if height is None:
+        return stem + TORCHSCRIPT_SUFFIX
+    return f"{stem}_{width}x{height}{TORCHSCRIPT_SUFFIX}"
+
+def quantized_path(model_path):
+    """Path of the int8 TorchScript model of the weights in model_path"""
+    return os.path.splitext(model_path)[0] + "_int8" + TORCHSCRIPT_SUFFIX
+
+def traced_sizes(model_path):
+    """[(path, height, width)] of the per size TorchScript models of the weights in model_path"""
+    stem = os.path.splitext(model_path)[0]
+    found = []
+    for path in sorted(glob.glob(f"{glob.escape(stem)}_*x*{TORCHSCRIPT_SUFFIX}")):
+        size = path[len(stem) + 1:-len(TORCHSCRIPT_SUFFIX)]
+        try:
+            (height, width), = parse_sizes(size)
+        except ValueError:
+            continue
+        found.append((path, height, width))
+    return found
+
+def export_traced(model, example, path):
+    """Traces model on the example NCHW input and saves it to path, returns the traced model"""
+    model.eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example, check_trace=False)
+    traced.save(path)
+    return traced
+
+def load_traced(path, device, channels_last=False):
+    """Loads a model saved by export_traced on device, frozen for inference (weights folded into the graph)"""
+    traced = torch.jit.load(path, map_location=device)
+    if channels_last:
+        traced = traced.to(memory_format=torch.channels_last)
+    return torch.jit.freeze(traced.eval())
+
+class TracedShapes(torch.nn.Module):
+    """Runs the traced model of the input shape and the eager model on the other shapes,
+    for models whose trace only holds for the shape it was traced with (e.g. shifted window attention).
+    traced maps NCHW shape tuples to traced models."""
+    def __init__(self, model, traced):
+        super().__init__()
+        self.model = model
+        self.traced = traced
+
+    def forward(self, img):
+        return self.traced.get(tuple(img.shape), self.model)(img)
+
+def warmup(run, sizes, runs=WARMUP_RUNS):
+    """Calls run(height, width) runs times for every size, so the first requests do not pay for the lazy
+    initialization (CUDA context and kernels, TorchScript graph optimization, attention caches)"""
+    for height, width in sizes:
+        start = time.perf_counter()
+        for _ in range(runs):
+            run(height, width)
+        print(f"Warm-up {width}x{height}: {(time.perf_counter() - start) / runs * 1000:.0f} ms per run")
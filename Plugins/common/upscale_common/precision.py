@@ -0,0 +1,45 @@
+import os
+import contextlib
+import torch
+
+# precision of the forward pass: auto (fp16 on a GPU, fp32 on CPU), fp32, bf16 (CPU or GPU) or fp16 (GPU only),
+# a request can override it with "precision" in the payload
+PRECISION = os.getenv('PRECISION', 'auto').lower()
+# channels_last memory format of the model, the convolutions run NHWC (oneDNN on CPU, tensor cores on GPU)
+CHANNELS_LAST = os.getenv('CHANNELS_LAST', 'false').lower() == 'true'
+# intra-op and inter-op threads of torch, 0 keeps the torch defaults (one intra-op thread per core)
+TORCH_THREADS = int(os.getenv('TORCH_THREADS', 0))
+TORCH_INTEROP_THREADS = int(os.getenv('TORCH_INTEROP_THREADS', 0))
+PRECISIONS = ('fp32', 'bf16', 'fp16')
+
+def resolve_precision(precision, device):
+    """fp32, bf16 or fp16 for a precision of the environment or of a request on device"""
+    precision = str(precision).lower()
+    if precision == 'auto':
+        return 'fp16' if device.type == 'cuda' else 'fp32'
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision {precision}, expected auto or one of {', '.join(PRECISIONS)}")
+    if precision == 'fp16' and device.type != 'cuda':
+        raise ValueError("fp16 is only supported on the GPU, use bf16 on CPU")
+    return precision
+
+def autocast(precision, device):
+    """Context running the forward passes in precision. The weights stay fp32 and autocast runs the convolutions and
+    matrix products in bf16/fp16, keeping the reductions (softmax, layer norm) in fp32. It is thread local."""
+    if precision == 'fp32':
+        return contextlib.nullcontext()
+    return torch.autocast(device.type, dtype=torch.bfloat16 if precision == 'bf16' else torch.float16)
+
+def memory_format(model, channels_last=CHANNELS_LAST):
+    """model in the channels_last memory format when channels_last is set, before freezing a TorchScript model"""
+    return model.to(memory_format=torch.channels_last) if channels_last else model
+
+def configure_threads(threads=TORCH_THREADS, interop_threads=TORCH_INTEROP_THREADS):
+    if threads > 0:
+        torch.set_num_threads(threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as error:
+            # only possible before the first inter-op parallel work of the process
+            print('Cannot set the inter-op threads:', error)
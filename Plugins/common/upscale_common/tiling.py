@@ -0,0 +1,185 @@
+import os
+import math
+import torch
+
+# run the models through the AutoTiler, false runs every image whole
+AUTO_TILING = os.getenv('AUTO_TILING', 'true').lower() == 'true'
+# share of the free memory (GPU, or RAM on CPU) one forward pass may use
+TILE_MEMORY_FRACTION = float(os.getenv('TILE_MEMORY_FRACTION', 0.5))
+# cap in MB of the memory of one forward pass, on top of the memory fraction, 0 for no cap
+TILE_MEMORY_MB = int(os.getenv('TILE_MEMORY_MB', 0))
+# overlap in input pixels between neighbouring tiles, blended with linear weights
+TILE_OVERLAP = int(os.getenv('TILE_OVERLAP', 16))
+# smallest tile the out of memory fallback goes down to
+TILE_MIN_SIZE = int(os.getenv('TILE_MIN_SIZE', 64))
+# peak memory of a forward pass per input pixel on CPU, measured around 13KB for both plugin models in fp32
+TILE_BYTES_PER_PIXEL = int(os.getenv('TILE_BYTES_PER_PIXEL', 16384))
+
+def is_out_of_memory(error):
+    message = str(error)
+    return "out of memory" in message or "can't allocate memory" in message
+
+# memory limit, usage and stat files of the container with the stat of its reclaimable page cache, cgroup v2 then v1
+CGROUP_MEMORY_FILES = [
+    ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.stat", "inactive_file"),
+    ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+     "/sys/fs/cgroup/memory/memory.stat", "total_inactive_file"),
+]
+
+def cgroup_free_memory():
+    """Bytes left under the memory limit of the container, None without a cgroup limit"""
+    for limit_file, usage_file, stat_file, inactive_stat in CGROUP_MEMORY_FILES:
+        try:
+            with open(limit_file) as fh:
+                limit = fh.read().strip()
+            with open(usage_file) as fh:
+                usage = int(fh.read().strip())
+        except (OSError, ValueError):
+            continue
+        # "max" on v2, a huge page aligned number on v1 when there is no limit
+        if limit == "max" or int(limit) >= 2**60:
+            return None
+        # the usage counts the page cache, its inactive part is reclaimed before the limit is hit
+        try:
+            with open(stat_file) as fh:
+                stats = dict(line.split() for line in fh if line.strip())
+            usage -= int(stats.get(inactive_stat, 0))
+        except (OSError, ValueError):
+            pass
+        return max(int(limit) - usage, 0)
+    return None
+
+def free_memory(device):
+    """Free bytes on the device, the available RAM for the CPU within the container memory limit"""
+    if device.type == 'cuda':
+        free, _ = torch.cuda.mem_get_info(device)
+        return free
+    try:
+        free = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        # no sysconf, assume 4GB
+        free = 4 * 1024**3
+    limit = cgroup_free_memory()
+    return free if limit is None else min(free, limit)
+
+def blend_weights(length, overlap, start_edge, end_edge, device):
+    """1D weights of a tile: a linear ramp over the overlap on the sides that touch another tile, 1 elsewhere"""
+    weights = torch.ones(length, device=device)
+    overlap = min(overlap, length)
+    if overlap > 0:
+        ramp = (torch.arange(overlap, device=device, dtype=torch.float32) + 0.5) / overlap
+        if not start_edge:
+            weights[:overlap] = ramp
+        if not end_edge:
+            weights[length - overlap:] = torch.minimum(weights[length - overlap:], ramp.flip(0))
+    return weights
+
+def tile_starts(length, tile, overlap):
+    # the last tile is moved back to end on the border, so every tile has the full size
+    if length <= tile:
+        return [0]
+    step = tile - overlap
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+class AutoTiler:
+    """Runs forward on an NCHW tensor whole when it fits in memory, otherwise on overlapping tiles.
+    The tile size comes from the free memory of the device and the memory the model needs per input pixel
+    (measured on a probe tile on CUDA, bytes_per_pixel on CPU). Tiles overlap by overlap pixels and are
+    blended with linear weights, so there is no seam. On an out of memory error the tile size is halved,
+    down to min_tile, and the image is processed again.
+    forward gets an NCHW tensor and returns it upscaled by scale, tile_forward (forward by default) is used for
+    the tiles. Tile sizes are a multiple of align, e.g. the attention window of a transformer."""
+    def __init__(self, forward, scale, device, overlap=TILE_OVERLAP, min_tile=TILE_MIN_SIZE,
+                 memory_fraction=TILE_MEMORY_FRACTION, bytes_per_pixel=TILE_BYTES_PER_PIXEL,
+                 memory_cap_mb=TILE_MEMORY_MB, align=1, tile_forward=None):
+        self.forward = forward
+        self.tile_forward = tile_forward or forward
+        self.scale = scale
+        self.device = device
+        self.overlap = overlap
+        self.align = align
+        self.min_tile = self.aligned(min_tile)
+        self.memory_fraction = memory_fraction
+        self.memory_cap = memory_cap_mb * 1024**2
+        self.bytes_per_pixel = bytes_per_pixel
+        # measured bytes per input pixel per (batch, channels) on CUDA
+        self.measured = {}
+
+    def aligned(self, size):
+        return max(self.align, size // self.align * self.align)
+
+    def memory_budget(self):
+        budget = free_memory(self.device) * self.memory_fraction
+        return min(budget, self.memory_cap) if self.memory_cap else budget
+
+    def memory_per_pixel(self, img):
+        if self.device.type != 'cuda':
+            return self.bytes_per_pixel * img.shape[0]
+        key = (img.shape[0], img.shape[1])
+        if key not in self.measured:
+            probe = img.new_zeros((img.shape[0], img.shape[1], self.min_tile, self.min_tile))
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+            baseline = torch.cuda.memory_allocated(self.device)
+            with torch.no_grad():
+                self.tile_forward(probe)
+            self.measured[key] = max(1, (torch.cuda.max_memory_allocated(self.device) - baseline) // self.min_tile**2)
+        return self.measured[key]
+
+    def tile_size(self, img):
+        """None when the whole image fits, otherwise the side of the square tiles"""
+        _, _, height, width = img.shape
+        pixels = self.memory_budget() / self.memory_per_pixel(img)
+        if height * width <= pixels:
+            return None
+        return max(self.min_tile, self.aligned(int(math.sqrt(pixels))))
+
+    def __call__(self, img):
+        tile = self.tile_size(img)
+        while True:
+            try:
+                with torch.no_grad():
+                    if tile is None:
+                        return self.forward(img)
+                    return self.tiled(img, tile)
+            except RuntimeError as error:
+                if not is_out_of_memory(error):
+                    raise
+                _, _, height, width = img.shape
+                current = tile or max(height, width)
+                if current <= self.min_tile:
+                    raise
+                tile = max(self.min_tile, self.aligned(current // 2))
+                print(f'Out of memory, retrying with {tile}px tiles')
+                if self.device.type == 'cuda':
+                    torch.cuda.empty_cache()
+
+    def tiled(self, img, tile):
+        batch, channel, height, width = img.shape
+        scale = self.scale
+        overlap = min(self.overlap, tile // 4)
+        output = None
+        starts_y = tile_starts(height, tile, overlap)
+        starts_x = tile_starts(width, tile, overlap)
+        # the weights of a tile are the outer product of a row and a column weight, and the tiles form a grid,
+        # so the total weight of a pixel is the outer product of the summed row and column weights
+        rows = [blend_weights(min(tile, height) * scale, overlap * scale, y == 0, y + tile >= height, img.device) for y in starts_y]
+        columns = [blend_weights(min(tile, width) * scale, overlap * scale, x == 0, x + tile >= width, img.device) for x in starts_x]
+        row_total = torch.zeros(height * scale, device=img.device)
+        for y, row in zip(starts_y, rows):
+            row_total[y * scale:y * scale + row.shape[0]] += row
+        column_total = torch.zeros(width * scale, device=img.device)
+        for x, column in zip(starts_x, columns):
+            column_total[x * scale:x * scale + column.shape[0]] += column
+        for y, row in zip(starts_y, rows):
+            for x, column in zip(starts_x, columns):
+                output_tile = self.tile_forward(img[:, :, y:y + tile, x:x + tile]).float()
+                if output is None:
+                    output = output_tile.new_zeros((batch, output_tile.shape[1], height * scale, width * scale))
+                weights = torch.outer(row / row_total[y * scale:y * scale + row.shape[0]],
+                                      column / column_total[x * scale:x * scale + column.shape[0]])
+                output[:, :, y * scale:y * scale + row.shape[0], x * scale:x * scale + column.shape[0]] += output_tile * weights
+                del output_tile
+        return output.to(img.dtype)
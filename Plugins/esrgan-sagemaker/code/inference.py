@@ -5,66 +5,220 @@ from pathlib import Path
 import numpy as np
 import cv2
 import os
+import sys
 import base64
+import functools
 
 from basicsr.archs.rrdbnet_arch import RRDBNet
 from basicsr.utils.download_util import load_file_from_url
 
 from realesrgan.realesrgan import RealESRGANer
+from realesrgan.realesrgan.archs.srvgg_arch import SRVGGNetCompact
+
+# shared plugin code, deploy.py copies it next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from upscale_common.batching import MicroBatcher, DYNAMIC_BATCHING, bucket_key, pad_to_common
+from upscale_common.tiling import AutoTiler, AUTO_TILING
+from upscale_common.export import USE_TORCHSCRIPT, QUANTIZED, WARMUP_SIZES, load_traced, parse_sizes, quantized_path, traced_path, warmup
+from upscale_common.precision import PRECISION, CHANNELS_LAST, autocast, configure_threads, memory_format, resolve_precision
 
 # RealESR-Gan configuration
 netscale = 4
 outscale = 4
 dni_weight = None
+# fixed tiling of large images, 0 uses the AutoTiler (or no tiling with AUTO_TILING=false); tiles of the same shape are batched up to TILE_BATCH per forward pass
+# within TILE_MEMORY_MB of GPU memory (0 for no budget)
+tile_size = int(os.getenv('TILE_SIZE', 0))
+tile_batch = int(os.getenv('TILE_BATCH', 4))
+tile_memory = int(os.getenv('TILE_MEMORY_MB', 0))
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 realesr_gan_model_name = 'RealESRGAN_x4plus.pth'
+realesr_compact_model_name = 'realesr-general-x4v3.pth'
+# model variants served by one endpoint, selected by the "model" of a request: the 23 block RRDBNet and
+# SRVGGNetCompact, about 10x faster on CPU, served when its weights are in model.tar.gz
+model_variants = {
+    'full': (realesr_gan_model_name, lambda: RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)),
+    'compact': (realesr_compact_model_name, lambda: SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=32, upscale=4, act_type='prelu')),
+}
+# "quality" of a request, the variant it selects
+qualities = {'high': 'full', 'fast': 'compact'}
+# variant of the requests without model or quality
+default_model = os.getenv('DEFAULT_MODEL', 'full')
+# largest number of same sized images in one forward pass of a batched request
+max_batch_size = int(os.getenv('MAX_BATCH_SIZE', 8))
+# 8-bit images normalized and quantized on the tensor side, false for the float32 numpy conversions of Real-ESRGAN
+tensor_io = os.getenv('TENSOR_IO', 'true').lower() == 'true'
+# upscaling of the alpha channel of transparent PNGs: batched (with the image in one forward pass), guided (guided filter
+# on the upscaled image, no model pass), realesrgan (a second forward pass) or resize (bilinear)
+alpha_upsamplers = ('batched', 'guided', 'realesrgan', 'resize')
+alpha_upsampler = os.getenv('ALPHA_UPSAMPLER', 'batched')
+png_signature = b'\x89PNG'
 
 def model_fn(model_dir):
-    # loads SwinIR model
-    realesr_gan_model_path = os.path.join(model_dir, realesr_gan_model_name)
+    configure_threads()
+    precision = resolve_precision(PRECISION, device)
+    if default_model not in model_variants:
+        raise ValueError(f"Unknown DEFAULT_MODEL {default_model}, expected one of {', '.join(model_variants)}")
+    if alpha_upsampler not in alpha_upsamplers:
+        raise ValueError(f"Unknown ALPHA_UPSAMPLER {alpha_upsampler}, expected one of {', '.join(alpha_upsamplers)}")
+    # one upsampler per model variant with weights in model_dir, the weights of the default one are required
+    upsamplers = {}
+    for name, (model_name, network) in model_variants.items():
+        model_path = os.path.join(model_dir, model_name)
+        if name != default_model and not os.path.exists(model_path):
+            print(f"===============no {model_name}, the {name} model is not served====================")
+            continue
+        upsamplers[name] = load_upsampler(model_path, network(), precision)
+        print(f"===============loaded {name} model {model_name}====================")
 
-    #loads RealESRGan Model
-    realesr_gan_model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
+    model = {}
+    model['realesr_gan'] = upsamplers[default_model]
+    model['upsamplers'] = upsamplers
+    model['precision'] = precision
+    if DYNAMIC_BATCHING:
+        # concurrent single image requests share a forward pass, the worker thread is also the only user of the upsamplers
+        # items are (image, precision, model variant), requests in another precision or for another model never share a batch
+        model['batcher'] = MicroBatcher(functools.partial(enhance_padded, upsamplers), max_batch_size,
+                                        key=lambda item: (item[2], item[1]) + bucket_key(*item[0].shape[:2]))
+    return model
 
-    real_esr_gan_upsampler = RealESRGANer(
+def load_upsampler(model_path, network, precision):
+    upsampler = RealESRGANer(
         scale=netscale,
-        model_path=realesr_gan_model_path,
+        model_path=model_path,
         dni_weight=dni_weight,
-        model=realesr_gan_model,
-        tile=0,
+        model=network,
+        tile=tile_size,
         tile_pad=10,
         pre_pad=0,
-        half=True,
-        gpu_id=0)
+        # the weights stay fp32, the precision of a request comes from autocast (see PRECISION)
+        half=False,
+        gpu_id=0,
+        tile_batch=tile_batch,
+        tile_memory=tile_memory,
+        tensor_io=tensor_io)
 
-    print(f"===============loaded RealESRGanNer model====================")
-    model = {}
-    model['realesr_gan'] = real_esr_gan_upsampler
-    return model
+    eager_model = upsampler.model = memory_format(upsampler.model, CHANNELS_LAST)
+    model_traced_path = traced_path(model_path)
+    model_quantized_path = quantized_path(model_path)
+    quantized = QUANTIZED and device.type == 'cpu' and os.path.exists(model_quantized_path)
+    if QUANTIZED and not quantized:
+        print(f"===============no int8 model: {model_quantized_path} is missing or the model runs on the GPU====================")
+    if quantized:
+        # int8 model of quantize.py, the quantized kernels only run on CPU
+        upsampler.model = load_traced(model_quantized_path, device)
+        print(f"===============loaded int8 model {model_quantized_path}====================")
+    elif USE_TORCHSCRIPT and os.path.exists(model_traced_path):
+        # TorchScript model of export.py, frozen for inference
+        upsampler.model = load_traced(model_traced_path, upsampler.device, CHANNELS_LAST)
+        print(f"===============loaded TorchScript model {model_traced_path}====================")
+    try:
+        with autocast(precision, device):
+            warmup(lambda height, width: upsampler.enhance(np.zeros((height, width, 3), np.uint8), outscale=outscale),
+                   parse_sizes(WARMUP_SIZES))
+    except RuntimeError as error:
+        if upsampler.model is eager_model:
+            raise
+        # e.g. a model traced on another device
+        print('Warm-up of the TorchScript model failed, using the eager model:', error)
+        upsampler.model = eager_model
+
+    if tile_size == 0 and AUTO_TILING:
+        # images too large for the free memory are upscaled in blended tiles instead of failing
+        upsampler.tiler = AutoTiler(upsampler.model, netscale, upsampler.device)
+    return upsampler
+
+def select_model(request, model):
+    """Model variant of a request: its "model", or the variant of its "quality", the default one otherwise"""
+    name = request.get('model') or qualities.get(request.get('quality'), request.get('quality')) or default_model
+    if name not in model['upsamplers']:
+        raise ValueError(f"Model {name} is not served, expected one of {', '.join(model['upsamplers'])} "
+                         f"or a quality of {', '.join(qualities)}")
+    return name
+
+def enhance_padded(upsamplers, items):
+    # the images of a batch are in the same size bucket, they are padded to one size and cropped back after the forward pass
+    padded, sizes = pad_to_common([img for img, _, _ in items])
+    _, precision, name = items[0]
+    # autocast is thread local, so it is entered in the batcher thread
+    with autocast(precision, device):
+        outputs = upsamplers[name].enhance_batch(padded, outscale=outscale, max_batch=len(padded),
+                                                 alpha_upsampler=alpha_upsampler)
+    return [output[:h * outscale, :w * outscale] for (output, _), (h, w) in zip(outputs, sizes)]
 
 def input_fn(request_body, request_content_type):
     print("Received input request.")
     if "application/json" in request_content_type:
-        data = json.loads(request_body)
-        return data['image']
+        # {"images": [...]} is upscaled as a batch, {"image": ...} keeps the single image response,
+        # both with an optional "precision" (fp32, bf16, fp16, auto) and "model" (full, compact) or "quality" (high, fast)
+        return json.loads(request_body)
     raise ValueError("Unsupported content type: {}".format(request_content_type))
 
+def decode_image(input_data):
+    # 8-bit BGR, or BGRA for a PNG with transparency
+    nparr = np.frombuffer(base64.b64decode(input_data.encode("ascii")), np.uint8)
+    if nparr[:len(png_signature)].tobytes() != png_signature:
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(nparr, cv2.IMREAD_UNCHANGED)
+    if img.dtype == np.uint16:
+        # 16-bit PNG, to 8-bit like IMREAD_COLOR
+        img = (img >> 8).astype(np.uint8)
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4 and img[:, :, 3].min() == 255:
+        # opaque alpha channel, upscaled as a BGR image
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return img
+
+def encode_image(output):
+    # PNG keeps the alpha channel of BGRA outputs, JPEG otherwise
+    _, im_arr = cv2.imencode('.png' if output.ndim == 3 and output.shape[2] == 4 else '.jpg', output)
+    return base64.b64encode(im_arr.tobytes()).decode('utf-8')
+
+def predict_batch(input_data, model, precision, name):
+    print(f"Received batch predict request of {len(input_data)} images.")
+    data = [""] * len(input_data)
+    try:
+        imgs = [decode_image(image) for image in input_data]
+        if 'batcher' in model:
+            outputs = model['batcher'].submit_many([(img, precision, name) for img in imgs])
+        else:
+            upsampler = model['upsamplers'][name]
+            with autocast(precision, device):
+                outputs = [output for output, _ in upsampler.enhance_batch(imgs, outscale=4, max_batch=max_batch_size,
+                                                                           alpha_upsampler=alpha_upsampler)]
+        data = [encode_image(output) for output in outputs]
+    except RuntimeError as error:
+        print('Error', error)
+        print('If you encounter CUDA out of memory, try to set --tile with a smaller number.')
+    except Exception as error:
+        print('Error', error)
+    return data
+
 def predict_fn(input_data, model):
-    print("Received predict request.")
-    image_bytes = input_data.encode("ascii")
-    nparr = np.frombuffer(base64.b64decode(image_bytes), np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    precision = model['precision']
+    name = default_model
+    if isinstance(input_data, dict):
+        # payload of input_fn, local callers pass the base64 image (or a list of them) directly
+        precision = resolve_precision(input_data.get('precision', precision), device)
+        name = select_model(input_data, model)
+        input_data = input_data['images'] if 'images' in input_data else input_data['image']
+    if isinstance(input_data, list):
+        return predict_batch(input_data, model, precision, name)
+    print(f"Received predict request, {name} model, precision {precision}.")
+    img = decode_image(input_data)
     data = ""
 
     try:
         print("Performing inference.")
-        upsampler = model['realesr_gan'] 
-        output, _ = upsampler.enhance(img, outscale=4)
-        _, im_arr = cv2.imencode('.jpg', output)  # im_arr: image in Numpy one-dim array format.
-        im_bytes = im_arr.tobytes()
-        im_b64 = base64.b64encode(im_bytes)
-        data = im_b64.decode('utf-8')
+        upsampler = model['upsamplers'][name]
+        if 'batcher' in model:
+            output = model['batcher'].submit((img, precision, name))
+        else:
+            with autocast(precision, device):
+                output, _ = upsampler.enhance(img, outscale=4, alpha_upsampler=alpha_upsampler)
+        data = encode_image(output)
     except RuntimeError as error:
         print('Error', error)
         print('If you encounter CUDA out of memory, try to set --tile with a smaller number.')
@@ -74,4 +228,6 @@ def predict_fn(input_data, model):
     return data
 
 def output_fn(prediction, content_type):
-    return json.dumps({"generated_images": [prediction], "prompt":""}), content_type
+    # a batch prediction is already a list, in the order of the request
+    generated_images = prediction if isinstance(prediction, list) else [prediction]
+    return json.dumps({"generated_images": generated_images, "prompt":""}), content_type
@@ -24,6 +24,12 @@ class RealESRGANer():
         tile_pad (int): The pad size for each tile, to remove border artifacts. Default: 10.
         pre_pad (int): Pad the input images to avoid border artifacts. Default: 10.
         half (float): Whether to use half precision during inference. Default: False.
+        tile_batch (int): Tiles of the same shape processed in one forward pass. Default: 1.
+        tile_memory (int): Memory budget in MB of one batched tile forward pass on CUDA, 0 for no budget. Default: 0.
+        tiler (callable): Called with the pre-processed NCHW tensor instead of the model when tile is 0, e.g. to
+            tile large images automatically. Default: None.
+        tensor_io (bool): Convert 8-bit BGR images on the tensor side (normalization, channel swap and quantization
+            fused into the copies to and from the device) instead of through float32 numpy copies. Default: True.
     """
 
     def __init__(self,
@@ -36,13 +42,25 @@ class RealESRGANer():
                  pre_pad=10,
                  half=False,
                  device=None,
-                 gpu_id=None):
+                 gpu_id=None,
+                 tile_batch=1,
+                 tile_memory=0,
+                 tiler=None,
+                 tensor_io=True):
         self.scale = scale
         self.tile_size = tile
         self.tile_pad = tile_pad
+        self.tile_batch = tile_batch
+        self.tile_memory = tile_memory
+        self.tiler = tiler
+        # measured memory of one forward pass per (batch, tile height, tile width)
+        self.tile_memory_per_batch = {}
         self.pre_pad = pre_pad
         self.mod_scale = None
         self.half = half
+        self.tensor_io = tensor_io
+        # pinned host buffer of the uint8 input, reused between calls of the same size (CUDA only)
+        self.host_input = None
 
         # initialize model
         if gpu_id:
@@ -88,8 +106,15 @@ class RealESRGANer():
     def pre_process(self, img):
         """Pre-process, such as pre-pad and mod pad, so that the images can be divisible
         """
-        img = torch.from_numpy(np.transpose(img, (2, 0, 1))).float()
-        self.img = img.unsqueeze(0).to(self.device)
+        if isinstance(img, torch.Tensor):
+            # NCHW tensor of bgr_to_tensor, already on the device
+            self.img = img
+        elif img.ndim == 4:
+            # batch of same sized images, NHWC
+            self.img = torch.from_numpy(np.transpose(img, (0, 3, 1, 2))).float().to(self.device)
+        else:
+            img = torch.from_numpy(np.transpose(img, (2, 0, 1))).float()
+            self.img = img.unsqueeze(0).to(self.device)
         if self.half:
             self.img = self.img.half()
 
@@ -110,14 +135,75 @@ class RealESRGANer():
                 self.mod_pad_w = (self.mod_scale - w % self.mod_scale)
             self.img = F.pad(self.img, (0, self.mod_pad_w, 0, self.mod_pad_h), 'reflect')
 
+    def bgr_to_tensor(self, img):
+        """NCHW-RGB tensor in [0, 1] on the device of a uint8 BGR image (HWC) or batch (NHWC).
+
+        The uint8 image goes to the device as is (through a reused pinned buffer on CUDA), each channel is converted
+        to float while it is copied into its swapped place, and it is normalized in place: no float copy on the host.
+        """
+        img = torch.from_numpy(np.ascontiguousarray(img if img.ndim == 4 else img[None]))
+        if self.device.type == 'cuda':
+            if self.host_input is None or self.host_input.shape != img.shape:
+                self.host_input = torch.empty(img.shape, dtype=torch.uint8, pin_memory=True)
+            # the previous copy from the buffer is done, the output of the previous call was copied back after it
+            img = self.host_input.copy_(img).to(self.device, non_blocking=True)
+        batch, height, width, _ = img.shape
+        tensor = torch.empty((batch, 3, height, width),
+                             dtype=torch.float16 if self.half else torch.float32, device=self.device)
+        for channel in range(3):
+            tensor[:, channel].copy_(img[..., 2 - channel])
+        return tensor.div_(255.)
+
+    def guided_upsample(self, alpha, img, output_img, radius=1, eps=1e-4):
+        """Upscales the alpha channel with a guided filter instead of a model pass (fast guided filter).
+
+        The linear coefficients of alpha against the luminance of the input image are fitted in windows of the
+        input resolution, upscaled, and applied to the luminance of the upscaled image, so the edges of the alpha
+        follow the edges the model produced. img is the RGB input and output_img the BGR output, in [0, 1].
+        """
+        guide = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        size = (2 * radius + 1, 2 * radius + 1)
+        mean_guide = cv2.boxFilter(guide, -1, size)
+        mean_alpha = cv2.boxFilter(alpha, -1, size)
+        covariance = cv2.boxFilter(guide * alpha, -1, size) - mean_guide * mean_alpha
+        variance = cv2.boxFilter(guide * guide, -1, size) - mean_guide * mean_guide
+        a = covariance / (variance + eps)
+        b = mean_alpha - a * mean_guide
+        h, w = output_img.shape[0:2]
+        a = cv2.resize(cv2.boxFilter(a, -1, size), (w, h), interpolation=cv2.INTER_LINEAR)
+        b = cv2.resize(cv2.boxFilter(b, -1, size), (w, h), interpolation=cv2.INTER_LINEAR)
+        return np.clip(a * cv2.cvtColor(output_img, cv2.COLOR_BGR2GRAY) + b, 0, 1)
+
+    def tensor_to_bgr(self, output):
+        """uint8 NHWC-BGR numpy batch of a NCHW-RGB output in [0, 1], quantized in place on the device.
+
+        Only the uint8 image is copied back to the host, a quarter of the float output.
+        """
+        if output.dtype != torch.float32:
+            # fp16 and bf16 outputs are not precise enough to round to 255 levels
+            output = output.float()
+        output = output.clamp_(0, 1).mul_(255.).round_()
+        batch, _, height, width = output.shape
+        img = torch.empty((batch, height, width, 3), dtype=torch.uint8, device=output.device)
+        for channel in range(3):
+            img[..., 2 - channel].copy_(output[:, channel])
+        return img.cpu().numpy()
+
     def process(self):
         # model inference
-        self.output = self.model(self.img)
+        if self.tiler is not None:
+            self.output = self.tiler(self.img)
+        else:
+            self.output = self.model(self.img)
 
     def tile_process(self):
         """It will first crop input images to tiles, and then process each tile.
         Finally, all the processed tiles are merged into one images.
 
+        Tiles with the same padded shape (the inner tiles, and each kind of edge tile) are stacked into batches of
+        up to tile_batch tiles for one forward pass. The tiles are copied into a preallocated batch tensor and the
+        results are copied into views of the preallocated output.
+
         Modified from: https://github.com/ata4/esrgan-launcher
         """
         batch, channel, height, width = self.img.shape
@@ -130,17 +216,15 @@ class RealESRGANer():
         tiles_x = math.ceil(width / self.tile_size)
         tiles_y = math.ceil(height / self.tile_size)
 
-        # loop over all tiles
+        # group the tiles by padded shape, edge tiles are smaller than inner tiles
+        groups = {}
         for y in range(tiles_y):
             for x in range(tiles_x):
-                # extract tile from input image
-                ofs_x = x * self.tile_size
-                ofs_y = y * self.tile_size
                 # input tile area on total image
-                input_start_x = ofs_x
-                input_end_x = min(ofs_x + self.tile_size, width)
-                input_start_y = ofs_y
-                input_end_y = min(ofs_y + self.tile_size, height)
+                input_start_x = x * self.tile_size
+                input_end_x = min(input_start_x + self.tile_size, width)
+                input_start_y = y * self.tile_size
+                input_end_y = min(input_start_y + self.tile_size, height)
 
                 # input tile area on total image with padding
                 input_start_x_pad = max(input_start_x - self.tile_pad, 0)
@@ -148,36 +232,71 @@ class RealESRGANer():
                 input_start_y_pad = max(input_start_y - self.tile_pad, 0)
                 input_end_y_pad = min(input_end_y + self.tile_pad, height)
 
-                # input tile dimensions
-                input_tile_width = input_end_x - input_start_x
-                input_tile_height = input_end_y - input_start_y
-                tile_idx = y * tiles_x + x + 1
-                input_tile = self.img[:, :, input_start_y_pad:input_end_y_pad, input_start_x_pad:input_end_x_pad]
-
-                # upscale tile
+                tile = (input_start_x, input_end_x, input_start_y, input_end_y,
+                        input_start_x_pad, input_end_x_pad, input_start_y_pad, input_end_y_pad)
+                groups.setdefault((input_end_y_pad - input_start_y_pad, input_end_x_pad - input_start_x_pad), []).append(tile)
+
+        forward_passes = 0
+        for (tile_height, tile_width), tiles in groups.items():
+            limit = self.tile_batch_limit(tile_height, tile_width)
+            start = 0
+            while start < len(tiles):
+                chunk = tiles[start:start + limit]
+                # preallocated batch, the tiles of every image of self.img follow each other
+                input_batch = self.img.new_empty((len(chunk) * batch, channel, tile_height, tile_width))
+                for index, (_, _, _, _, start_x_pad, end_x_pad, start_y_pad, end_y_pad) in enumerate(chunk):
+                    input_batch[index * batch:(index + 1) * batch].copy_(
+                        self.img[:, :, start_y_pad:end_y_pad, start_x_pad:end_x_pad])
+
+                # upscale tiles
                 try:
                     with torch.no_grad():
-                        output_tile = self.model(input_tile)
+                        output_batch = self.model(input_batch)
                 except RuntimeError as error:
+                    if limit == 1 or 'out of memory' not in str(error):
+                        raise
+                    # retry the tiles in smaller batches
                     print('Error', error)
-                print(f'\tTile {tile_idx}/{tiles_x * tiles_y}')
-
-                # output tile area on total image
-                output_start_x = input_start_x * self.scale
-                output_end_x = input_end_x * self.scale
-                output_start_y = input_start_y * self.scale
-                output_end_y = input_end_y * self.scale
-
-                # output tile area without padding
-                output_start_x_tile = (input_start_x - input_start_x_pad) * self.scale
-                output_end_x_tile = output_start_x_tile + input_tile_width * self.scale
-                output_start_y_tile = (input_start_y - input_start_y_pad) * self.scale
-                output_end_y_tile = output_start_y_tile + input_tile_height * self.scale
-
-                # put tile into output image
-                self.output[:, :, output_start_y:output_end_y,
-                            output_start_x:output_end_x] = output_tile[:, :, output_start_y_tile:output_end_y_tile,
-                                                                       output_start_x_tile:output_end_x_tile]
+                    del input_batch
+                    torch.cuda.empty_cache()
+                    limit = max(1, limit // 2)
+                    continue
+                forward_passes += 1
+
+                for index, tile in enumerate(chunk):
+                    input_start_x, input_end_x, input_start_y, input_end_y, input_start_x_pad, _, input_start_y_pad, _ = tile
+                    # output tile area without padding
+                    output_start_x_tile = (input_start_x - input_start_x_pad) * self.scale
+                    output_end_x_tile = output_start_x_tile + (input_end_x - input_start_x) * self.scale
+                    output_start_y_tile = (input_start_y - input_start_y_pad) * self.scale
+                    output_end_y_tile = output_start_y_tile + (input_end_y - input_start_y) * self.scale
+
+                    # put tile into output image
+                    self.output[:, :, input_start_y * self.scale:input_end_y * self.scale,
+                                input_start_x * self.scale:input_end_x * self.scale].copy_(
+                                    output_batch[index * batch:(index + 1) * batch, :, output_start_y_tile:output_end_y_tile,
+                                                 output_start_x_tile:output_end_x_tile])
+                start += len(chunk)
+        print(f'\t{tiles_x * tiles_y} tiles in {forward_passes} forward passes')
+
+    def tile_batch_limit(self, tile_height, tile_width):
+        """Number of tiles of this shape in one forward pass.
+
+        At most tile_batch. With tile_memory (MB) on CUDA, the memory of one tile is measured on the first tile of
+        each shape and the batch is reduced so the tiles of a forward pass stay within the budget.
+        """
+        limit = max(1, self.tile_batch // self.img.shape[0])
+        if not self.tile_memory or self.device.type != 'cuda':
+            return limit
+        key = (self.img.shape[0], tile_height, tile_width)
+        if key not in self.tile_memory_per_batch:
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+            baseline = torch.cuda.memory_allocated(self.device)
+            with torch.no_grad():
+                self.model(self.img.new_zeros((self.img.shape[0], self.img.shape[1], tile_height, tile_width)))
+            self.tile_memory_per_batch[key] = max(1, torch.cuda.max_memory_allocated(self.device) - baseline)
+        return max(1, min(limit, int(self.tile_memory * 1024**2 // self.tile_memory_per_batch[key])))
 
     def post_process(self):
         # remove extra pad
@@ -192,7 +311,29 @@ class RealESRGANer():
 
     @torch.no_grad()
     def enhance(self, img, outscale=None, alpha_upsampler='realesrgan'):
+        """Upscale one BGR, gray, BGRA or 16-bit image, returns (output, img_mode).
+
+        alpha_upsampler is how the alpha channel of BGRA images is upscaled: realesrgan runs the model a second
+        time on it, batched runs it as a second image of the same forward pass (the same output on the GPU in about
+        the time of one image), guided uses guided_upsample and anything else a bilinear resize.
+        """
         h_input, w_input = img.shape[0:2]
+        if self.tensor_io and img.ndim == 3 and img.shape[2] == 3 and img.dtype == np.uint8:
+            # 8-bit BGR image, converted on the tensor side
+            self.pre_process(self.bgr_to_tensor(img))
+            if self.tile_size > 0:
+                self.tile_process()
+            else:
+                self.process()
+            output = self.tensor_to_bgr(self.post_process())[0]
+            if outscale is not None and outscale != float(self.scale):
+                output = cv2.resize(
+                    output, (
+                        int(w_input * outscale),
+                        int(h_input * outscale),
+                    ), interpolation=cv2.INTER_LANCZOS4)
+            return output, 'RGB'
+
         # img: numpy
         img = img.astype(np.float32)
         if np.max(img) > 256:  # 16-bit image
@@ -209,20 +350,27 @@ class RealESRGANer():
             alpha = img[:, :, 3]
             img = img[:, :, 0:3]
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            if alpha_upsampler == 'realesrgan':
+            if alpha_upsampler in ('realesrgan', 'batched'):
                 alpha = cv2.cvtColor(alpha, cv2.COLOR_GRAY2RGB)
         else:
             img_mode = 'RGB'
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
         # ------------------- process image (without the alpha channel) ------------------- #
-        self.pre_process(img)
+        batched_alpha = img_mode == 'RGBA' and alpha_upsampler == 'batched'
+        # the alpha channel is the second image of the batch
+        self.pre_process(np.stack([img, alpha]) if batched_alpha else img)
         if self.tile_size > 0:
             self.tile_process()
         else:
             self.process()
         output_img = self.post_process()
-        output_img = output_img.data.squeeze().float().cpu().clamp_(0, 1).numpy()
+        output_img = output_img.data.float().cpu().clamp_(0, 1).numpy()
+        if batched_alpha:
+            output_img, output_alpha = output_img
+            output_alpha = cv2.cvtColor(np.transpose(output_alpha[[2, 1, 0], :, :], (1, 2, 0)), cv2.COLOR_BGR2GRAY)
+        else:
+            output_img = output_img[0]
         output_img = np.transpose(output_img[[2, 1, 0], :, :], (1, 2, 0))
         if img_mode == 'L':
             output_img = cv2.cvtColor(output_img, cv2.COLOR_BGR2GRAY)
@@ -239,7 +387,9 @@ class RealESRGANer():
                 output_alpha = output_alpha.data.squeeze().float().cpu().clamp_(0, 1).numpy()
                 output_alpha = np.transpose(output_alpha[[2, 1, 0], :, :], (1, 2, 0))
                 output_alpha = cv2.cvtColor(output_alpha, cv2.COLOR_BGR2GRAY)
-            else:  # use the cv2 resize for alpha channel
+            elif alpha_upsampler == 'guided':
+                output_alpha = self.guided_upsample(alpha, img, output_img)
+            elif not batched_alpha:  # use the cv2 resize for alpha channel
                 h, w = alpha.shape[0:2]
                 output_alpha = cv2.resize(alpha, (w * self.scale, h * self.scale), interpolation=cv2.INTER_LINEAR)
 
@@ -262,6 +412,49 @@ class RealESRGANer():
 
         return output, img_mode
 
+    @torch.no_grad()
+    def enhance_batch(self, imgs, outscale=None, max_batch=8, alpha_upsampler='realesrgan'):
+        """Upscale a list of images, returns a list of (output, img_mode) in the same order.
+
+        8-bit BGR images of the same size are stacked into one NCHW batch (at most max_batch per forward pass).
+        Gray, RGBA and 16-bit images go through enhance one by one, RGBA ones with alpha_upsampler.
+        """
+        results = [None] * len(imgs)
+        groups = {}
+        for index, img in enumerate(imgs):
+            if img.ndim == 3 and img.shape[2] == 3 and img.dtype == np.uint8:
+                groups.setdefault(img.shape, []).append(index)
+            else:
+                results[index] = self.enhance(img, outscale=outscale, alpha_upsampler=alpha_upsampler)
+
+        for (h_input, w_input, _), indices in groups.items():
+            for start in range(0, len(indices), max_batch):
+                batch_indices = indices[start:start + max_batch]
+                if self.tensor_io:
+                    self.pre_process(self.bgr_to_tensor(np.stack([imgs[index] for index in batch_indices])))
+                else:
+                    batch = np.stack([cv2.cvtColor(imgs[index], cv2.COLOR_BGR2RGB) for index in batch_indices])
+                    self.pre_process(batch.astype(np.float32) / 255)
+                if self.tile_size > 0:
+                    self.tile_process()
+                else:
+                    self.process()
+                if self.tensor_io:
+                    output_batch = self.tensor_to_bgr(self.post_process())
+                else:
+                    output_batch = self.post_process().data.float().cpu().clamp_(0, 1).numpy()
+                    output_batch = [(np.transpose(output_img[[2, 1, 0], :, :], (1, 2, 0)) * 255.0).round().astype(np.uint8)
+                                    for output_img in output_batch]
+                for index, output in zip(batch_indices, output_batch):
+                    if outscale is not None and outscale != float(self.scale):
+                        output = cv2.resize(
+                            output, (
+                                int(w_input * outscale),
+                                int(h_input * outscale),
+                            ), interpolation=cv2.INTER_LANCZOS4)
+                    results[index] = (output, 'RGB')
+        return results
+
 
 class PrefetchReader(threading.Thread):
     """Prefetch images.
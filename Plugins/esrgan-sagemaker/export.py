@@ -0,0 +1,50 @@
+import os
+import sys
+import argparse
+import torch
+
+# plugin code and shared plugin code, as laid out by deploy.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "code"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from basicsr.archs.rrdbnet_arch import RRDBNet
+from realesrgan.realesrgan.archs.srvgg_arch import SRVGGNetCompact
+from upscale_common.export import export_traced, traced_path
+
+# networks of the Real-ESRGAN weights, by file name
+ARCHS = {
+    'RealESRGAN_x4plus': lambda: RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4),
+    'realesr-general-x4v3': lambda: SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=32, upscale=4, act_type='prelu'),
+    'realesr-animevideov3': lambda: SRVGGNetCompact(num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type='prelu'),
+}
+# the convolutional networks trace to a graph that holds for any input size, checked on a second size
+TRACE_SIZE = (64, 64)
+CHECK_SIZE = (48, 80)
+
+def load_model(model_path):
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    if name not in ARCHS:
+        raise ValueError(f"Unknown weights {name}, expected one of {', '.join(ARCHS)}")
+    model = ARCHS[name]()
+    loadnet = torch.load(model_path, map_location=torch.device('cpu'))
+    # prefer to use params_ema, like RealESRGANer
+    model.load_state_dict(loadnet['params_ema'] if 'params_ema' in loadnet else loadnet['params'], strict=True)
+    return model.eval()
+
+def main():
+    parser = argparse.ArgumentParser(description="Traces the Real-ESRGAN models to TorchScript, saved next to the weights")
+    parser.add_argument('weights', nargs='*', default=['RealESRGAN_x4plus.pth'])
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help="device of the endpoint, the traced model is loaded on it")
+    args = parser.parse_args()
+    device = torch.device(args.device)
+    for model_path in args.weights:
+        model = load_model(model_path).to(device)
+        path = traced_path(model_path)
+        traced = export_traced(model, torch.rand(1, 3, *TRACE_SIZE, device=device), path)
+        with torch.no_grad():
+            check = torch.rand(1, 3, *CHECK_SIZE, device=device)
+            diff = (traced(check) - model(check)).abs().max().item()
+        print(f"{model_path} -> {path}, max difference to the eager model {diff:.2e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import os
+import glob
+import copy
+import argparse
+import numpy as np
+import cv2
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+# networks and weights loading of export.py, next to this file
+from export import load_model
+from upscale_common.export import quantized_path
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+# sample images of the test bench, not included in the repository, the plugin test frames otherwise
+SAMPLE_IMAGES = os.path.join(PLUGIN_DIR, "..", "..", "Resources", "SampleImages")
+TEST_FRAMES = os.path.join(PLUGIN_DIR, "test", "SD", "frames")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def find_images(directory):
+    return sorted(path for path in glob.glob(os.path.join(directory, "**", "*"), recursive=True)
+                  if path.lower().endswith(IMAGE_EXTENSIONS))
+
+def calibration_crops(paths, count, size, seed=0):
+    """count random size x size crops of the images as NCHW-RGB tensors in [0, 1], spread over the images"""
+    rng = np.random.default_rng(seed)
+    crops = []
+    for index in range(count):
+        img = cv2.imread(paths[index % len(paths)], cv2.IMREAD_COLOR)
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.
+        height, width = img.shape[:2]
+        crop_height, crop_width = min(size, height), min(size, width)
+        top = rng.integers(0, height - crop_height + 1)
+        left = rng.integers(0, width - crop_width + 1)
+        crop = img[top:top + crop_height, left:left + crop_width]
+        crops.append(torch.from_numpy(np.ascontiguousarray(np.transpose(crop, (2, 0, 1)))).unsqueeze(0))
+    return crops
+
+def quantize(model, crops, backend, float_layers):
+    """Static int8 post training quantization: per channel int8 weights, activations calibrated on the crops"""
+    torch.backends.quantized.engine = backend
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    for name in float_layers:
+        qconfig_mapping = qconfig_mapping.set_module_name(name, None)
+    prepared = prepare_fx(copy.deepcopy(model), qconfig_mapping, (crops[0],))
+    with torch.no_grad():
+        for crop in crops:
+            prepared(crop)
+    return convert_fx(prepared)
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantizes the Real-ESRGAN models to int8 for CPU endpoints, saved next to the weights")
+    parser.add_argument('weights', nargs='*', default=['RealESRGAN_x4plus.pth'])
+    parser.add_argument('--calibration', default=SAMPLE_IMAGES, help="directory of the calibration images (jpg, jpeg, png)")
+    parser.add_argument('--crops', type=int, default=32, help="number of calibration crops")
+    parser.add_argument('--crop-size', type=int, default=64)
+    parser.add_argument('--backend', default='x86', choices=['x86', 'fbgemm', 'qnnpack'],
+                        help="quantized engine of the endpoint CPU, qnnpack for ARM (Graviton)")
+    parser.add_argument('--float-layers', default='',
+                        help="comma separated layers kept in fp32, e.g. conv_first,conv_last of RRDBNet for quality")
+    args = parser.parse_args()
+    paths = find_images(args.calibration)
+    if not paths:
+        print(f"No images in {args.calibration}, calibrating on the plugin test frames")
+        paths = find_images(TEST_FRAMES)
+    crops = calibration_crops(paths, args.crops, args.crop_size)
+    float_layers = [name for name in args.float_layers.split(',') if name]
+    for model_path in args.weights:
+        model = load_model(model_path)
+        quantized = quantize(model, crops, args.backend, float_layers)
+        path = quantized_path(model_path)
+        with torch.no_grad():
+            # the quantized convolutions trace to a graph that holds for any input size, like the fp32 ones
+            torch.jit.save(torch.jit.trace(quantized, crops[0]), path)
+        print(f"{model_path} -> {path}, calibrated on {len(crops)} crops of {len(paths)} images")
+
+if __name__ == '__main__':
+    main()
@@ -5,18 +5,38 @@ from pathlib import Path
 import numpy as np
 import cv2
 import os
+import sys
 import base64
+import functools
 
 from swinir.load_model import define_model
 
+# shared plugin code, deploy.py copies it next to this file
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+from upscale_common.batching import MicroBatcher, DYNAMIC_BATCHING, bucket_key, pad_to_common
+from upscale_common.tiling import AutoTiler, AUTO_TILING
+from upscale_common.export import USE_TORCHSCRIPT, WARMUP_SIZES, TracedShapes, load_traced, parse_sizes, traced_sizes, warmup
+from upscale_common.precision import PRECISION, CHANNELS_LAST, autocast, configure_threads, memory_format, resolve_precision
+
 # SwinIR configuration
 scale_factor = 4
 window_size = 8
 
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 swinir_model_name = 'Swin2SR_RealworldSR_X4_64_BSRGAN_PSNR.pth'
+# largest number of same sized images in one forward pass of a batched request
+max_batch_size = int(os.getenv('MAX_BATCH_SIZE', 8))
+# collects concurrent single image requests when DYNAMIC_BATCHING is set
+batcher = None
+# upscales images too large for the free memory in blended tiles
+tiler = None
+# precision of the requests without one, from PRECISION
+precision = None
 
 def model_fn(model_dir):
+    global precision
+    configure_threads()
+    precision = resolve_precision(PRECISION, device)
     # loads SwinIR model
     swinir_model_path = os.path.join(model_dir, swinir_model_name)
     print(f"========model path: {swinir_model_path} ======")
@@ -26,17 +46,130 @@ def model_fn(model_dir):
     
     swinir_model = swinir_model.to(device)
     swinir_model.eval()
+    swinir_model = eager_model = memory_format(swinir_model, CHANNELS_LAST)
+    sizes = parse_sizes(WARMUP_SIZES)
+    if USE_TORCHSCRIPT:
+        # TorchScript models of export.py, a trace of Swin2SR only holds for the image size it was traced with
+        traced = {}
+        for path, height, width in traced_sizes(swinir_model_path):
+            traced[(1, 3) + padded_size(height, width)] = load_traced(path, device, CHANNELS_LAST)
+            # warmed up too, TorchScript optimizes its graph in the first runs
+            sizes.append((height, width))
+            print(f"========loaded TorchScript model {path} ======")
+        if traced:
+            swinir_model = TracedShapes(swinir_model, traced)
+    try:
+        with torch.no_grad(), autocast(precision, device):
+            warmup(lambda height, width: forward_padded(swinir_model, torch.zeros((1, 3, height, width), device=device)), sizes)
+    except RuntimeError as error:
+        if swinir_model is eager_model:
+            raise
+        # e.g. a model traced on another device
+        print('Warm-up of the TorchScript models failed, using the eager model:', error)
+        swinir_model = eager_model
+    global batcher, tiler
+    if AUTO_TILING:
+        # tiles are a multiple of the attention window, so they need no padding
+        tiler = AutoTiler(functools.partial(forward_padded, swinir_model), scale_factor, device, align=window_size,
+                          tile_forward=functools.partial(forward_padded, swinir_model, pad_aligned=False))
+    if DYNAMIC_BATCHING:
+        # items are (image, precision), requests in another precision never share a batch
+        batcher = MicroBatcher(functools.partial(upscale_padded, swinir_model), max_batch_size,
+                               key=lambda item: (item[1],) + bucket_key(*item[0].shape[1:]))
     return swinir_model
 
+def upscale_padded(model, items):
+    # the images of a batch are in the same size bucket, they are padded to one size and cropped back after the forward pass
+    padded, sizes = pad_to_common([img for img, _ in items], axes=(1, 2))
+    # autocast is thread local, so it is entered in the batcher thread
+    with torch.no_grad(), autocast(items[0][1], device):
+        outputs = upscale_batch(torch.from_numpy(np.stack(padded)).to(device), model)
+    return [output[:, :h * scale_factor, :w * scale_factor] for output, (h, w) in zip(outputs, sizes)]
+
 def input_fn(request_body, request_content_type):
     print("Received input request.")
     if "application/json" in request_content_type:
-        data = json.loads(request_body)
-        return data['image']
+        # {"images": [...]} is upscaled as a batch, {"image": ...} keeps the single image response,
+        # both with an optional "precision" (fp32, bf16, fp16, auto)
+        return json.loads(request_body)
     raise ValueError("Unsupported content type: {}".format(request_content_type))
 
+def decode_image(input_data):
+    nparr = np.frombuffer(base64.b64decode(input_data.encode("ascii")), np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR).astype(np.float32) / 255.
+    return np.transpose(img if img.shape[2] == 1 else img[:, :, [2, 1, 0]], (2, 0, 1))  # HCW-BGR to CHW-RGB
+
+def encode_image(output):
+    if output.ndim == 3:
+        output = np.transpose(output[[2, 1, 0], :, :], (1, 2, 0))  # CHW-RGB to HCW-BGR
+    output = (output * 255.0).round().astype(np.uint8)  # float32 to uint8
+    _, im_arr = cv2.imencode('.jpg', output)
+    return base64.b64encode(im_arr.tobytes()).decode('utf-8')
+
+def padded_size(h_old, w_old, pad_aligned=True):
+    # input size of the model for an image, a multiple of window_size, pad_aligned adds a window to an image that already is one
+    h_pad = (h_old // window_size + 1) * window_size - h_old
+    w_pad = (w_old // window_size + 1) * window_size - w_old
+    if not pad_aligned:
+        h_pad %= window_size
+        w_pad %= window_size
+    return h_old + h_pad, w_old + w_pad
+
+def forward_padded(model, img, pad_aligned=True):
+    # pad NCHW input to be a multiple of window_size
+    _, _, h_old, w_old = img.size()
+    h_new, w_new = padded_size(h_old, w_old, pad_aligned)
+    img = torch.cat([img, torch.flip(img, [2])], 2)[:, :, :h_new, :]
+    img = torch.cat([img, torch.flip(img, [3])], 3)[:, :, :, :w_new]
+    output = model(img)
+    return output[..., :h_old * scale_factor, :w_old * scale_factor]
+
+def upscale_batch(img, model):
+    output = tiler(img) if tiler is not None else forward_padded(model, img)
+    return output.data.float().cpu().clamp_(0, 1).numpy()
+
+def predict_batch(input_data, model, precision):
+    print(f"Received batch predict request of {len(input_data)} images.")
+    data = [""] * len(input_data)
+    try:
+        imgs = [decode_image(image) for image in input_data]
+        if batcher is not None:
+            return [encode_image(output) for output in batcher.submit_many([(img, precision) for img in imgs])]
+        # same sized images share a forward pass
+        groups = {}
+        for index, img in enumerate(imgs):
+            groups.setdefault(img.shape, []).append(index)
+        with torch.no_grad(), autocast(precision, device):
+            for shape, indices in groups.items():
+                for start in range(0, len(indices), max_batch_size):
+                    batch_indices = indices[start:start + max_batch_size]
+                    batch = torch.from_numpy(np.stack([imgs[index] for index in batch_indices])).to(device)
+                    print(f"==========================batch input size: {batch.shape} ======================")
+                    for index, output in zip(batch_indices, upscale_batch(batch, model)):
+                        data[index] = encode_image(output)
+        torch.cuda.empty_cache()
+    except RuntimeError as error:
+        print('Error', error)
+        print('If you encounter CUDA out of memory, try a smaller MAX_BATCH_SIZE.')
+    except Exception as error:
+        print('Error', error)
+    return data
+
 def predict_fn(input_data, model):
-    print("Received predict request.")
+    request_precision = precision
+    if isinstance(input_data, dict):
+        # payload of input_fn, local callers pass the base64 image (or a list of them) directly
+        request_precision = resolve_precision(input_data.get('precision', precision), device)
+        input_data = input_data['images'] if 'images' in input_data else input_data['image']
+    if isinstance(input_data, list):
+        return predict_batch(input_data, model, request_precision)
+    print(f"Received predict request, precision {request_precision}.")
+    if batcher is not None:
+        try:
+            return encode_image(batcher.submit((decode_image(input_data), request_precision)))
+        except Exception as error:
+            print('Error', error)
+            return ""
     image_bytes = input_data.encode("ascii")
     nparr = np.frombuffer(base64.b64decode(image_bytes), np.uint8)
     img = cv2.imdecode(nparr, cv2.IMREAD_COLOR).astype(np.float32) / 255.
@@ -46,25 +179,9 @@ def predict_fn(input_data, model):
 
     try:
         print("Performing inference.")
-        with torch.no_grad():
-            # pad input image to be a multiple of window_size
-            _, _, h_old, w_old = img.size()
-            h_pad = (h_old // window_size + 1) * window_size - h_old
-            w_pad = (w_old // window_size + 1) * window_size - w_old
-            img = torch.cat([img, torch.flip(img, [2])], 2)[:, :, :h_old + h_pad, :]
-            img = torch.cat([img, torch.flip(img, [3])], 3)[:, :, :, :w_old + w_pad]
+        with torch.no_grad(), autocast(request_precision, device):
             print(f"==========================image input size: {img.shape} ======================")
-            output = model(img)
-            output = output[..., :h_old * scale_factor, :w_old * scale_factor]
-
-            output = output.data.squeeze().float().cpu().clamp_(0, 1).numpy()
-            if output.ndim == 3:
-                output = np.transpose(output[[2, 1, 0], :, :], (1, 2, 0))  # CHW-RGB to HCW-BGR
-            output = (output * 255.0).round().astype(np.uint8)  # float32 to uint8
-            _, im_arr = cv2.imencode('.jpg', output)  # im_arr: image in Numpy one-dim array format.
-            im_bytes = im_arr.tobytes()
-            im_b64 = base64.b64encode(im_bytes)
-            data = im_b64.decode('utf-8')
+            data = encode_image(upscale_batch(img, model)[0])
             torch.cuda.empty_cache()
             print(f'torch cache cleared')
     except RuntimeError as error:
@@ -76,4 +193,6 @@ def predict_fn(input_data, model):
     return data
 
 def output_fn(prediction, content_type):
-    return json.dumps({"generated_images": [prediction], "prompt":""}), content_type
+    # a batch prediction is already a list, in the order of the request
+    generated_images = prediction if isinstance(prediction, list) else [prediction]
+    return json.dumps({"generated_images": generated_images, "prompt":""}), content_type
@@ -4,6 +4,8 @@
 # -----------------------------------------------------------------------------------
 
 import math
+import collections
+import threading
 import numpy as np
 import torch
 import torch.nn as nn
@@ -11,6 +13,14 @@ import torch.nn.functional as F
 import torch.utils.checkpoint as checkpoint
 from timm.models.layers import DropPath, to_2tuple, trunc_normal_
 
+# cache the shifted window attention masks per resolution and the relative position bias in eval mode,
+# False recomputes them on every forward pass
+ATTENTION_CACHE = True
+# resolutions kept in the attention mask cache, a mask takes H*W*window_size**2*4 bytes
+ATTENTION_MASK_CACHE_SIZE = 4
+_attention_masks = collections.OrderedDict()
+_attention_masks_lock = threading.Lock()
+
 
 class Mlp(nn.Module):
     def __init__(self, in_features, hidden_features=None, out_features=None, act_layer=nn.GELU, drop=0.):
@@ -131,6 +141,30 @@ class WindowAttention(nn.Module):
         self.proj = nn.Linear(dim, dim)
         self.proj_drop = nn.Dropout(proj_drop)
         self.softmax = nn.Softmax(dim=-1)
+        # (key, bias) of the last relative position bias computed in eval mode
+        self._bias_cache = None
+
+    def relative_position_bias(self):
+        """16 * sigmoid of the continuous relative position bias, nH, Wh*Ww, Wh*Ww.
+        It only depends on the weights of cpb_mlp, so in eval mode without gradients it is computed once and
+        reused until a parameter is replaced or modified in place (load_state_dict, .to(), .half()).
+        It is computed outside autocast, in the dtype of the weights, so the cached bias does not depend on the
+        precision of the request that filled the cache (the attention logits it is added to are fp32 anyway)."""
+        cacheable = ATTENTION_CACHE and not self.training and not torch.is_grad_enabled()
+        if cacheable:
+            key = tuple((p.data_ptr(), p._version) for p in self.cpb_mlp.parameters()) + \
+                  (self.relative_coords_table.data_ptr(), self.relative_coords_table._version)
+            if self._bias_cache is not None and self._bias_cache[0] == key:
+                return self._bias_cache[1]
+        with torch.autocast(self.relative_coords_table.device.type, enabled=False):
+            relative_position_bias_table = self.cpb_mlp(self.relative_coords_table).view(-1, self.num_heads)
+        relative_position_bias = relative_position_bias_table[self.relative_position_index.view(-1)].view(
+            self.window_size[0] * self.window_size[1], self.window_size[0] * self.window_size[1], -1)  # Wh*Ww,Wh*Ww,nH
+        relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
+        relative_position_bias = 16 * torch.sigmoid(relative_position_bias)
+        if cacheable:
+            self._bias_cache = (key, relative_position_bias)
+        return relative_position_bias
 
     def forward(self, x, mask=None):
         """
@@ -151,12 +185,7 @@ class WindowAttention(nn.Module):
         logit_scale = torch.clamp(self.logit_scale, max=torch.log(torch.tensor(1. / 0.01)).to(self.logit_scale.device)).exp()
         attn = attn * logit_scale
 
-        relative_position_bias_table = self.cpb_mlp(self.relative_coords_table).view(-1, self.num_heads)
-        relative_position_bias = relative_position_bias_table[self.relative_position_index.view(-1)].view(
-            self.window_size[0] * self.window_size[1], self.window_size[0] * self.window_size[1], -1)  # Wh*Ww,Wh*Ww,nH
-        relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
-        relative_position_bias = 16 * torch.sigmoid(relative_position_bias)
-        attn = attn + relative_position_bias.unsqueeze(0)
+        attn = attn + self.relative_position_bias().unsqueeze(0)
 
         if mask is not None:
             nW = mask.shape[0]
@@ -265,6 +294,25 @@ class SwinTransformerBlock(nn.Module):
 
         return attn_mask        
 
+    def mask_for(self, x_size, device):
+        """Attention mask of a resolution, shared by the blocks with the same window and shift"""
+        if self.shift_size == 0:
+            # without a shift every window is contiguous, the mask would be all zeros
+            return None
+        if not ATTENTION_CACHE:
+            return self.calculate_mask(x_size).to(device)
+        key = (tuple(x_size), self.window_size, self.shift_size, str(device))
+        with _attention_masks_lock:
+            mask = _attention_masks.get(key)
+            if mask is None:
+                mask = self.calculate_mask(x_size).to(device)
+                _attention_masks[key] = mask
+                while len(_attention_masks) > ATTENTION_MASK_CACHE_SIZE:
+                    _attention_masks.popitem(last=False)
+            else:
+                _attention_masks.move_to_end(key)
+        return mask
+
     def forward(self, x, x_size):
         H, W = x_size
         B, L, C = x.shape
@@ -287,7 +335,7 @@ class SwinTransformerBlock(nn.Module):
         if self.input_resolution == x_size:
             attn_windows = self.attn(x_windows, mask=self.attn_mask)  # nW*B, window_size*window_size, C
         else:
-            attn_windows = self.attn(x_windows, mask=self.calculate_mask(x_size).to(x.device))
+            attn_windows = self.attn(x_windows, mask=self.mask_for(x_size, x.device))
             
         # merge windows
         attn_windows = attn_windows.view(-1, self.window_size, self.window_size, C)
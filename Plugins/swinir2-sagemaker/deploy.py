@@ -12,6 +12,8 @@ pytorch_model = PyTorchModel(
                              source_dir="./code/", 
                              role=role,
                              entry_point="inference.py",
+                             # shared plugin code (dynamic batching), copied next to inference.py
+                             dependencies=["../common/upscale_common"],
                              image_uri=f"763104351884.dkr.ecr.{region}.amazonaws.com/pytorch-inference:2.0.0-gpu-py310-cu118-ubuntu20.04-sagemaker")
 
 predictor = pytorch_model.deploy(instance_type='ml.g4dn.xlarge', initial_instance_count=1)
@@ -0,0 +1,32 @@
+import os
+import sys
+import argparse
+import torch
+
+# plugin code (inference.py adds the shared plugin code), as laid out by deploy.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "code"))
+import inference
+from swinir.load_model import define_model
+from upscale_common.export import export_traced, parse_sizes, traced_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Traces the Swin2SR model to TorchScript for each image size, saved next to the weights")
+    parser.add_argument('weights', nargs='?', default=inference.swinir_model_name)
+    # the window attention masks are traced for one input size, so there is one model per image size
+    parser.add_argument('--sizes', default='640x360,1280x720', help="image sizes to trace, comma separated WIDTHxHEIGHT")
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu',
+                        help="device of the endpoint, the traced models are loaded on it")
+    args = parser.parse_args()
+    device = torch.device(args.device)
+    model = define_model(args.weights, "real_sr", inference.scale_factor).to(device).eval()
+    for height, width in parse_sizes(args.sizes):
+        # traced on the padded input forward_padded gives the model, in the batch of 1 of a single image request
+        path = traced_path(args.weights, height, width)
+        example = torch.rand(1, 3, *inference.padded_size(height, width), device=device)
+        traced = export_traced(model, example, path)
+        with torch.no_grad():
+            diff = (traced(example) - model(example)).abs().max().item()
+        print(f"{width}x{height} -> {path}, max difference to the eager model {diff:.2e}")
+
+if __name__ == '__main__':
+    main()
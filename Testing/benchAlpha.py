@@ -0,0 +1,113 @@
+"""
+File: benchAlpha.py
+Description: This is a quality vs speed report of the alpha channel upscaling modes of the esrgan plugin
+(ALPHA_UPSAMPLER, Plugins/esrgan-sagemaker/code/realesrgan/realesrgan/utils.py).
+It compares the second model pass of Real-ESRGAN with the batched, guided and resize modes on transparent PNGs.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    This file loads the esrgan plugin model in process and takes a center crop of IMAGE_SIZE of every PNG with an
+    alpha channel of the sample directory (Resources/SampleImages by default). When there is none, it makes
+    cutouts of the plugin test frames: a soft alpha keyed on their luminance, whose edges follow the image edges.
+    Each crop is downscaled x4 and upscaled back with every alpha mode. For every image and mode it prints the
+    latency, the PSNR of the alpha channel against the original alpha (the ground truth) and against the alpha of
+    the realesrgan mode, then the means per mode. The color channels are the same in every mode.
+
+    Usage: python benchAlpha.py [model dir with the .pth weights] [sample images dir]
+"""
+import io
+import os
+import sys
+import glob
+import time
+import contextlib
+import importlib.util
+import numpy as np
+import cv2
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Plugins", "esrgan-sagemaker")
+SAMPLE_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Resources", "SampleImages")
+TEST_FRAMES = os.path.join(PLUGIN_DIR, "test", "SD", "frames")
+MODES = ['realesrgan', 'batched', 'guided', 'resize']
+IMAGE_SIZE = (256, 384)
+SCALE = 4
+RUNS = 2
+
+def load_plugin(model_dir):
+    code_dir = os.path.join(PLUGIN_DIR, "code")
+    if code_dir not in sys.path:
+        sys.path.insert(0, code_dir)
+    spec = importlib.util.spec_from_file_location("bench_esrgan_inference", os.path.join(code_dir, "inference.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.WARMUP_SIZES = ""
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = module.model_fn(model_dir)
+    return model['realesr_gan']
+
+def center_crop(img):
+    height, width = min(IMAGE_SIZE[0], img.shape[0]), min(IMAGE_SIZE[1], img.shape[1])
+    height, width = height - height % SCALE, width - width % SCALE
+    top, left = (img.shape[0] - height) // 2, (img.shape[1] - width) // 2
+    return img[top:top + height, left:left + width]
+
+def load_images(directory):
+    """[(name, BGRA uint8 crop)] of the transparent PNGs, cutouts of the test frames when there is none"""
+    images = []
+    for path in sorted(glob.glob(os.path.join(directory, "**", "*.png"), recursive=True)):
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if img is not None and img.dtype == np.uint8 and img.ndim == 3 and img.shape[2] == 4 and img[:, :, 3].min() < 255:
+            images.append((os.path.basename(path), center_crop(img)))
+    if images:
+        return images
+    for path in sorted(glob.glob(os.path.join(TEST_FRAMES, "*.png"))):
+        img = center_crop(cv2.imread(path, cv2.IMREAD_COLOR))
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        alpha = cv2.GaussianBlur(np.where(gray > np.median(gray), 255, 0).astype(np.uint8), (3, 3), 0)
+        images.append((f"{os.path.basename(path)} cutout", np.dstack([img, alpha])))
+    return images
+
+def upscale(upsampler, img, mode):
+    # first run warms up the size
+    with contextlib.redirect_stdout(io.StringIO()):
+        output, _ = upsampler.enhance(img, outscale=SCALE, alpha_upsampler=mode)
+        start = time.perf_counter()
+        for _ in range(RUNS):
+            upsampler.enhance(img, outscale=SCALE, alpha_upsampler=mode)
+    return (time.perf_counter() - start) / RUNS * 1000, output[:, :, 3].astype(np.float32)
+
+def psnr(reference, output):
+    mse = np.mean((reference - output) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+def main():
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else PLUGIN_DIR
+    images = load_images(sys.argv[2] if len(sys.argv) > 2 else SAMPLE_IMAGES)
+    upsampler = load_plugin(model_dir)
+    height, width = IMAGE_SIZE
+    print(f"esrgan alpha modes, {width}x{height} crops downscaled and upscaled x{SCALE}, mean of {RUNS} runs")
+    print(f"{'image':<28} {'mode':<11} {'ms':>9} {'PSNR vs original':>17} {'PSNR vs realesrgan':>19}")
+    rows = {mode: [] for mode in MODES}
+    for name, img in images:
+        original = img[:, :, 3].astype(np.float32)
+        small = cv2.resize(img, (img.shape[1] // SCALE, img.shape[0] // SCALE), interpolation=cv2.INTER_AREA)
+        reference = None
+        for mode in MODES:
+            latency, alpha = upscale(upsampler, small, mode)
+            if reference is None:
+                reference = alpha
+            rows[mode].append((latency, psnr(original, alpha), psnr(reference, alpha)))
+            print(f"{name[:28]:<28} {mode:<11} {latency:>9.1f} {rows[mode][-1][1]:>17.2f} {rows[mode][-1][2]:>19.2f}")
+    for mode in MODES:
+        latency, original_psnr, reference_psnr = np.mean(rows[mode], axis=0)
+        print(f"{'mean':<28} {mode:<11} {latency:>9.1f} {original_psnr:>17.2f} {reference_psnr:>19.2f}")
+
+if __name__ == '__main__':
+    main()
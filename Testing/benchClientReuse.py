@@ -0,0 +1,125 @@
+"""
+File: benchClientReuse.py
+Description: This is a micro-benchmark for the boto3 client registry in API/AwsClients.py.
+It measures the per-request overhead of creating new boto3 clients against reusing pooled clients.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    This file starts a local S3/SageMaker stand-in on 127.0.0.1 and runs the same S3 get_object and
+    SageMaker invoke_endpoint calls that a /retrieve request makes, first creating new clients for
+    every request (the old behaviour) and then drawing them from the registry.
+    No AWS account is needed. The stand-in speaks plain HTTP so TLS handshake savings are not included,
+    the real savings against AWS are larger than what is reported here.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import statistics
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# the registry lives in the API directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "API"))
+
+ITERATIONS = 200
+BUCKET = "bench-bucket"
+KEY = "bench.jpg"
+ENDPOINT = "bench-endpoint"
+PAYLOAD = b"\xff\xd8" + os.urandom(16 * 1024)
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, without this keep-alive connections stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _drain(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+
+    def do_GET(self):
+        # S3 get_object
+        self._reply(PAYLOAD, "image/jpeg")
+
+    def do_PUT(self):
+        # S3 put_object
+        self._drain()
+        self._reply(b"", "application/xml")
+
+    def do_POST(self):
+        # SageMaker invoke_endpoint
+        self._drain()
+        body = json.dumps({"generated_images": [""], "prompt": ""}).encode("utf-8")
+        self._reply(body, "application/json")
+
+def start_stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def request_with_new_clients():
+    import boto3
+    s3_client = boto3.client('s3')
+    s3_client.get_object(Bucket=BUCKET, Key=KEY)['Body'].read()
+    sageMakerClient = boto3.client('runtime.sagemaker')
+    sageMakerClient.invoke_endpoint(EndpointName=ENDPOINT, ContentType='application/json', Body=b"{}", Accept='application/json')['Body'].read()
+
+def request_with_registry():
+    from AwsClients import get_client
+    s3_client = get_client('s3')
+    s3_client.get_object(Bucket=BUCKET, Key=KEY)['Body'].read()
+    sageMakerClient = get_client('runtime.sagemaker')
+    sageMakerClient.invoke_endpoint(EndpointName=ENDPOINT, ContentType='application/json', Body=b"{}", Accept='application/json')['Body'].read()
+
+def run(name, fn):
+    # first call is excluded, it pays the one off cost of loading the service models
+    fn()
+    timings = []
+    for i in range(ITERATIONS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    result = {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95)],
+    }
+    print(f"{name:<14} mean {result['mean_ms']:.2f} ms  p50 {result['p50_ms']:.2f} ms  p95 {result['p95_ms']:.2f} ms")
+    return result
+
+def main():
+    server = start_stand_in()
+    host, port = server.server_address
+    os.environ["AWS_ENDPOINT_URL"] = f"http://{host}:{port}"
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    print(f"Running {ITERATIONS} requests (S3 get_object + SageMaker invoke_endpoint) against {os.environ['AWS_ENDPOINT_URL']}")
+    before = run("new clients", request_with_new_clients)
+    after = run("registry", request_with_registry)
+    print(f"Per-request overhead saved: {before['mean_ms'] - after['mean_ms']:.2f} ms ({before['mean_ms'] / after['mean_ms']:.1f}x faster)")
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
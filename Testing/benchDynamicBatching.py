@@ -0,0 +1,119 @@
+"""
+File: benchDynamicBatching.py
+Description: This is a benchmark of the dynamic batching of the plugin models (Plugins/common/upscale_common/batching.py).
+It compares one forward pass per request with the micro-batcher for several client concurrencies and batch latencies.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    This file loads a plugin model in process (like the localEsrgan/localSwinir providers of the API) and sends
+    small images to its predict_fn from 1 to 8 client threads. Without batching the requests run one at a time,
+    as in a TorchServe worker. With batching the concurrent requests go through the MicroBatcher for every
+    BATCH_MAX_LATENCY_MS in LATENCIES. The throughput and the p50/p95 latency of every run are printed,
+    so the throughput vs latency curve of each setting can be read from the table. It runs on CPU.
+
+    Usage: python benchDynamicBatching.py [esrgan|swinir] [model dir with the .pth weights]
+"""
+import io
+import os
+import sys
+import time
+import base64
+import threading
+import contextlib
+import importlib.util
+import concurrent.futures
+import numpy as np
+from PIL import Image
+
+# the batcher is created by model_fn when this is set
+os.environ['DYNAMIC_BATCHING'] = 'true'
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Plugins")
+PLUGINS = {"esrgan": "esrgan-sagemaker", "swinir": "swinir2-sagemaker"}
+IMAGE_SIZE = 48
+REQUESTS_PER_THREAD = 6
+CONCURRENCIES = [1, 2, 4, 8]
+LATENCIES = [0, 5, 20]
+
+def load_plugin(name, model_dir):
+    code_dir = os.path.join(PLUGINS_DIR, PLUGINS[name], "code")
+    sys.path.insert(0, code_dir)
+    spec = importlib.util.spec_from_file_location(f"bench_{name}_inference", os.path.join(code_dir, "inference.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = module.model_fn(model_dir)
+    return module, model
+
+def get_batcher(module, model):
+    return model.get('batcher') if isinstance(model, dict) else module.batcher
+
+def set_batcher(module, model, batcher):
+    if isinstance(model, dict):
+        if batcher is None:
+            model.pop('batcher', None)
+        else:
+            model['batcher'] = batcher
+    else:
+        module.batcher = batcher
+
+def make_image(seed):
+    pixels = np.random.default_rng(seed).integers(0, 255, (IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+    buffered = io.BytesIO()
+    Image.fromarray(pixels).save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode('ascii')
+
+def run(module, model, concurrency, lock=None):
+    images = [make_image(seed) for seed in range(concurrency * REQUESTS_PER_THREAD)]
+    latencies = []
+
+    def client(thread):
+        for image in images[thread::concurrency]:
+            start = time.perf_counter()
+            if lock is None:
+                module.predict_fn(image, model)
+            else:
+                with lock:
+                    module.predict_fn(image, model)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(client, range(concurrency)))
+    total = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return len(images) / total, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "esrgan"
+    model_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(PLUGINS_DIR, PLUGINS[name])
+    module, model = load_plugin(name, model_dir)
+    batcher = get_batcher(module, model)
+    print(f"{name} on {module.device}, {IMAGE_SIZE}x{IMAGE_SIZE} images, max batch {batcher.max_batch_size}")
+    # warm up both paths once
+    run(module, model, 1)
+    print(f"{'mode':<16} {'clients':>7} {'img/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'mean batch':>10}")
+    for concurrency in CONCURRENCIES:
+        set_batcher(module, model, None)
+        throughput, p50, p95 = run(module, model, concurrency, threading.Lock())
+        print(f"{'unbatched':<16} {concurrency:>7} {throughput:>8.2f} {p50:>9.1f} {p95:>9.1f} {1:>10.2f}")
+        set_batcher(module, model, batcher)
+        for latency in LATENCIES:
+            batcher.max_latency = latency / 1000
+            batcher.batch_sizes.clear()
+            throughput, p50, p95 = run(module, model, concurrency)
+            batches = sum(batcher.batch_sizes.values())
+            mean_batch = sum(size * count for size, count in batcher.batch_sizes.items()) / batches
+            print(f"{f'batched {latency}ms':<16} {concurrency:>7} {throughput:>8.2f} {p50:>9.1f} {p95:>9.1f} {mean_batch:>10.2f}")
+    batcher.close()
+
+if __name__ == '__main__':
+    main()
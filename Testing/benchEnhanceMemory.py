@@ -0,0 +1,94 @@
+"""
+File: benchEnhanceMemory.py
+Description: This is a peak memory benchmark of the image conversions of RealESRGANer.enhance in the esrgan plugin
+(TENSOR_IO, Plugins/esrgan-sagemaker/code/realesrgan/realesrgan/utils.py).
+It compares the float32 numpy conversions of Real-ESRGAN with the conversions on the tensor side for a 1080p frame.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    This file upscales the plugin test frame resized to IMAGE_SIZE (1080p) once per mode, each mode in its own
+    process since the peak resident memory of a process never goes down. Each process loads the plugin with
+    TENSOR_IO set, warms up on a small image, then upscales the frame and reports the growth of its peak resident
+    memory (ru_maxrss) over the warmed up process and the latency. The model forward passes are tiled within
+    TILE_MEMORY_MB so the difference comes from the conversions of the input and output images. The compact model
+    is used by default to keep the CPU run short; the full model (RealESRGAN_x4plus.pth) gives the same conversions.
+    The outputs of both modes are compared and must be identical.
+
+    Usage: python benchEnhanceMemory.py [model dir with the .pth weights] [full|compact]
+"""
+import io
+import os
+import sys
+import time
+import resource
+import tempfile
+import subprocess
+import contextlib
+import importlib.util
+import numpy as np
+import cv2
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Plugins", "esrgan-sagemaker")
+TEST_IMAGE = os.path.join(PLUGIN_DIR, "test", "SD", "frames", "0001.png")
+IMAGE_SIZE = (1080, 1920)
+TILE_MEMORY_MB = 256
+MODES = {"numpy": "false", "tensor": "true"}
+
+def load_plugin(model_dir):
+    code_dir = os.path.join(PLUGIN_DIR, "code")
+    if code_dir not in sys.path:
+        sys.path.insert(0, code_dir)
+    spec = importlib.util.spec_from_file_location("bench_esrgan_inference", os.path.join(code_dir, "inference.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = module.model_fn(model_dir)
+    return model['realesr_gan']
+
+def measure(model_dir, output_path):
+    """Child process: peak memory growth and latency of one 1080p enhance, the output saved to output_path"""
+    upsampler = load_plugin(model_dir)
+    height, width = IMAGE_SIZE
+    img = cv2.resize(cv2.imread(TEST_IMAGE, cv2.IMREAD_COLOR), (width, height), interpolation=cv2.INTER_CUBIC)
+    with contextlib.redirect_stdout(io.StringIO()):
+        upsampler.enhance(img[:64, :64], outscale=4)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        output, _ = upsampler.enhance(img, outscale=4)
+        latency = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    np.save(output_path, output)
+    # ru_maxrss is in KB on Linux
+    print(f"{(peak - baseline) / 1024:.0f} {latency:.1f}")
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        measure(sys.argv[2], sys.argv[3])
+        return
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else PLUGIN_DIR
+    variant = sys.argv[2] if len(sys.argv) > 2 else "compact"
+    height, width = IMAGE_SIZE
+    print(f"esrgan {variant}, {width}x{height} frame upscaled x4, tiles within {TILE_MEMORY_MB} MB")
+    print(f"{'conversions':<12} {'peak RSS growth MB':>19} {'seconds':>8}")
+    outputs = []
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, tensor_io in MODES.items():
+            output_path = os.path.join(directory, f"{mode}.npy")
+            env = dict(os.environ, TENSOR_IO=tensor_io, DEFAULT_MODEL=variant, TILE_MEMORY_MB=str(TILE_MEMORY_MB),
+                       WARMUP_SIZES="", USE_TORCHSCRIPT="false", DYNAMIC_BATCHING="false")
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", model_dir, output_path],
+                                    env=env, capture_output=True, text=True, check=True)
+            growth, latency = result.stdout.split()[-2:]
+            print(f"{mode:<12} {growth:>19} {latency:>8}")
+            outputs.append(np.load(output_path))
+    print("outputs identical" if np.array_equal(*outputs) else "outputs differ")
+
+if __name__ == '__main__':
+    main()
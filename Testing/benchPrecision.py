@@ -0,0 +1,108 @@
+"""
+File: benchPrecision.py
+Description: This is a benchmark of the precision and memory format modes of the plugin models
+(Plugins/common/upscale_common/precision.py).
+It reports the latency and the PSNR drift against fp32 of every mode, to pick the cheapest acceptable one.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    This file loads a plugin model in process once per memory format (CHANNELS_LAST off and on) and upscales a crop
+    of the plugin test frame in every precision of the device (fp32 and bf16, plus fp16 on a GPU) and for every
+    number of torch threads in THREADS, as the PRECISION setting or the "precision" of a request would.
+    It prints the mean latency of each mode, its speedup over fp32 and the PSNR of its output against the fp32
+    output (inf for identical outputs). bf16 is only fast on CPUs with bf16 instructions (AVX512-BF16, AMX),
+    elsewhere it is emulated and slower than fp32.
+
+    Usage: python benchPrecision.py [esrgan|swinir] [model dir with the .pth weights]
+"""
+import io
+import os
+import sys
+import time
+import contextlib
+import importlib.util
+import numpy as np
+import cv2
+import torch
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Plugins")
+PLUGINS = {"esrgan": "esrgan-sagemaker", "swinir": "swinir2-sagemaker"}
+TEST_IMAGE = os.path.join(PLUGINS_DIR, "esrgan-sagemaker", "test", "SD", "frames", "0001.png")
+IMAGE_SIZE = (64, 96)
+THREADS = sorted({1, os.cpu_count() or 1})
+RUNS = 3
+
+def load_plugin(name, model_dir, channels_last):
+    code_dir = os.path.join(PLUGINS_DIR, PLUGINS[name], "code")
+    if code_dir not in sys.path:
+        sys.path.insert(0, code_dir)
+    spec = importlib.util.spec_from_file_location(f"bench_{name}_inference", os.path.join(code_dir, "inference.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.CHANNELS_LAST = channels_last
+    module.WARMUP_SIZES = ""
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = module.model_fn(model_dir)
+    return module, model
+
+def load_image():
+    # center crop of the test frame, BGR uint8
+    img = cv2.imread(TEST_IMAGE, cv2.IMREAD_COLOR)
+    height, width = IMAGE_SIZE
+    top, left = (img.shape[0] - height) // 2, (img.shape[1] - width) // 2
+    return img[top:top + height, left:left + width]
+
+def upscale(name, module, model, img):
+    """Upscaled img as float32 in [0, 255]"""
+    if name == "esrgan":
+        output, _ = model['realesr_gan'].enhance(img, outscale=module.outscale)
+        return output.astype(np.float32)
+    # HWC-BGR to NCHW-RGB, as decode_image of the plugin
+    tensor = torch.from_numpy(np.transpose(img[:, :, ::-1], (2, 0, 1)).astype(np.float32) / 255.).unsqueeze(0).to(module.device)
+    output = module.upscale_batch(tensor, model)[0]
+    return (np.transpose(output, (1, 2, 0)) * 255.0).round()
+
+def psnr(reference, output):
+    mse = np.mean((reference - output) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+def run(name, module, model, img, precision):
+    with torch.no_grad(), module.autocast(precision, module.device):
+        # first run warms up the mode
+        output = upscale(name, module, model, img)
+        start = time.perf_counter()
+        for _ in range(RUNS):
+            upscale(name, module, model, img)
+    return (time.perf_counter() - start) / RUNS * 1000, output
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "esrgan"
+    model_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(PLUGINS_DIR, PLUGINS[name])
+    img = load_image()
+    precisions = ['fp32', 'bf16'] + (['fp16'] if torch.cuda.is_available() else [])
+    height, width = IMAGE_SIZE
+    print(f"{name}, {width}x{height} crop of {os.path.basename(TEST_IMAGE)}, mean of {RUNS} runs")
+    print(f"{'precision':<10} {'layout':<14} {'threads':>7} {'ms':>9} {'speedup':>8} {'PSNR dB':>8}")
+    reference = baseline = None
+    for channels_last in [False, True]:
+        module, model = load_plugin(name, model_dir, channels_last)
+        layout = "channels_last" if channels_last else "contiguous"
+        for threads in THREADS:
+            torch.set_num_threads(threads)
+            for precision in precisions:
+                latency, output = run(name, module, model, img, precision)
+                if reference is None:
+                    # fp32, contiguous, first thread count
+                    reference, baseline = output, latency
+                print(f"{precision:<10} {layout:<14} {threads:>7} {latency:>9.1f} {baseline / latency:>7.2f}x "
+                      f"{psnr(reference, output):>8.2f}")
+
+if __name__ == '__main__':
+    main()
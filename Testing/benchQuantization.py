@@ -0,0 +1,98 @@
+"""
+File: benchQuantization.py
+Description: This is a quality vs speed report of the int8 models of the esrgan plugin
+(Plugins/esrgan-sagemaker/quantize.py).
+It compares the int8 model against the fp32 model on the sample images.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    This file loads the esrgan plugin model in process twice, fp32 (QUANTIZED=false) and int8 (QUANTIZED=true,
+    with the _int8.ts model made by quantize.py in the model directory), and upscales a center crop of IMAGE_SIZE
+    of every image of the sample directory (Resources/SampleImages by default, the plugin test frames when it is
+    missing) with both. For every image it prints the fp32 and int8 latency, the speedup and the PSNR of the int8
+    output against the fp32 output, then the means. The models run on CPU, like the quantized kernels.
+
+    Usage: python benchQuantization.py [model dir with the .pth and _int8.ts files] [sample images dir]
+"""
+import io
+import os
+import sys
+import glob
+import time
+import contextlib
+import importlib.util
+import numpy as np
+import cv2
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Plugins", "esrgan-sagemaker")
+SAMPLE_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Resources", "SampleImages")
+TEST_FRAMES = os.path.join(PLUGIN_DIR, "test", "SD", "frames")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+INT8_MODEL = "RealESRGAN_x4plus_int8.ts"
+IMAGE_SIZE = (96, 128)
+RUNS = 2
+
+def load_plugin(model_dir, quantized):
+    code_dir = os.path.join(PLUGIN_DIR, "code")
+    if code_dir not in sys.path:
+        sys.path.insert(0, code_dir)
+    spec = importlib.util.spec_from_file_location("bench_esrgan_inference", os.path.join(code_dir, "inference.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.QUANTIZED = quantized
+    module.WARMUP_SIZES = ""
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = module.model_fn(model_dir)
+    return model['realesr_gan']
+
+def find_images(directory):
+    return sorted(path for path in glob.glob(os.path.join(directory, "**", "*"), recursive=True)
+                  if path.lower().endswith(IMAGE_EXTENSIONS))
+
+def center_crop(img):
+    height, width = min(IMAGE_SIZE[0], img.shape[0]), min(IMAGE_SIZE[1], img.shape[1])
+    top, left = (img.shape[0] - height) // 2, (img.shape[1] - width) // 2
+    return img[top:top + height, left:left + width]
+
+def upscale(upsampler, img):
+    # first run warms up the size
+    output, _ = upsampler.enhance(img, outscale=4)
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        upsampler.enhance(img, outscale=4)
+    return (time.perf_counter() - start) / RUNS * 1000, output.astype(np.float32)
+
+def psnr(reference, output):
+    mse = np.mean((reference - output) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+def main():
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else PLUGIN_DIR
+    paths = find_images(sys.argv[2] if len(sys.argv) > 2 else SAMPLE_IMAGES) or find_images(TEST_FRAMES)
+    if not os.path.exists(os.path.join(model_dir, INT8_MODEL)):
+        sys.exit(f"No {INT8_MODEL} in {model_dir}, run quantize.py first")
+    fp32 = load_plugin(model_dir, False)
+    int8 = load_plugin(model_dir, True)
+    height, width = IMAGE_SIZE
+    print(f"esrgan fp32 vs int8, {width}x{height} center crops, mean of {RUNS} runs")
+    print(f"{'image':<32} {'fp32 ms':>9} {'int8 ms':>9} {'speedup':>8} {'PSNR dB':>8}")
+    rows = []
+    for path in paths:
+        img = center_crop(cv2.imread(path, cv2.IMREAD_COLOR))
+        fp32_latency, reference = upscale(fp32, img)
+        int8_latency, output = upscale(int8, img)
+        rows.append((fp32_latency, int8_latency, psnr(reference, output)))
+        print(f"{os.path.basename(path)[:32]:<32} {fp32_latency:>9.1f} {int8_latency:>9.1f} "
+              f"{fp32_latency / int8_latency:>7.2f}x {rows[-1][2]:>8.2f}")
+    fp32_mean, int8_mean, psnr_mean = np.mean(rows, axis=0)
+    print(f"{'mean':<32} {fp32_mean:>9.1f} {int8_mean:>9.1f} {fp32_mean / int8_mean:>7.2f}x {psnr_mean:>8.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+File: benchSwinAttentionCache.py
+Description: This is a benchmark of the attention caches of the Swin2SR plugin model
+(Plugins/swinir2-sagemaker/code/swinir/network_swin2sr.py).
+It compares the per-image latency with the attention masks and relative position bias recomputed on every
+forward pass against the cached ones.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    This file loads the Swin2SR model of the plugin (weights from the directory given as first argument,
+    the plugin directory by default) and upscales the same image several times for each setting of
+    network_swin2sr.ATTENTION_CACHE, then checks that both settings give the same output.
+    At inference the input resolution never matches the training resolution, so without the cache every
+    shifted block builds its attention mask again and every block runs cpb_mlp again, on every image.
+    Besides the total latency it reports the time spent building the masks and the bias, which is what the
+    cache saves; on a CPU the total is dominated by the transformer itself and is noisier than that saving.
+    It runs on CPU.
+"""
+import io
+import os
+import sys
+import time
+import contextlib
+import importlib.util
+import torch
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Plugins", "swinir2-sagemaker")
+IMAGE_SIZES = [(64, 64), (96, 128)]
+RUNS = 3
+setup_time = [0.0]
+
+def timed(method):
+    # accumulates the time spent in the mask and bias methods of the network
+    def wrapper(*args):
+        start = time.perf_counter()
+        result = method(*args)
+        setup_time[0] += time.perf_counter() - start
+        return result
+    return wrapper
+
+def load_plugin(model_dir):
+    code_dir = os.path.join(PLUGIN_DIR, "code")
+    sys.path.insert(0, code_dir)
+    spec = importlib.util.spec_from_file_location("bench_swinir_inference", os.path.join(code_dir, "inference.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = module.model_fn(model_dir)
+    return module, model
+
+def run(module, model, img):
+    with torch.no_grad():
+        # first run builds the caches
+        output = module.forward_padded(model, img)
+        setup_time[0] = 0.0
+        start = time.perf_counter()
+        for _ in range(RUNS):
+            module.forward_padded(model, img)
+    return (time.perf_counter() - start) / RUNS * 1000, setup_time[0] / RUNS * 1000, output
+
+def main():
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else PLUGIN_DIR
+    module, model = load_plugin(model_dir)
+    from swinir import network_swin2sr
+    network_swin2sr.WindowAttention.relative_position_bias = timed(network_swin2sr.WindowAttention.relative_position_bias)
+    network_swin2sr.SwinTransformerBlock.mask_for = timed(network_swin2sr.SwinTransformerBlock.mask_for)
+    print(f"Swin2SR on {module.device}, mean of {RUNS} runs")
+    print(f"{'size':<10} {'uncached ms':>12} {'setup ms':>9} {'cached ms':>10} {'setup ms':>9} {'speedup':>8} {'max diff':>9}")
+    for height, width in IMAGE_SIZES:
+        img = torch.rand(1, 3, height, width, device=module.device)
+        network_swin2sr.ATTENTION_CACHE = False
+        uncached, uncached_setup, expected = run(module, model, img)
+        network_swin2sr.ATTENTION_CACHE = True
+        cached, cached_setup, output = run(module, model, img)
+        diff = (expected - output).abs().max().item()
+        print(f"{f'{width}x{height}':<10} {uncached:>12.1f} {uncached_setup:>9.1f} {cached:>10.1f} {cached_setup:>9.1f} "
+              f"{uncached / cached:>7.2f}x {diff:>9.2e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+File: benchTorchScript.py
+Description: This is a benchmark of the TorchScript export and the warm-up of the plugin models
+(Plugins/common/upscale_common/export.py and the export.py script of each plugin).
+It compares the eager model without warm-up against the traced model with the container start warm-up.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    This file loads a plugin model in process twice, once eager without warm-up (USE_TORCHSCRIPT=false, no
+    WARMUP_SIZES) and once with the TorchScript models of the model directory and the warm-up of IMAGE_SIZE.
+    For both it prints the time of model_fn, the latency of the first request and the mean latency of the
+    following requests, and the largest pixel difference between the outputs of both.
+    The model directory needs the .pth weights and the models traced by export.py, for the Swin2SR plugin
+    traced for IMAGE_SIZE (python export.py --sizes 64x64). It runs on CPU.
+
+    Usage: python benchTorchScript.py [esrgan|swinir] [model dir with the .pth and .ts files]
+"""
+import io
+import os
+import sys
+import time
+import base64
+import contextlib
+import importlib.util
+import numpy as np
+import cv2
+from PIL import Image
+
+PLUGINS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Plugins")
+PLUGINS = {"esrgan": "esrgan-sagemaker", "swinir": "swinir2-sagemaker"}
+IMAGE_SIZE = (64, 64)
+RUNS = 3
+
+def load_plugin(name, model_dir, use_torchscript, warmup_sizes):
+    code_dir = os.path.join(PLUGINS_DIR, PLUGINS[name], "code")
+    if code_dir not in sys.path:
+        sys.path.insert(0, code_dir)
+    spec = importlib.util.spec_from_file_location(f"bench_{name}_inference", os.path.join(code_dir, "inference.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.USE_TORCHSCRIPT = use_torchscript
+    module.WARMUP_SIZES = warmup_sizes
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = module.model_fn(model_dir)
+    return module, model, time.perf_counter() - start
+
+def make_image(seed):
+    height, width = IMAGE_SIZE
+    pixels = np.random.default_rng(seed).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    buffered = io.BytesIO()
+    Image.fromarray(pixels).save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode('ascii')
+
+def predict(module, model, image):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        output = module.predict_fn(image, model)
+    return time.perf_counter() - start, output
+
+def decode(output):
+    return cv2.imdecode(np.frombuffer(base64.b64decode(output), np.uint8), cv2.IMREAD_COLOR).astype(np.int16)
+
+def run(name, model_dir, use_torchscript, warmup_sizes):
+    module, model, load_time = load_plugin(name, model_dir, use_torchscript, warmup_sizes)
+    first, output = predict(module, model, make_image(0))
+    steady = sum(predict(module, model, make_image(seed))[0] for seed in range(1, RUNS + 1)) / RUNS
+    return load_time, first, steady, output
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else "esrgan"
+    model_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(PLUGINS_DIR, PLUGINS[name])
+    height, width = IMAGE_SIZE
+    print(f"{name}, {width}x{height} images, mean of {RUNS} steady state requests")
+    print(f"{'mode':<24} {'model_fn s':>10} {'first ms':>9} {'steady ms':>10}")
+    results = {}
+    for label, use_torchscript, warmup_sizes in [("eager, no warm-up", False, ""), ("TorchScript, warm-up", True, f"{width}x{height}")]:
+        load_time, first, steady, output = run(name, model_dir, use_torchscript, warmup_sizes)
+        results[label] = output
+        print(f"{label:<24} {load_time:>10.1f} {first * 1000:>9.0f} {steady * 1000:>10.0f}")
+    eager, traced = results.values()
+    print(f"max pixel difference {np.abs(decode(eager) - decode(traced)).max()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+File: benchVideoCodecs.py
+Description: This is a benchmark of the video codec backends of the VideoUpscaler (VideoUpscaler/videocodec.py).
+It compares the OpenCV VideoCapture/VideoWriter path with the ffmpeg pipe path for decode and encode speed,
+output size and whether the audio track survives.
+
+Author: @bainskb
+Contributors: @bainskb, @andklee
+
+Date Created: 10/18/2026
+Version: 1.0
+
+References: N/A
+
+Purpose:
+    This file generates a test clip with an audio track (or uses the video given as the first argument),
+    then for every available backend decodes all the frames, upscales them 2x with a plain resize as a
+    stand-in for the endpoint, and encodes them again. No AWS account is needed.
+    The ffmpeg backend needs ffmpeg and ffprobe on the PATH. The encoder settings are read from the same
+    VIDEO_CODEC, VIDEO_CRF, VIDEO_PRESET, VIDEO_THREADS and VIDEO_CV2_FOURCC variables as the VideoUpscaler.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import cv2
+import numpy as np
+
+# the backends live in the VideoUpscaler directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "VideoUpscaler"))
+import videocodec
+
+SCALE = 2
+CLIP_SECONDS = 10
+CLIP_SIZE = "640x360"
+
+def make_clip(path):
+    if videocodec.ffmpeg_available():
+        subprocess.run(["ffmpeg", "-y", "-v", "error",
+                        "-f", "lavfi", "-i", f"testsrc2=size={CLIP_SIZE}:rate=30:duration={CLIP_SECONDS}",
+                        "-f", "lavfi", "-i", f"sine=frequency=440:duration={CLIP_SECONDS}",
+                        "-c:v", "libx264", "-c:a", "aac", "-shortest", path], check=True)
+        return
+    # without ffmpeg the clip has no audio, a moving gradient stands in for the test pattern
+    width, height = (int(value) for value in CLIP_SIZE.split("x"))
+    gradient = np.add.outer(np.arange(height), np.arange(width))
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 30, (width, height))
+    for index in range(CLIP_SECONDS * 30):
+        out.write(np.dstack([(gradient + index * step) % 256 for step in (1, 2, 3)]).astype(np.uint8))
+    out.release()
+
+def has_audio(path):
+    if not videocodec.ffmpeg_available():
+        return None
+    result = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "a", "-show_entries", "stream=index",
+                             "-of", "csv=p=0", path], capture_output=True, text=True)
+    return bool(result.stdout.strip())
+
+def run(backend, source, output):
+    start = time.perf_counter()
+    reader = backend.reader(source)
+    writer = None
+    frames = 0
+    decode_time = 0.0
+    encode_time = 0.0
+    while True:
+        decode_start = time.perf_counter()
+        frame = reader.read()
+        decode_time += time.perf_counter() - decode_start
+        if frame is None:
+            break
+        frame = cv2.resize(frame, None, fx=SCALE, fy=SCALE, interpolation=cv2.INTER_LINEAR)
+        encode_start = time.perf_counter()
+        if writer is None:
+            writer = backend.writer(output, reader.fps, (frame.shape[1], frame.shape[0]), audio_source=source)
+        writer.write(frame)
+        encode_time += time.perf_counter() - encode_start
+        frames += 1
+    reader.close()
+    encode_start = time.perf_counter()
+    if writer is not None:
+        writer.close()
+    encode_time += time.perf_counter() - encode_start
+    total = time.perf_counter() - start
+    size = os.path.getsize(output) if os.path.exists(output) else 0
+    print(f"{backend.name:<8} {frames} frames  total {frames / total:7.1f} fps  decode {frames / decode_time:7.1f} fps  "
+          f"encode {frames / encode_time if encode_time else 0:7.1f} fps  size {size / 1024:8.1f} KiB  audio {has_audio(output)}")
+
+def main():
+    workdir = tempfile.mkdtemp()
+    try:
+        source = sys.argv[1] if len(sys.argv) > 1 else os.path.join(workdir, "source.mp4")
+        if len(sys.argv) <= 1:
+            make_clip(source)
+        print(f"Source {source}, audio {has_audio(source)}, upscale x{SCALE}")
+        backends = [videocodec.Cv2Backend]
+        if videocodec.ffmpeg_available():
+            backends.append(videocodec.FfmpegPipeBackend)
+        else:
+            print("ffmpeg/ffprobe not found, only the cv2 backend is measured")
+        for backend in backends:
+            run(backend, source, os.path.join(workdir, f"{backend.name}.mp4"))
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
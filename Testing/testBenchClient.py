@@ -20,6 +20,7 @@ import requests
 import base64
 import os
 import csv
+import json
 import cv2
 import warnings
 # Suppress all warnings
@@ -31,6 +32,12 @@ endpoint = "<SAGEMAKER_ENDPOINT_NAME>"
 ELB_DNS = "k8s-upscale-upscale-<ELB_ID>.elb.<REGION>.amazonaws.com"
 HTTPS = "https://"
 API_URL = HTTPS + ELB_DNS
+# Upscale method (provider) used for the run, see /providers on the API for the available ones
+UPSCALE_METHOD = "sageMakerRT"
+# Set to True to send every image in one /storeBatch call and one /retrieveBatch call
+# instead of one /store and one /retrieve call per image
+USE_BATCH = False
+BATCH_MAX_WORKERS = 8
 # Local Test API
 # API_URL = "http://127.0.0.1:5000"
 
@@ -65,7 +72,7 @@ def send_image_to_api(image_path, api_url, s3Key):
         
     
     encoded_image = base64.b64encode(image_data).decode('utf-8')
-    data = {'image': encoded_image, "s3_bucket":s3_bucket, "s3_key_name": s3Key, "endpoint":endpoint, 'upscaleMethod': "sageMakerRT"}
+    data = {'image': encoded_image, "s3_bucket":s3_bucket, "s3_key_name": s3Key, "endpoint":endpoint, 'upscaleMethod': UPSCALE_METHOD}
 
     headers = {'Content-Type': 'application/json'}
     response = requests.post(api_url+'/store', headers=headers, json=data, verify=False)
@@ -73,7 +80,7 @@ def send_image_to_api(image_path, api_url, s3Key):
 
 # will send the s3_key as an query parameter argument
 def retrieve_image_from_api(api_url, s3_key):
-    url = f"{api_url}/retrieve?s3_key={s3_key}&s3_bucket={s3_bucket}&endpoint={endpoint}"
+    url = f"{api_url}/retrieve?s3_key={s3_key}&s3_bucket={s3_bucket}&endpoint={endpoint}&upscaleMethod={UPSCALE_METHOD}"
     response = requests.get(url, verify=False)
     return response.json()
     
@@ -119,6 +126,51 @@ def call_api(image_src_path, image_dest_path):
         print(retrieve_response[0]['error'])
         return "Error Response Retrieve"
 
+def send_images_to_api_batch(image_paths, api_url):
+    images = []
+    for image_path in image_paths:
+        with open(image_path, "rb") as image_file:
+            encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
+        images.append({'image': encoded_image, 's3_key_name': image_path.split('/')[-1]})
+    data = {'images': images, "s3_bucket":s3_bucket, "endpoint":endpoint, 'upscaleMethod': UPSCALE_METHOD, 'max_workers': BATCH_MAX_WORKERS}
+    response = requests.post(api_url+'/storeBatch', json=data, stream=True, verify=False)
+    # the API streams one JSON line per image as each one completes
+    for line in response.iter_lines():
+        if line:
+            yield json.loads(line)
+
+def retrieve_images_from_api_batch(api_url, s3_keys):
+    data = {'s3_keys': s3_keys, "s3_bucket":s3_bucket, "endpoint":endpoint, 'upscaleMethod': UPSCALE_METHOD, 'max_workers': BATCH_MAX_WORKERS}
+    response = requests.post(api_url+'/retrieveBatch', json=data, stream=True, verify=False)
+    for line in response.iter_lines():
+        if line:
+            yield json.loads(line)
+
+def call_api_batch(image_src_paths, image_dest_paths):
+    # same as call_api but for every image at once, returns a result per source path
+    results = {}
+    keys_to_dest = {}
+    for image_path, image_dest_path in zip(image_src_paths, image_dest_paths):
+        results[image_path] = "Error Send"
+        keys_to_dest[image_path.split('/')[-1]] = (image_path, image_dest_path)
+    try:
+        for result in send_images_to_api_batch(image_src_paths, API_URL):
+            print("Stored:", result)
+            if result['code'] == 200:
+                results[keys_to_dest[result['s3_key']][0]] = "Error Retrieve"
+        for result in retrieve_images_from_api_batch(API_URL, list(keys_to_dest.keys())):
+            image_path, image_dest_path = keys_to_dest[result['s3_key']]
+            if result['code'] != 200:
+                print(result)
+                results[image_path] = "Error Upscale"
+                continue
+            with open(image_dest_path, 'wb') as f:
+                f.write(base64.b64decode(result['data']))
+            results[image_path] = "Success"
+    except Exception as e:
+        print("Failed batch call with: ", e)
+    return results
+
 def run_tests_from_arrs(arr_of_paths, destPaths):
     print("Running Similarity tests")
     # make sure that the number of paths is equal to the number of destPaths
@@ -181,6 +233,18 @@ def run_tests_from_csv_file(arr_of_paths, curr_results_folder):
     try: 
         paths = []
         destPaths = []
+        if USE_BATCH:
+            for path in arr_of_paths:
+                paths.append(path)
+                destPaths.append(os.path.join(curr_results_folder, path.split('/')[-1]))
+            api_results = call_api_batch(paths, destPaths)
+            for path, image_dest_path in zip(paths, destPaths):
+                if api_results[path] == "Success":
+                    print(f"Image {path.split('/')[-1]} saved to {image_dest_path}")
+                else:
+                    print("Error: ", api_results[path])
+            print("-------------------------------------------------")
+            arr_of_paths = []
         for path in arr_of_paths:
             # create the image name from the path
             image_name = path.split('/')[-1]
@@ -0,0 +1,58 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+import logging
+logging.basicConfig(level=logging.INFO)
+
+# Process wide registry of boto3 clients, mirrors API/AwsClients.py.
+# Clients are created once per service and region and shared by every worker thread.
+SERVICE_ALIASES = {
+    "runtime.sagemaker": "sagemaker-runtime",
+}
+
+MAX_POOL_CONNECTIONS = int(os.getenv('BOTO_MAX_POOL_CONNECTIONS', 50))
+CONNECT_TIMEOUT = int(os.getenv('BOTO_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = int(os.getenv('BOTO_READ_TIMEOUT', 60))
+SAGEMAKER_READ_TIMEOUT = int(os.getenv('BOTO_SAGEMAKER_READ_TIMEOUT', 70))
+MAX_ATTEMPTS = int(os.getenv('BOTO_MAX_ATTEMPTS', 3))
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+
+def _client_config(service, max_attempts):
+    read_timeout = SAGEMAKER_READ_TIMEOUT if service == "sagemaker-runtime" else READ_TIMEOUT
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        retries={'max_attempts': max_attempts, 'mode': 'standard'}
+    )
+
+def get_client(service, region_name=None, max_attempts=MAX_ATTEMPTS):
+    """Shared client of the service and region. Calls that retry on their own (the endpoint calls under the
+    AdaptiveLimiter) take a client with max_attempts=0, so botocore does not hide the overload errors from them."""
+    service = SERVICE_ALIASES.get(service, service)
+    key = (service, region_name, max_attempts)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    global _session
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # the default boto3 session is not thread safe, so the registry owns its own session
+            if _session is None:
+                _session = boto3.session.Session()
+            logging.info(f"Creating {service} client for region {region_name or _session.region_name}")
+            client = _session.client(service, region_name=region_name, config=_client_config(service, max_attempts))
+            _clients[key] = client
+    return client
+
+def reset_clients():
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
@@ -0,0 +1,129 @@
+import os
+import time
+import random
+import threading
+import logging
+from botocore.exceptions import ClientError, ReadTimeoutError, ConnectTimeoutError, EndpointConnectionError
+logging.basicConfig(level=logging.INFO)
+
+# adaptive concurrency of the endpoint calls, false keeps the max_workers of the request fixed
+ADAPTIVE_CONCURRENCY = os.getenv('ADAPTIVE_CONCURRENCY', 'true').lower() == 'true'
+ADAPTIVE_MAX_CONCURRENCY = int(os.getenv('ADAPTIVE_MAX_CONCURRENCY', 32))
+# a round whose mean latency is more than this factor over the best round counts as congested
+ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv('ADAPTIVE_LATENCY_TOLERANCE', 1.5))
+# retries of a frame after a throttling error, busy model container or timeout
+UPSCALE_RETRIES = int(os.getenv('UPSCALE_RETRIES', 4))
+UPSCALE_RETRY_BASE = float(os.getenv('UPSCALE_RETRY_BASE', 0.5))
+UPSCALE_RETRY_MAX = float(os.getenv('UPSCALE_RETRY_MAX', 20))
+
+# errors that mean the endpoint is overloaded or briefly unavailable, the call is retried and the limit backs off
+OVERLOAD_ERROR_CODES = ("ThrottlingException", "TooManyRequestsException", "ModelNotReadyException",
+                        "ServiceUnavailable", "InternalFailure", "InternalServerError")
+# statuses of the model container that make a ModelError an overload (no free worker), any other ModelError is an
+# error of the request or the model (e.g. an unserved model or precision) that a retry would repeat
+OVERLOAD_MODEL_STATUSES = (429, 503)
+
+def is_overload(error):
+    if isinstance(error, (ReadTimeoutError, ConnectTimeoutError, EndpointConnectionError)):
+        return True
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        if code == "ModelError":
+            return error.response.get("OriginalStatusCode") in OVERLOAD_MODEL_STATUSES
+        return code in OVERLOAD_ERROR_CODES
+    return False
+
+def is_payload_too_large(error):
+    """The endpoint rejected the request or its response for exceeding the payload limit"""
+    if not isinstance(error, ClientError) or error.response.get("Error", {}).get("Code") != "ValidationError":
+        return False
+    message = error.response.get("Error", {}).get("Message", "").lower()
+    return any(word in message for word in ("payload", "size", "length", "too large"))
+
+def retry_delay(attempt):
+    """Full jitter exponential backoff, spreads the retries of all the workers over time"""
+    return random.uniform(0, min(UPSCALE_RETRY_MAX, UPSCALE_RETRY_BASE * 2 ** attempt))
+
+class AdaptiveLimiter:
+    """AIMD limit on the number of concurrent endpoint calls.
+    The calls are grouped in rounds of `limit` completed calls. A round without errors whose mean latency
+    stays within the tolerance of the best round seen adds one to the limit (additive increase); a round whose
+    latency grew keeps the limit; an overload error multiplies the limit by `decrease` (multiplicative decrease),
+    at most once per round so a burst of errors from the same congestion only backs off once."""
+    def __init__(self, initial, minimum=1, maximum=ADAPTIVE_MAX_CONCURRENCY, decrease=0.5,
+                 latency_tolerance=ADAPTIVE_LATENCY_TOLERANCE, adaptive=ADAPTIVE_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum if adaptive else initial)
+        self.limit = max(minimum, min(int(initial), self.maximum))
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.adaptive = adaptive
+        self.condition = threading.Condition()
+        self.active = 0
+        self.round_calls = 0
+        self.round_latency = 0.0
+        self.round_backed_off = False
+        self.best_latency = None
+        self.history = [(time.time(), self.limit)]
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+
+    def release(self, latency=None, overload=False):
+        with self.condition:
+            self.active -= 1
+            if self.adaptive:
+                self.update(latency, overload)
+            self.condition.notify_all()
+
+    def update(self, latency, overload):
+        if overload:
+            if not self.round_backed_off:
+                self.set_limit(int(self.limit * self.decrease))
+                self.round_backed_off = True
+            return
+        if latency is not None:
+            self.round_calls += 1
+            self.round_latency += latency
+        if self.round_calls < self.limit:
+            return
+        mean_latency = self.round_latency / self.round_calls
+        if not self.round_backed_off:
+            if self.best_latency is None or mean_latency < self.best_latency:
+                self.best_latency = mean_latency
+            if mean_latency <= self.best_latency * self.latency_tolerance:
+                self.set_limit(self.limit + 1)
+        self.round_calls = 0
+        self.round_latency = 0.0
+        self.round_backed_off = False
+
+    def set_limit(self, limit):
+        limit = max(self.minimum, min(limit, self.maximum))
+        if limit != self.limit:
+            logging.info(f"Endpoint concurrency {self.limit} -> {limit}")
+            self.limit = limit
+            self.history.append((time.time(), limit))
+
+    def call(self, fn, *args):
+        """Run fn under the limit, retrying overload errors with jittered backoff.
+        Other errors, and the last overload error once the retries are spent, are raised.
+        fn has to use a client without botocore retries (max_attempts=0), or the limit never sees the overload."""
+        for attempt in range(UPSCALE_RETRIES + 1):
+            self.acquire()
+            start = time.perf_counter()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                overload = is_overload(e)
+                self.release(overload=overload)
+                if not overload or attempt == UPSCALE_RETRIES:
+                    raise
+                delay = retry_delay(attempt)
+                logging.info(f"Endpoint overloaded ({e}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.release(latency=time.perf_counter() - start)
+            return result
@@ -0,0 +1,39 @@
+import os
+import cv2
+import numpy as np
+
+# mean absolute difference (0-255) of the downsampled frames under which a frame reuses the previous upscale, 0 disables
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', 0))
+# side of the grayscale thumbnail the frames are compared on
+DEDUP_SIZE = int(os.getenv('DEDUP_SIZE', 32))
+
+class FrameDeduplicator:
+    """Detects frames that are (nearly) identical to the last frame sent to the endpoint.
+    Frames are compared on a small grayscale thumbnail, which is cheap and ignores encoder noise.
+    The comparison is against the last frame that was actually upscaled rather than the previous frame,
+    so a slow pan or fade can not drift away from the reused output one small step at a time."""
+    def __init__(self, threshold=DEDUP_THRESHOLD, size=DEDUP_SIZE):
+        self.threshold = threshold
+        self.size = size
+        self.reference = None
+        self.saved = 0
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def signature(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, (self.size, self.size), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def is_duplicate(self, frame):
+        """True when the frame can reuse the output of the reference frame, otherwise it becomes the reference"""
+        if not self.enabled:
+            return False
+        signature = self.signature(frame)
+        if self.reference is not None and self.reference.shape == signature.shape \
+                and np.abs(signature - self.reference).mean() < self.threshold:
+            self.saved += 1
+            return True
+        self.reference = signature
+        return False
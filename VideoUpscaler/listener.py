@@ -1,45 +1,198 @@
 import boto3
 import os
+import json
 import shutil
 from sqs_listener import SqsListener
-from videoupscaler import VideoUpscaler
+from videoupscaler import VideoUpscaler, FRAMES_PER_REQUEST, UPSCALE_MODEL
+from dedup import DEDUP_THRESHOLD
+from awsclients import get_client
 import logging
 from dotenv import load_dotenv
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
+# "stream" decodes, upscales and encodes in memory, "frames" keeps the frame dump to /tmp
+DEFAULT_PIPELINE = os.getenv('VIDEO_PIPELINE', 'stream')
+
 class VideoUpscaleJobListener(SqsListener):
     def __init__(self, queue, table, **kwds):
         super().__init__(queue, **kwds)
-        self.s3client = boto3.client('s3')
+        self.s3client = get_client('s3')
+        self.sqsclient = get_client('sqs')
+        # chunk and stitch messages are sent back to the queue this listener consumes
+        self.queue_url = self.sqsclient.get_queue_url(QueueName=queue)['QueueUrl']
         self.VideoUpscaler = VideoUpscaler(table)     
 
+    def handle_image_message(self, body):
+        id = body['id']
+        self.VideoUpscaler.setDDBField(id, "status", "Processing")
+        try:
+            output = self.VideoUpscaler.upscaleImageObject(id, body['image'], body['endpoint'])
+        except Exception as e:
+            logging.info(f"Image job {id} failed: {e}")
+            self.VideoUpscaler.setDDBField(id, "error", str(e))
+            self.VideoUpscaler.setDDBField(id, "status", "Failed")
+            return
+        self.VideoUpscaler.setDDBField(id, "output", output)
+        self.VideoUpscaler.setDDBField(id, "status", "Completed")
+
+    def send_message(self, body):
+        self.sqsclient.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(body)
+        )
+
+    def delete_chunks(self, bucket, prefix, chunks_total):
+        # removes the chunk videos uploaded under prefix, the keys of the chunks not uploaded are ignored
+        self.s3client.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': f"{prefix}{chunk:05d}.mp4"} for chunk in range(chunks_total)]})
+
+    def handle_split_message(self, body):
+        # planner: splits the video in keyframe aligned chunks that any listener can pick up
+        id = body['id']
+        self.VideoUpscaler.setDDBField(id, "status", "Processing")
+        try:
+            chunks, frame_count = self.VideoUpscaler.splitVideo(id, body['video'], float(body['chunk_seconds']))
+        except ValueError as e:
+            logging.info(f"Unable to split video job {id}: {e}")
+            self.VideoUpscaler.setDDBField(id, "error", str(e))
+            self.VideoUpscaler.setDDBField(id, "status", "Failed")
+            return
+        finally:
+            shutil.rmtree(f"/tmp/{id}", ignore_errors=True)
+        self.VideoUpscaler.initChunks(id, len(chunks), frame_count)
+        for chunk, (start_frame, end_frame) in enumerate(chunks):
+            self.send_message({
+                "id": id,
+                "video": body['video'],
+                "endpoint": body['endpoint'],
+                "max_workers": body['max_workers'],
+                "method": "upscaleChunk",
+                "chunk": chunk,
+                "chunks_total": len(chunks),
+                "start_frame": start_frame,
+                "end_frame": end_frame,
+                "dedup_threshold": body.get('dedup_threshold'),
+                "frames_per_request": body.get('frames_per_request'),
+                "model": body.get('model')
+            })
+
+    def handle_chunk_message(self, body):
+        id = body['id']
+        chunk = int(body['chunk'])
+        video = body['video']
+        bucket, key = video.split('/',2)[-1].split('/',1)
+        keyNoExt = os.path.splitext(key)[0]
+        chunks_prefix = f"{keyNoExt}-chunks/{id}/"
+        # another chunk already failed the job, this one would only be uploaded and never stitched
+        if self.VideoUpscaler.getDDBField(id, "status") == "Failed":
+            logging.info(f"Skipping chunk {chunk} of failed video job {id}")
+            self.VideoUpscaler.setChunkStatus(id, chunk, "Skipped")
+            return
+        config = {}
+        config['endpoint'] = body['endpoint']
+        config['max_workers'] = int(body['max_workers'])
+        config['start_frame'] = int(body['start_frame'])
+        # the last chunk has no end_frame and reads to the end of the video
+        config['end_frame'] = int(body['end_frame']) if body.get('end_frame') is not None else None
+        config['chunk'] = chunk
+        config['dedup_threshold'] = float(body.get('dedup_threshold') or DEDUP_THRESHOLD)
+        config['frames_per_request'] = int(body.get('frames_per_request') or FRAMES_PER_REQUEST)
+        config['model'] = body.get('model') or UPSCALE_MODEL
+        output = f"/tmp/{id}/chunk-{chunk:05d}.mp4"
+        os.makedirs(f"/tmp/{id}", exist_ok=True)
+        self.VideoUpscaler.setChunkStatus(id, chunk, "Processing")
+        try:
+            self.VideoUpscaler.processVideoStream(id, video, output, False, config)
+            self.s3client.upload_file(output, bucket, f"{chunks_prefix}{chunk:05d}.mp4")
+        except Exception as e:
+            logging.info(f"Chunk {chunk} of video job {id} failed: {e}")
+            self.VideoUpscaler.setChunkStatus(id, chunk, "Failed")
+            self.VideoUpscaler.setDDBField(id, "error", f"chunk {chunk}: {e}")
+            self.VideoUpscaler.setDDBField(id, "status", "Failed")
+            self.delete_chunks(bucket, chunks_prefix, int(body['chunks_total']))
+            return
+        finally:
+            shutil.rmtree(f"/tmp/{id}", ignore_errors=True)
+        # a chunk that was still running when the job failed removes its own upload
+        if self.VideoUpscaler.getDDBField(id, "status") == "Failed":
+            self.delete_chunks(bucket, chunks_prefix, int(body['chunks_total']))
+            return
+        # the listener that completes the last chunk triggers the stitch
+        if self.VideoUpscaler.completeChunk(id, chunk):
+            self.send_message({
+                "id": id,
+                "video": video,
+                "method": "stitch",
+                "chunks_total": int(body['chunks_total'])
+            })
+
+    def handle_stitch_message(self, body):
+        id = body['id']
+        video = body['video']
+        bucket, key = video.split('/',2)[-1].split('/',1)
+        filenameNoExt = video.split("/")[-1].split(".")[0]
+        keyNoExt = os.path.splitext(key)[0]
+        os.makedirs(f"/tmp/{id}", exist_ok=True)
+        chunk_keys = [f"{keyNoExt}-chunks/{id}/{chunk:05d}.mp4" for chunk in range(int(body['chunks_total']))]
+        files = []
+        for chunk_key in chunk_keys:
+            files.append(f"/tmp/{id}/{chunk_key.split('/')[-1]}")
+            self.s3client.download_file(bucket, chunk_key, files[-1])
+        output = f"/tmp/{id}/{filenameNoExt}-upscaled.mp4"
+        # the chunks have no audio, it is copied from the original video
+        audio_source = self.VideoUpscaler.downloadVideo(id, video)
+        self.VideoUpscaler.stitchVideos(files, output, audio_source)
+        self.s3client.upload_file(output, bucket, f"{keyNoExt}-upscaled.mp4")
+        self.s3client.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': chunk_key} for chunk_key in chunk_keys]})
+        shutil.rmtree(f"/tmp/{id}")
+        self.VideoUpscaler.setDDBField(id, "output", f"s3://{bucket}/{keyNoExt}-upscaled.mp4")
+        self.VideoUpscaler.setDDBField(id, "status", "Completed")
+
     def handle_message(self, body, attributes, messages_attributes):
         logging.info(f"Received message: {body}")
         id = body['id']
-        video = body['video']
         method = body['method']
+        if method == "upscaleImage":
+            self.handle_image_message(body)
+            return
+        if method == "upscaleChunk":
+            self.handle_chunk_message(body)
+            return
+        if method == "stitch":
+            self.handle_stitch_message(body)
+            return
+        if method == "upscale" and float(body.get('chunk_seconds') or 0) > 0:
+            self.handle_split_message(body)
+            return
+        video = body['video']
         self.VideoUpscaler.setDDBField(id, "status", "Processing")
         config = {}
         config['endpoint'] = body['endpoint']
         config['min_size'] = int(body['min_size'])
         config['max_size'] = int(body['max_size'])
         config['max_workers'] = int(body['max_workers'])
+        config['pipeline'] = body.get('pipeline') or DEFAULT_PIPELINE
+        config['dedup_threshold'] = float(body.get('dedup_threshold') or DEDUP_THRESHOLD)
+        config['frames_per_request'] = int(body.get('frames_per_request') or FRAMES_PER_REQUEST)
+        config['model'] = body.get('model') or UPSCALE_MODEL
         bucket, key = video.split('/',2)[-1].split('/',1)
         filename = video.split("/")[-1]
         filenameNoExt = filename.split(".")[0]
         keyNoExt = os.path.splitext(key)[0]
         prefix = None
-        if method == "upscale":
+        if config['pipeline'] == "stream" and method in ("upscale", "downscale"):
+            prefix = "upscaled" if method == "upscale" else "downscaled"
+            self.VideoUpscaler.processVideoStream(id, video, f"/tmp/{id}/{filenameNoExt}-{prefix}.mp4", method == "downscale", config)
+        elif method == "upscale":
             fps = self.VideoUpscaler.breakDownFrames(id, video, False, config)
             self.VideoUpscaler.upscaleFrames(id, config)
             prefix = "upscaled"
-            self.VideoUpscaler.createVideoFromFrames(id,f"/tmp/{id}/newframes",f"/tmp/{id}/{filenameNoExt}-{prefix}.mp4",fps)
+            self.VideoUpscaler.createVideoFromFrames(id,f"/tmp/{id}/newframes",f"/tmp/{id}/{filenameNoExt}-{prefix}.mp4",fps,f"/tmp/{id}/{filename}",f"/tmp/{id}/oldframes",report_rate=False)
         elif method == "downscale":
             fps = self.VideoUpscaler.breakDownFrames(id, video, True, config)
             prefix = "downscaled"
-            self.VideoUpscaler.createVideoFromFrames(id,f"/tmp/{id}/oldframes",f"/tmp/{id}/{filenameNoExt}-{prefix}.mp4",fps)
+            self.VideoUpscaler.createVideoFromFrames(id,f"/tmp/{id}/oldframes",f"/tmp/{id}/{filenameNoExt}-{prefix}.mp4",fps,f"/tmp/{id}/{filename}")
         if prefix:
             logging.info(f"Uploading video: /tmp/{id}/{filenameNoExt}-{prefix}.mp4")
             self.s3client.upload_file(f"/tmp/{id}/{filenameNoExt}-{prefix}.mp4", bucket, f"{keyNoExt}-{prefix}.mp4")
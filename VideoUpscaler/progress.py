@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+import logging
+logging.basicConfig(level=logging.INFO)
+
+# seconds between two DynamoDB progress updates of a job
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 5))
+
+COUNTERS = ("frames_decoded", "frames_upscaled", "frames_encoded", "frames_failed", "endpoint_calls_saved")
+# counters whose sum is the number of finished frames of the job, for fps, eta_seconds and progress
+ENCODED_COUNTERS = ("frames_encoded",)
+# the upscale stage of the frames pipeline, which runs before any frame is encoded
+UPSCALED_COUNTERS = ("frames_upscaled", "frames_failed", "endpoint_calls_saved")
+
+class ProgressReporter:
+    """Counts the frames of a video job and writes them to the job record at most every interval seconds.
+    The counters are sent as DynamoDB ADD deltas, so the chunks of a job running on several listeners
+    add up in the same record. fps, eta_seconds and progress are computed from the job wide sum of rate_counters,
+    frames_encoded by default; an empty rate_counters only writes the counters."""
+    def __init__(self, ddbclient, ddb_table, id, interval=PROGRESS_INTERVAL, rate_counters=ENCODED_COUNTERS):
+        self.ddbclient = ddbclient
+        self.ddb_table = ddb_table
+        self.id = str(id)
+        self.interval = interval
+        self.rate_counters = rate_counters
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.pending = dict.fromkeys(COUNTERS, 0)
+        self.gauges = {}
+        self.last_flush = time.monotonic()
+        self.last_encoded = None
+        self.last_encoded_time = None
+
+    def start(self, frames_total):
+        """Reset the counters of the job, called once per job before the first frame"""
+        values = {":zero": {"N": "0"}, ":total": {"N": str(int(frames_total))}, ":now": {"N": str(int(time.time()))}}
+        try:
+            self.ddbclient.update_item(
+                TableName=self.ddb_table,
+                Key={"id": {"S": self.id}},
+                UpdateExpression="set frames_total = :total, started_at = :now, updated_at = :now, "
+                                 + ", ".join(f"{counter} = :zero" for counter in COUNTERS),
+                ExpressionAttributeValues=values,
+            )
+        except Exception as e:
+            logging.info(f"Unable to reset the progress of video id: {self.id}: {e}")
+
+    def decoded(self, count=1):
+        self.add("frames_decoded", count)
+
+    def upscaled(self, count=1):
+        self.add("frames_upscaled", count)
+
+    def encoded(self, count=1):
+        self.add("frames_encoded", count)
+
+    def failed(self, count=1):
+        self.add("frames_failed", count)
+
+    def saved(self, count=1):
+        self.add("endpoint_calls_saved", count)
+
+    def gauge(self, name, value):
+        """Current value written as is with the next update, e.g. the endpoint concurrency"""
+        with self.lock:
+            self.gauges[name] = value
+
+    def add(self, counter, count):
+        # called from the upscale worker threads as well as the decode/encode loop
+        with self.lock:
+            self.pending[counter] += count
+            if time.monotonic() - self.last_flush < self.interval:
+                return
+            self.last_flush = time.monotonic()
+            pending = self.take_pending()
+        self.write(pending)
+
+    def take_pending(self):
+        pending = {counter: value for counter, value in self.pending.items() if value}
+        self.pending = dict.fromkeys(COUNTERS, 0)
+        return pending
+
+    def flush(self):
+        """Write whatever has not been written yet, called when the job (or chunk) ends"""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            pending = self.take_pending()
+        self.write(pending)
+
+    def write(self, pending):
+        if not pending:
+            return
+        with self.write_lock:
+            self.write_counters(pending)
+
+    def write_counters(self, pending):
+        with self.lock:
+            gauges = dict(self.gauges)
+        try:
+            response = self.ddbclient.update_item(
+                TableName=self.ddb_table,
+                Key={"id": {"S": self.id}},
+                UpdateExpression="set updated_at = :now" + "".join(f", {name} = :{name}" for name in gauges)
+                                 + " add " + ", ".join(f"{counter} :{counter}" for counter in pending),
+                ExpressionAttributeValues=dict(
+                    {f":{counter}": {"N": str(value)} for counter, value in pending.items()},
+                    **{f":{name}": {"N": str(value)} for name, value in gauges.items()},
+                    **{":now": {"N": str(int(time.time()))}}
+                ),
+                ReturnValues="ALL_NEW",
+            )
+            self.write_rate(response['Attributes'])
+        except Exception as e:
+            # progress is informative only, never fail the job because of it
+            logging.info(f"Unable to update the progress of video id: {self.id}: {e}")
+
+    def write_rate(self, attributes):
+        if not self.rate_counters:
+            return
+        encoded = sum(int(attributes.get(counter, {}).get("N", 0)) for counter in self.rate_counters)
+        now = time.monotonic()
+        if self.last_encoded is None:
+            # first write of this reporter, the rate is measured from the start of the job
+            started_at = int(attributes.get("started_at", {}).get("N", 0))
+            elapsed = time.time() - started_at if started_at else 0
+            fps = encoded / elapsed if elapsed > 0 else 0.0
+        else:
+            elapsed = now - self.last_encoded_time
+            fps = (encoded - self.last_encoded) / elapsed if elapsed > 0 else 0.0
+        self.last_encoded = encoded
+        self.last_encoded_time = now
+        values = {":fps": {"N": f"{fps:.2f}"}}
+        expression = "set fps = :fps"
+        total = int(attributes.get("frames_total", {}).get("N", 0))
+        if total:
+            values[":progress"] = {"N": f"{min(100.0, 100.0 * encoded / total):.1f}"}
+            expression += ", progress = :progress"
+            if fps > 0:
+                values[":eta"] = {"N": str(int(max(0, total - encoded) / fps))}
+                expression += ", eta_seconds = :eta"
+        self.ddbclient.update_item(
+            TableName=self.ddb_table,
+            Key={"id": {"S": self.id}},
+            UpdateExpression=expression,
+            ExpressionAttributeValues=values,
+        )
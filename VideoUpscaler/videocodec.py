@@ -0,0 +1,173 @@
+import os
+import json
+import shutil
+import subprocess
+import cv2
+import numpy as np
+import logging
+logging.basicConfig(level=logging.INFO)
+
+# "ffmpeg", "cv2" or "auto" (ffmpeg when the binaries are installed)
+VIDEO_CODEC_BACKEND = os.getenv('VIDEO_CODEC_BACKEND', 'auto')
+# encoder settings of the ffmpeg backend
+VIDEO_CODEC = os.getenv('VIDEO_CODEC', 'libx264')
+VIDEO_CRF = int(os.getenv('VIDEO_CRF', 18))
+VIDEO_PRESET = os.getenv('VIDEO_PRESET', 'medium')
+VIDEO_THREADS = int(os.getenv('VIDEO_THREADS', 0))
+# fourcc of the cv2 backend
+VIDEO_CV2_FOURCC = os.getenv('VIDEO_CV2_FOURCC', 'avc1')
+# bitrate of the AAC audio when the original audio codec can not go in an mp4
+AUDIO_BITRATE = os.getenv('AUDIO_BITRATE', '192k')
+# audio codecs an mp4 holds, the other ones (pcm, vorbis, ...) are re-encoded
+MP4_AUDIO_CODECS = ("aac", "mp3", "alac", "ac3", "eac3")
+
+def probe(path):
+    """fps, width, height and frame count of the first video stream, read with ffprobe"""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height,avg_frame_rate,r_frame_rate,nb_frames,duration", "-of", "json", path],
+        capture_output=True, text=True, check=True)
+    stream = json.loads(result.stdout)["streams"][0]
+    fps = 0.0
+    for rate in (stream.get("avg_frame_rate"), stream.get("r_frame_rate")):
+        numerator, _, denominator = (rate or "0/0").partition("/")
+        if float(denominator or 0) and float(numerator):
+            fps = float(numerator) / float(denominator)
+            break
+    fps = fps or 30.0
+    # nb_frames is not set for every container, the duration gives an estimate
+    frame_count = stream.get("nb_frames")
+    if not frame_count or frame_count == "N/A":
+        duration = stream.get("duration")
+        frame_count = round(float(duration) * fps) if duration and duration != "N/A" else 0
+    return fps, int(stream["width"]), int(stream["height"]), int(frame_count)
+
+def audio_codec(path):
+    """Codec name of the first audio stream, None when there is no audio stream or ffprobe fails"""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name", "-of", "csv=p=0", path],
+            capture_output=True, text=True)
+    except OSError:
+        # ffprobe is not installed
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+def audio_args(path):
+    """ffmpeg audio encoder arguments to mux the audio of path into an mp4, a copy when mp4 accepts the codec"""
+    if audio_codec(path) in MP4_AUDIO_CODECS:
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", AUDIO_BITRATE]
+
+class Cv2Reader:
+    def __init__(self, path, start_frame=0):
+        self.vidcap = cv2.VideoCapture(path)
+        self.fps = self.vidcap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if start_frame:
+            self.vidcap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    def read(self):
+        """Next BGR frame, None at the end of the video"""
+        success, image = self.vidcap.read()
+        return image if success else None
+
+    def close(self):
+        self.vidcap.release()
+
+class Cv2Writer:
+    def __init__(self, path, fps, size, audio_source=None, audio_start=0, audio_duration=None):
+        if audio_source:
+            logging.info("The cv2 codec backend can not copy the audio track, the output has no audio")
+        self.out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*VIDEO_CV2_FOURCC), fps, size)
+
+    def write(self, frame):
+        self.out.write(frame)
+
+    def close(self):
+        self.out.release()
+
+class FfmpegReader:
+    """Decodes with an ffmpeg subprocess that writes raw BGR frames to a pipe"""
+    def __init__(self, path, start_frame=0, threads=None):
+        self.fps, self.width, self.height, self.frame_count = probe(path)
+        self.frame_size = self.width * self.height * 3
+        command = ["ffmpeg", "-v", "error", "-nostdin"]
+        if start_frame:
+            # seeking on the input is frame accurate when decoding; the middle of the previous frame keeps a
+            # rounded frame rate (30000/1001) from landing after the timestamp of start_frame
+            command += ["-ss", f"{(start_frame - 0.5) / self.fps:.6f}"]
+        command += ["-threads", str(VIDEO_THREADS if threads is None else threads), "-i", path,
+                    "-map", "0:v:0", "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=self.frame_size)
+
+    def read(self):
+        buffer = bytearray(self.frame_size)
+        view = memoryview(buffer)
+        offset = 0
+        while offset < self.frame_size:
+            count = self.process.stdout.readinto(view[offset:])
+            if not count:
+                return None
+            offset += count
+        return np.frombuffer(buffer, np.uint8).reshape(self.height, self.width, 3)
+
+    def close(self):
+        self.process.stdout.close()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+class FfmpegWriter:
+    """Encodes raw BGR frames written to the stdin of an ffmpeg subprocess.
+    When audio_source is set the audio of that file (from audio_start, for audio_duration seconds) is copied
+    into the output, re-encoded to AAC when its codec can not go in an mp4."""
+    def __init__(self, path, fps, size, audio_source=None, audio_start=0, audio_duration=None,
+                 codec=None, crf=None, preset=None, threads=None):
+        width, height = size
+        command = ["ffmpeg", "-y", "-v", "error", "-nostdin",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}", "-i", "-"]
+        if audio_source:
+            if audio_start:
+                command += ["-ss", f"{audio_start:.6f}"]
+            if audio_duration:
+                command += ["-t", f"{audio_duration:.6f}"]
+            command += ["-i", audio_source, "-map", "0:v:0", "-map", "1:a?"] + audio_args(audio_source)
+        command += ["-c:v", codec or VIDEO_CODEC, "-preset", preset or VIDEO_PRESET, "-crf", str(VIDEO_CRF if crf is None else crf),
+                    "-threads", str(VIDEO_THREADS if threads is None else threads),
+                    # yuv420p needs even dimensions, a downscaled frame can have odd ones
+                    "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", "-movflags", "+faststart", path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}")
+
+class Cv2Backend:
+    name = "cv2"
+    reader = Cv2Reader
+    writer = Cv2Writer
+
+class FfmpegPipeBackend:
+    name = "ffmpeg"
+    reader = FfmpegReader
+    writer = FfmpegWriter
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+def get_backend(name=None):
+    name = name or VIDEO_CODEC_BACKEND
+    if name == "auto":
+        name = "ffmpeg" if ffmpeg_available() else "cv2"
+    if name == "ffmpeg":
+        return FfmpegPipeBackend
+    if name == "cv2":
+        return Cv2Backend
+    raise ValueError(f"Unknown video codec backend: {name}")
@@ -1,20 +1,65 @@
 import cv2
 import os
-import boto3
 import json
 import logging
 import base64
 import io
 import concurrent.futures
 import functools
+import collections
+import shutil
+import subprocess
+import numpy as np
 from PIL import Image
+from awsclients import get_client, MAX_ATTEMPTS
+from progress import ProgressReporter, ENCODED_COUNTERS, UPSCALED_COUNTERS
+from dedup import FrameDeduplicator, DEDUP_THRESHOLD
+from videocodec import get_backend, audio_args
+from concurrency import AdaptiveLimiter, ADAPTIVE_CONCURRENCY, is_payload_too_large
 logging.basicConfig(level=logging.INFO)
 
+# lossless frame encoding sent to the endpoint by the streaming pipeline
+STREAM_FRAME_FORMAT = os.getenv('STREAM_FRAME_FORMAT', '.png')
+# scale of the model, used to resize the original frame when the endpoint fails on a frame
+UPSCALE_SCALE = int(os.getenv('UPSCALE_SCALE', 4))
+# entries of the concurrency history kept in the job record per job or chunk
+CONCURRENCY_HISTORY_MAX = int(os.getenv('CONCURRENCY_HISTORY_MAX', 100))
+# frames packed in one endpoint call ({"images": [...]}), only the esrgan and swinir plugins accept more than 1
+FRAMES_PER_REQUEST = int(os.getenv('FRAMES_PER_REQUEST', 1))
+# payload limit of one endpoint call (6 MB for SageMaker real-time, request and response), with headroom for the JSON
+MAX_PAYLOAD_BYTES = int(os.getenv('MAX_PAYLOAD_BYTES', 6000000))
+# model variant asked of the endpoint ("model" of the request, e.g. compact for the esrgan plugin), empty for the endpoint default
+UPSCALE_MODEL = os.getenv('UPSCALE_MODEL', '')
+# chunk jobs read their frames from a presigned URL of the S3 video (ranged reads from the seek point) instead of
+# downloading the whole video on every listener, false downloads it
+CHUNK_PRESIGNED_SOURCE = os.getenv('CHUNK_PRESIGNED_SOURCE', 'true').lower() == 'true'
+# lifetime in seconds of the presigned URL, it has to outlast the decoding of a chunk
+PRESIGNED_URL_EXPIRES = int(os.getenv('PRESIGNED_URL_EXPIRES', 21600))
+
+def payload_batches(image_strings, limit=MAX_PAYLOAD_BYTES, scale=UPSCALE_SCALE):
+    """(start, end) ranges of the base64 frames of one call, split so that each request, and its response estimated
+    at scale squared times the request, stays within the payload limit. A frame over the limit goes alone."""
+    ranges = []
+    start = 0
+    size = 0
+    for index, image_string in enumerate(image_strings):
+        cost = len(image_string) * scale ** 2
+        if index > start and size + cost > limit:
+            ranges.append((start, index))
+            start = index
+            size = 0
+        size += cost
+    if start < len(image_strings):
+        ranges.append((start, len(image_strings)))
+    return ranges
+
 class VideoUpscaler:
     def __init__(self, ddb_table):
-        self.s3client = boto3.client('s3')
-        self.ddbclient = boto3.client('dynamodb')
+        self.s3client = get_client('s3')
+        self.ddbclient = get_client('dynamodb')
         self.ddb_table = ddb_table
+        self.codec = get_backend()
+        logging.info(f"Using the {self.codec.name} video codec backend")
 
     @staticmethod
     def parse_response(query_response):
@@ -65,10 +110,10 @@ class VideoUpscaler:
         return new_width, new_height
 
     @staticmethod
-    def query_endpoint_with_json_payload(payload, contentType, accept, endpoint):
+    def query_endpoint_with_json_payload(payload, contentType, accept, endpoint, max_attempts=MAX_ATTEMPTS):
         logging.info("Starting the Sagemaker Query")
         encoded_payload = json.dumps(payload).encode('utf-8')
-        sageMakerClient = boto3.client('runtime.sagemaker')
+        sageMakerClient = get_client('runtime.sagemaker', max_attempts=max_attempts)
         response = sageMakerClient.invoke_endpoint(
             EndpointName= endpoint,
             ContentType= contentType,
@@ -97,6 +142,23 @@ class VideoUpscaler:
         )
         pass
 
+    def getDDBField(self, id, field):
+        # string value of a field of the job, None when it is not set
+        response = self.ddbclient.get_item(
+            TableName=self.ddb_table,
+            Key={
+                "id": {
+                    "S": str(id)
+                }
+            },
+            ProjectionExpression="#st",
+            ExpressionAttributeNames={
+                "#st": field
+            },
+            ConsistentRead=True,
+        )
+        return response.get('Item', {}).get(field, {}).get('S')
+
     def breakDownFrames(self,id,video,downscale,config):
         logging.info(f"Breaking down frames from video {video} for video id: {id}")
         try:
@@ -109,14 +171,15 @@ class VideoUpscaler:
             filename = key.split("/")[-1]
             video = f"/tmp/{id}/{filename}"
             self.s3client.download_file(bucket, key, video)
-        vidcap = cv2.VideoCapture(video)
-        fps = vidcap.get(cv2.CAP_PROP_FPS)
-        success,image = vidcap.read()
+        reader = self.codec.reader(video)
+        fps = reader.fps
+        progress = ProgressReporter(self.ddbclient, self.ddb_table, id)
+        progress.start(reader.frame_count)
+        image = reader.read()
         count = 0
         new_width = None
         new_height = None
-        while success:
-            success, image = vidcap.read() 
+        while image is not None:
             try:
                 if downscale:
                     if not new_width or not new_height:
@@ -125,36 +188,43 @@ class VideoUpscaler:
                     cv2.imwrite(f"/tmp/{id}/oldframes/%04d.jpg" % count, resize) 
                 else:
                     cv2.imwrite(f"/tmp/{id}/oldframes/%04d.jpg" % count, image) 
-                if cv2.waitKey(10) == 27: 
-                    break
                 count += 1
-            except AttributeError:
-                pass
+                progress.decoded()
             except Exception as e:
                 print(e)
+            image = reader.read()
+        reader.close()
+        progress.flush()
         return fps
 
-    def createVideoFromFrames(self,id,source,output,fps):
+    def createVideoFromFrames(self,id,source,output,fps,audio_source=None,fallback_source=None,report_rate=True):
+        # frames missing from source (the endpoint failed on them) are taken from fallback_source and resized
+        # report_rate=False after upscaleFrames, which already reported fps, eta and progress of the job
         logging.info(f"Creating video ({fps} fps) from frames in {source} to {output} for video id: {id}")
+        images = [img for img in os.listdir(f"{fallback_source or source}/") if img.endswith(".jpg")]
+        images.sort()
         try:
-            img = Image.open(f"{source}/0000.jpg")
+            first = next(filename for filename in images if os.path.exists(f"{source}/{filename}"))
+            img = Image.open(f"{source}/{first}")
             width = img.width 
             height = img.height 
         except:
             logging.info("No frames found.")
             return
-        cap = cv2.VideoCapture(0)
-        fourcc = cv2.VideoWriter_fourcc(*'avc1')
-        out = cv2.VideoWriter(f"{output}",fourcc, fps, (width,height))
-        images = [img for img in os.listdir(f"{source}/") if img.endswith(".jpg")]
-        images.sort()
+        out = self.codec.writer(f"{output}", fps, (width,height), audio_source=audio_source)
+        progress = ProgressReporter(self.ddbclient, self.ddb_table, id, rate_counters=ENCODED_COUNTERS if report_rate else ())
 
         img_array = []
         for filename in images:
-            img = cv2.imread(os.path.join(f"{source}/", filename))
+            if os.path.exists(os.path.join(f"{source}/", filename)):
+                img = cv2.imread(os.path.join(f"{source}/", filename))
+            else:
+                img = cv2.resize(cv2.imread(os.path.join(f"{fallback_source}/", filename)), (width, height), interpolation=cv2.INTER_CUBIC)
             # img_array.append(img)
             out.write(img)
-        out.release()
+            progress.encoded()
+        out.close()
+        progress.flush()
 
     def upscale_image(self,base64_string,endpoint):
         requestType = 'application/json;jpeg'
@@ -179,12 +249,43 @@ class VideoUpscaler:
             logging.info(str(e))
             return None
     
-    def upscale_image_file(self,id,endpoint,filename):
-        image_data = open(os.path.join(f"/tmp/{id}/oldframes/", filename), "rb")
-        image_string = base64.b64encode(image_data.read()).decode('utf-8')
+    def upscaleImageObject(self,id,image,endpoint):
+        # single image job, reads the image from S3, upscales it and writes the result next to it
+        logging.info(f"Upscaling image {image} for job id: {id}")
+        bucket, key = image.split('/',2)[-1].split('/',1)
+        keyNoExt = os.path.splitext(key)[0]
+        image_data = self.s3client.get_object(Bucket=bucket, Key=key)['Body'].read()
+        image_string = base64.b64encode(image_data).decode('utf-8')
         upscaled_image_string = self.upscale_image(image_string,endpoint)
-        with open(f"/tmp/{id}/newframes/{filename}", "wb") as fh:
-            fh.write(base64.decodebytes(upscaled_image_string.encode('utf-8')))
+        if upscaled_image_string is None:
+            raise RuntimeError(f"Endpoint {endpoint} failed to upscale {image}")
+        output_key = f"{keyNoExt}-upscaled.jpg"
+        self.s3client.put_object(Body=base64.b64decode(upscaled_image_string), Bucket=bucket, Key=output_key, ContentType="image/jpeg")
+        return f"s3://{bucket}/{output_key}"
+
+    def upscale_image_files(self,id,endpoint,progress,limiter,filenames,model=None):
+        # the frames of filenames are sent in one endpoint call
+        image_strings = []
+        for filename in filenames:
+            with open(os.path.join(f"/tmp/{id}/oldframes/", filename), "rb") as image_data:
+                image_strings.append(base64.b64encode(image_data.read()).decode('utf-8'))
+        try:
+            upscaled_image_strings = self.query_upscale_limited(image_strings, endpoint, limiter, model)
+        except Exception as e:
+            # createVideoFromFrames fills the missing frames in from the original frames
+            logging.info(f"Failed to upscale frames {', '.join(filenames)}: {e}")
+            progress.failed(len(filenames))
+            return
+        progress.gauge("concurrency", limiter.limit)
+        for filename, upscaled_image_string in zip(filenames, upscaled_image_strings):
+            if not upscaled_image_string:
+                # the endpoint failed on this frame of the batch only
+                logging.info(f"Failed to upscale frame {filename}")
+                progress.failed()
+                continue
+            progress.upscaled()
+            with open(f"/tmp/{id}/newframes/{filename}", "wb") as fh:
+                fh.write(base64.decodebytes(upscaled_image_string.encode('utf-8')))
 
     def upscaleFrames(self,id,config):
         logging.info(f"Upscaling frames for video id: {id}")
@@ -196,5 +297,457 @@ class VideoUpscaler:
         images = [img for img in os.listdir(f"/tmp/{id}/oldframes/") if img.endswith(".jpg")]
         images.sort()
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=config['max_workers']) as executor:
-            executor.map(functools.partial(self.upscale_image_file, id, config['endpoint']), images)
\ No newline at end of file
+        # fps, eta and progress follow the upscaled frames, updated as the batches complete
+        progress = ProgressReporter(self.ddbclient, self.ddb_table, id, rate_counters=UPSCALED_COUNTERS)
+        # pre-pass: frames close to the last upscaled frame are copied from its output instead of sent to the endpoint
+        dedup = FrameDeduplicator(config.get('dedup_threshold', DEDUP_THRESHOLD))
+        duplicates = []
+        if dedup.enabled:
+            unique = []
+            for filename in images:
+                if dedup.is_duplicate(cv2.imread(os.path.join(f"/tmp/{id}/oldframes/", filename))):
+                    duplicates.append((filename, unique[-1]))
+                else:
+                    unique.append(filename)
+            images = unique
+            # the duplicates are done as far as the endpoint is concerned
+            progress.saved(len(duplicates))
+        frames_per_request = max(1, int(config.get('frames_per_request') or FRAMES_PER_REQUEST))
+        batches = [images[start:start + frames_per_request] for start in range(0, len(images), frames_per_request)]
+        limiter = AdaptiveLimiter(config['max_workers'], adaptive=config.get('adaptive', ADAPTIVE_CONCURRENCY))
+        # the pool is sized for the largest limit, the limiter decides how many calls run at once
+        with concurrent.futures.ThreadPoolExecutor(max_workers=limiter.maximum) as executor:
+            list(executor.map(functools.partial(self.upscale_image_files, id, config['endpoint'], progress, limiter, model=config.get('model')), batches))
+        self.recordConcurrency(id, limiter)
+        for filename, reference in duplicates:
+            if os.path.exists(f"/tmp/{id}/newframes/{reference}"):
+                shutil.copyfile(f"/tmp/{id}/newframes/{reference}", f"/tmp/{id}/newframes/{filename}")
+        progress.flush()
+
+    def upscale_frames(self,frames,endpoint,limiter,model=None):
+        # in memory counterpart of upscale_image_files, returns the decoded upscaled frames, None for a frame that failed
+        image_strings = []
+        for frame in frames:
+            success, encoded = cv2.imencode(STREAM_FRAME_FORMAT, frame)
+            if not success:
+                return [None] * len(frames)
+            image_strings.append(base64.b64encode(encoded.tobytes()).decode('utf-8'))
+        try:
+            upscaled_image_strings = self.query_upscale_limited(image_strings, endpoint, limiter, model)
+        except Exception as e:
+            logging.info("Failed to upscale with: ")
+            logging.info(str(e))
+            return [None] * len(frames)
+        return [cv2.imdecode(np.frombuffer(base64.b64decode(upscaled_image_string), np.uint8), cv2.IMREAD_COLOR)
+                if upscaled_image_string else None for upscaled_image_string in upscaled_image_strings]
+
+    def query_upscale_limited(self,image_strings,endpoint,limiter,model=None):
+        # the frames of one batch in as many endpoint calls as the payload limit needs, "" for the frames of a failed call
+        upscaled_image_strings = []
+        for start, end in payload_batches(image_strings):
+            try:
+                upscaled_image_strings += self.query_upscale_split(image_strings[start:end], endpoint, limiter, model)
+            except Exception as e:
+                logging.info(f"Failed to upscale {end - start} frames: {e}")
+                upscaled_image_strings += [""] * (end - start)
+        return upscaled_image_strings
+
+    def query_upscale_split(self,image_strings,endpoint,limiter,model=None):
+        # one call under the limiter, split in halves when the endpoint rejects its payload size
+        try:
+            return limiter.call(self.query_upscale_batch, image_strings, endpoint, model)
+        except Exception as e:
+            if len(image_strings) == 1 or not is_payload_too_large(e):
+                raise
+            logging.info(f"Payload of {len(image_strings)} frames too large, splitting the call: {e}")
+        half = len(image_strings) // 2
+        return (self.query_upscale_split(image_strings[:half], endpoint, limiter, model)
+                + self.query_upscale_split(image_strings[half:], endpoint, limiter, model))
+
+    def upscale_frame(self,frame,endpoint,limiter,model=None):
+        return self.upscale_frames([frame], endpoint, limiter, model)[0]
+
+    def query_upscale(self,image_string,endpoint,model=None):
+        # same request as upscale_image but raises on failure and keeps the endpoint output as is instead of re-encoding it as JPEG
+        requestType = 'application/json;jpeg'
+        payload = {
+            "image": image_string,
+            "prompt": "",
+            "num_inference_steps":50,
+            "guidance_scale":7.5
+        }
+        if model:
+            payload["model"] = model
+        # called under the AdaptiveLimiter, which retries the overload errors itself
+        response = self.query_endpoint_with_json_payload( payload, requestType, requestType, endpoint, max_attempts=0)
+        encoded_images, prompt = self.parse_response(response)
+        return encoded_images[0]
+
+    def query_upscale_batch(self,image_strings,endpoint,model=None):
+        # several frames in one request, the plugins return generated_images in the order of images and "" for a frame that failed
+        if len(image_strings) == 1:
+            # a single frame keeps the "image" request every endpoint accepts
+            return [self.query_upscale(image_strings[0], endpoint, model)]
+        requestType = 'application/json;jpeg'
+        payload = {
+            "images": image_strings,
+            "prompt": "",
+            "num_inference_steps":50,
+            "guidance_scale":7.5
+        }
+        if model:
+            payload["model"] = model
+        response = self.query_endpoint_with_json_payload( payload, requestType, requestType, endpoint, max_attempts=0)
+        encoded_images, prompt = self.parse_response(response)
+        if len(encoded_images) != len(image_strings):
+            raise RuntimeError(f"Endpoint {endpoint} returned {len(encoded_images)} images for {len(image_strings)} frames, does it accept batched requests?")
+        return encoded_images
+
+    def recordConcurrency(self,id,limiter,chunk=None):
+        """Append the limit changes of the limiter to the concurrency_history list of the job record"""
+        history = limiter.history
+        if len(history) > CONCURRENCY_HISTORY_MAX:
+            history = history[:1] + history[-(CONCURRENCY_HISTORY_MAX - 1):]
+        entries = []
+        for timestamp, limit in history:
+            entry = {"t": {"N": f"{timestamp:.1f}"}, "limit": {"N": str(limit)}}
+            if chunk is not None:
+                entry["chunk"] = {"N": str(chunk)}
+            entries.append({"M": entry})
+        try:
+            self.ddbclient.update_item(
+                TableName=self.ddb_table,
+                Key={
+                    "id": {
+                        "S": str(id)
+                    }
+                },
+                UpdateExpression="set concurrency_history = list_append(if_not_exists(concurrency_history, :empty), :entries)",
+                ExpressionAttributeValues={
+                    ":empty": {
+                        "L": []
+                    },
+                    ":entries": {
+                        "L": entries
+                    }
+                },
+            )
+        except Exception as e:
+            logging.info(f"Unable to record the concurrency of video id: {id}: {e}")
+
+    def processVideoStream(self,id,video,output,downscale,config):
+        """Decode, upscale (or downscale) and encode the video in one pass.
+        Frames never touch the disk: the decoded frames are submitted to a pool of upscale workers and
+        the results are written to the VideoWriter in order. At most queue_size frames are in flight,
+        so memory stays constant whatever the length of the video."""
+        logging.info(f"Streaming video {video} to {output} for video id: {id}")
+        chunked = config.get('chunk') is not None
+        if chunked and CHUNK_PRESIGNED_SOURCE and "s3://" in video:
+            # the reader seeks to the chunk with ranged reads instead of a download of the whole video
+            video = self.presignedVideoUrl(video)
+        else:
+            video = self.downloadVideo(id, video)
+        # chunk jobs only process the frames in [start_frame, end_frame), the last chunk reads to the end (end_frame None)
+        start_frame = config.get('start_frame') or 0
+        end_frame = config.get('end_frame')
+        reader = self.codec.reader(video, start_frame)
+        fps = reader.fps
+        progress = ProgressReporter(self.ddbclient, self.ddb_table, id)
+        if not chunked:
+            # the totals of a chunked job are set once by the planner
+            progress.start(reader.frame_count)
+        # chunks are stitched without audio, the stitch adds the audio of the whole video
+        audio_source = None if chunked else video
+        limiter = AdaptiveLimiter(config['max_workers'], adaptive=config.get('adaptive', ADAPTIVE_CONCURRENCY))
+        dedup = FrameDeduplicator(config.get('dedup_threshold', DEDUP_THRESHOLD))
+        frames_per_request = max(1, int(config.get('frames_per_request') or FRAMES_PER_REQUEST))
+        # frames of the next endpoint call, and the decoded frames waiting for it in order: an index in batch,
+        # or the (future, index) of an earlier call for a duplicate frame
+        batch = []
+        pending = []
+        reference = None
+        out = None
+        out_size = None
+        new_width = None
+        new_height = None
+        count = 0
+        dropped = 0
+        # (future, index) of every frame in order, the future returns the (upscaled, original) pairs of its call
+        in_flight = collections.deque()
+
+        def write(frame, original=None):
+            nonlocal out, out_size, dropped
+            if frame is None:
+                # the endpoint failed on this frame even after the retries, the original frame is resized instead
+                dropped += 1
+                progress.failed()
+                size = out_size or (original.shape[1] * UPSCALE_SCALE, original.shape[0] * UPSCALE_SCALE)
+                frame = cv2.resize(original, size, interpolation=cv2.INTER_CUBIC)
+            if out is None:
+                # the output size is only known once the first frame came back from the endpoint
+                height, width = frame.shape[:2]
+                out_size = (width, height)
+                out = self.codec.writer(output, fps, out_size, audio_source=audio_source)
+            elif frame.shape[1] != out_size[0] or frame.shape[0] != out_size[1]:
+                frame = cv2.resize(frame, out_size, interpolation=cv2.INTER_CUBIC)
+            out.write(frame)
+            progress.encoded()
+
+        def upscale(images):
+            upscaled = self.upscale_frames(images, config['endpoint'], limiter, config.get('model'))
+            progress.upscaled(sum(frame is not None for frame in upscaled))
+            progress.gauge("concurrency", limiter.limit)
+            return list(zip(upscaled, images))
+
+        def submit():
+            nonlocal batch, pending, reference
+            future = executor.submit(upscale, batch) if batch else None
+            for entry in pending:
+                in_flight.append((future, entry) if isinstance(entry, int) else entry)
+            if isinstance(reference, int):
+                reference = (future, reference)
+            batch = []
+            pending = []
+
+        def write_next():
+            future, index = in_flight.popleft()
+            write(*future.result()[index])
+
+        # the pool is sized for the largest limit, the limiter decides how many calls run at once
+        with concurrent.futures.ThreadPoolExecutor(max_workers=limiter.maximum) as executor:
+            try:
+                while end_frame is None or start_frame + count < end_frame:
+                    image = reader.read()
+                    if image is None:
+                        break
+                    count += 1
+                    progress.decoded()
+                    if downscale:
+                        if not new_width or not new_height:
+                            new_width, new_height = self.getNewDim(image,config)
+                        write(cv2.resize(image, (new_width, new_height)))
+                        continue
+                    if dedup.is_duplicate(image):
+                        # same scene as the last upscaled frame, its output is written once more
+                        pending.append(reference)
+                        progress.saved()
+                    else:
+                        reference = len(batch)
+                        batch.append(image)
+                        pending.append(reference)
+                    # a full batch is sent, duplicates of frames already sent go straight to the queue
+                    if len(batch) >= frames_per_request or not batch:
+                        submit()
+                    # bounded queue: wait for the oldest frame before decoding more, this also keeps the order
+                    if len(in_flight) >= (config.get('queue_size') or 2 * limiter.limit * frames_per_request):
+                        write_next()
+                submit()
+                while in_flight:
+                    write_next()
+            finally:
+                for future, _ in in_flight:
+                    future.cancel()
+                reader.close()
+                if out is not None:
+                    out.close()
+                progress.flush()
+        if not downscale:
+            self.recordConcurrency(id, limiter, config.get('chunk'))
+        if dropped:
+            logging.info(f"{dropped} of {count} frames failed to upscale and were resized instead for video id: {id}")
+        if dedup.saved:
+            logging.info(f"{dedup.saved} of {count} frames reused the previous upscale for video id: {id}")
+        logging.info(f"Streamed {count} frames ({fps} fps) for video id: {id}")
+        return fps
+
+    def downloadVideo(self,id,video):
+        # returns the local path of the video, downloading it to /tmp/{id} when it is in S3
+        try:
+            os.makedirs(f"/tmp/{id}")
+        except:
+            pass
+        if "s3://" in video:
+            bucket, key = video.split('/',2)[-1].split('/',1)
+            filename = key.split("/")[-1]
+            local_video = f"/tmp/{id}/{filename}"
+            if not os.path.exists(local_video):
+                self.s3client.download_file(bucket, key, local_video)
+            return local_video
+        return video
+
+    def presignedVideoUrl(self,video):
+        bucket, key = video.split('/',2)[-1].split('/',1)
+        return self.s3client.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key},
+                                                    ExpiresIn=PRESIGNED_URL_EXPIRES)
+
+    @staticmethod
+    def probeKeyframes(video):
+        """Frame indices of the keyframes, None when ffprobe is not available.
+        Read from the packet flags of the container, the video is not decoded."""
+        if shutil.which("ffprobe") is None:
+            return None
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags",
+             "-of", "csv=p=0", video],
+            capture_output=True, text=True, check=True)
+        packets = [line.strip().split(",") for line in result.stdout.splitlines() if line.strip()]
+        # packets come in decode order, the frame indices are in presentation order (B-frames)
+        if all(packet[0] not in ("", "N/A") for packet in packets):
+            packets.sort(key=lambda packet: float(packet[0]))
+        return [index for index, packet in enumerate(packets) if len(packet) > 1 and "K" in packet[1]]
+
+    @staticmethod
+    def planChunks(frame_count, fps, chunk_seconds, keyframes=None):
+        """Split [0, frame_count) into (start_frame, end_frame) ranges of about chunk_seconds.
+        When the keyframes are known every chunk starts on the first keyframe at or after its target,
+        so the decoder of a chunk never has to seek back into the previous chunk.
+        frame_count is only an estimate of the container, so the last chunk has no end_frame (None) and
+        reads to the end of the video."""
+        chunk_frames = max(1, int(round(chunk_seconds * fps)))
+        starts = []
+        for target in range(0, frame_count, chunk_frames):
+            start = target
+            if keyframes:
+                start = next((k for k in keyframes if k >= target), frame_count)
+            if start < frame_count and (not starts or start > starts[-1]):
+                starts.append(start)
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)
+        return [(start, end) for start, end in zip(starts, starts[1:] + [None])]
+
+    def splitVideo(self,id,video,chunk_seconds):
+        """Plan the chunks of a video, returns the list of (start_frame, end_frame) and the estimated frame count.
+        Raises ValueError when the video has no frames."""
+        local_video = self.downloadVideo(id, video)
+        vidcap = cv2.VideoCapture(local_video)
+        fps = vidcap.get(cv2.CAP_PROP_FPS) or 30
+        frame_count = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+        vidcap.release()
+        if frame_count <= 0:
+            raise ValueError(f"Unable to read the frames of {video}, it is not a video or its format is not supported")
+        try:
+            keyframes = self.probeKeyframes(local_video)
+        except Exception as e:
+            logging.info(f"Unable to read the keyframes of {video}: {e}")
+            keyframes = None
+        chunks = self.planChunks(frame_count, fps, chunk_seconds, keyframes)
+        logging.info(f"Split video id: {id} ({frame_count} frames) into {len(chunks)} chunks, keyframe aligned: {keyframes is not None}")
+        return chunks, frame_count
+
+    def initChunks(self,id,chunks_total,frames_total):
+        ProgressReporter(self.ddbclient, self.ddb_table, id).start(frames_total)
+        self.ddbclient.update_item(
+            TableName=self.ddb_table,
+            Key={
+                "id": {
+                    "S": str(id)
+                }
+            },
+            UpdateExpression="set #chunks = :chunks, chunks_total = :total, chunks_done = :zero",
+            ExpressionAttributeValues={
+                ":chunks": {
+                    "M": {str(chunk): {"S": "Submitted"} for chunk in range(chunks_total)}
+                },
+                ":total": {
+                    "N": str(chunks_total)
+                },
+                ":zero": {
+                    "N": "0"
+                }
+            },
+            ExpressionAttributeNames={
+                "#chunks": "chunks"
+            },
+        )
+
+    def setChunkStatus(self,id,chunk,value):
+        self.ddbclient.update_item(
+            TableName=self.ddb_table,
+            Key={
+                "id": {
+                    "S": str(id)
+                }
+            },
+            UpdateExpression="set #chunks.#chunk = :s",
+            ExpressionAttributeValues={
+                ":s": {
+                    "S": str(value),
+                }
+            },
+            ExpressionAttributeNames={
+                "#chunks": "chunks",
+                "#chunk": str(chunk)
+            },
+        )
+
+    def completeChunk(self,id,chunk):
+        """Mark a chunk Completed and count it, returns True when it was the last one.
+        The chunk is also added to the chunks_completed set, the condition on that set makes a
+        redelivered SQS message count its chunk only once."""
+        try:
+            response = self.ddbclient.update_item(
+                TableName=self.ddb_table,
+                Key={
+                    "id": {
+                        "S": str(id)
+                    }
+                },
+                UpdateExpression="set #chunks.#chunk = :done add chunks_done :one, chunks_completed :chunkset",
+                ConditionExpression="attribute_not_exists(chunks_completed) or not contains(chunks_completed, :chunk)",
+                ExpressionAttributeValues={
+                    ":done": {
+                        "S": "Completed"
+                    },
+                    ":one": {
+                        "N": "1"
+                    },
+                    ":chunk": {
+                        "S": str(chunk)
+                    },
+                    ":chunkset": {
+                        "SS": [str(chunk)]
+                    }
+                },
+                ExpressionAttributeNames={
+                    "#chunks": "chunks",
+                    "#chunk": str(chunk)
+                },
+                ReturnValues="ALL_NEW",
+            )
+        except self.ddbclient.exceptions.ConditionalCheckFailedException:
+            logging.info(f"Chunk {chunk} of video id: {id} was already completed")
+            self.setChunkStatus(id, chunk, "Completed")
+            return False
+        attributes = response['Attributes']
+        return int(attributes['chunks_done']['N']) == int(attributes['chunks_total']['N'])
+
+    def stitchVideos(self,files,output,audio_source=None):
+        """Concatenate the chunk videos in order.
+        With ffmpeg the video streams are copied without re-encoding and the audio of audio_source is added,
+        re-encoded to AAC when an mp4 can not hold its codec, otherwise the frames are re-encoded with the codec backend."""
+        if shutil.which("ffmpeg") is not None:
+            list_file = f"{output}.txt"
+            with open(list_file, "w") as fh:
+                for file in files:
+                    fh.write(f"file '{os.path.abspath(file)}'\n")
+            command = ["ffmpeg", "-y", "-v", "error", "-nostdin", "-f", "concat", "-safe", "0", "-i", list_file]
+            if audio_source:
+                command += ["-i", audio_source, "-map", "0:v:0", "-map", "1:a?", "-c:v", "copy"] + audio_args(audio_source)
+            else:
+                command += ["-c", "copy"]
+            subprocess.run(command + [output], check=True)
+            os.remove(list_file)
+            return
+        out = None
+        for file in files:
+            reader = self.codec.reader(file)
+            image = reader.read()
+            while image is not None:
+                if out is None:
+                    height, width = image.shape[:2]
+                    out = self.codec.writer(output, reader.fps, (width, height), audio_source=audio_source)
+                out.write(image)
+                image = reader.read()
+            reader.close()
+        if out is not None:
+            out.close()